@@ -1,5 +1,7 @@
 import os
+import hmac
 import json
+import itertools
 import telebot
 import traceback
 import sys
@@ -9,7 +11,22 @@ from dotenv import load_dotenv
 # Import our shared utility functions
 # Use relative imports for Vercel compatibility
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from src.utils import get_required_env, extract_instagram_links, send_to_coda
+from src.utils import get_required_env
+from src.links import extract_message_links
+from src import transport
+from src.batching import CodaBatchWriter
+from src.outbox import LinkOutbox, OutboxDrainer, STATUS_DONE, STATUS_FAILED
+from src.dedup import UpdateDeduplicator, update_key
+from src.shortcode_index import ShortcodeIndex
+from src.row_index import RowIndex
+from src.intake import LinkIntake, LINK_ACCEPTED
+from src.admission import AdmissionController
+from src.sender import TelegramSender, TELEGRAM_SEND_TIMEOUT
+from src import brightdata
+from src.brightdata import BRIGHT_DATA_WEBHOOK_SECRET, SNAPSHOT_READY
+from src.metrics import MetricsUpdater
+from src.monitoring import monitor
+from src.scrape_cache import ScrapeCache
 
 # Load environment variables
 load_dotenv()
@@ -38,11 +55,95 @@ except ValueError as e:
     if __name__ != "__main__":  # Only exit if not in local development
         sys.exit(1)
 
+# Every Vercel instance has its own /tmp outbox, which goes away with the
+# instance, and nothing drains it on a schedule
+ON_VERCEL = bool(os.getenv("VERCEL"))
+
+# Coda configuration, a batch writer that turns all links of an update into a
+# single multi-row insert, and a durable outbox so failed writes are retried
+CODA_CONFIG = {
+    "api_key": CODA_API_KEY,
+    "doc_id": DOC_ID,
+    "table_id": TABLE_ID,
+    "column_name": "Link"  # Use column name for stability
+}
+coda_writer = CodaBatchWriter(CODA_CONFIG)
+outbox = LinkOutbox()
+
+# Shortcode -> Coda row id, filled from the ids our inserts return
+row_index = RowIndex()
+
+# Remembers handled update_ids so Telegram redeliveries are dropped
+processed_updates = UpdateDeduplicator()
+
+# Shortcodes of every saved reel, so known links never reach Coda again
+shortcode_index = ShortcodeIndex()
+link_intake = LinkIntake(outbox, shortcode_index)
+
+# Above the high water mark, links are only recorded and the in-request drain
+# is skipped; the next admitted webhook or /api/flush saves them
+admission = AdmissionController(outbox.pending_count)
+if ON_VERCEL:
+    # Deferred links would sit in this instance's /tmp outbox with nothing
+    # calling /api/flush, so the promised confirmation would never come
+    print("Admission control is not supported on Vercel, writing links before replying")
+    admission = None
+
+# Upper bound on time spent pushing the outbox to Coda per webhook call
+WEBHOOK_DRAIN_SECONDS = float(os.getenv("WEBHOOK_DRAIN_SECONDS", "5"))
+
+# Fast-ack mode: the webhook only records links and returns 200 right away;
+# Coda writes and user replies happen in /api/flush (called by a cron)
+WEBHOOK_FAST_ACK = os.getenv("WEBHOOK_FAST_ACK", "false").lower() in ("1", "true", "yes")
+if WEBHOOK_FAST_ACK and ON_VERCEL:
+    # Each Vercel instance has its own /tmp outbox, and /api/flush may run on
+    # another instance, so fast-acked links could be stranded or lost
+    print("WEBHOOK_FAST_ACK is not supported on Vercel, writing links before acknowledging")
+    WEBHOOK_FAST_ACK = False
+
+# Time slice for one /api/flush call, and the secret the cron must present
+# (/api/flush is disabled while it is not set)
+FLUSH_MAX_SECONDS = float(os.getenv("FLUSH_MAX_SECONDS", "8"))
+CRON_SECRET = os.getenv("CRON_SECRET", "")
+
+# Scraped metrics delivered by Bright Data go straight to their Coda rows,
+# upserted on the Link column: a cold instance cannot afford a row index sync
+# inside the request. The worker learns about the delivery from its mirror.
+BRIGHT_DATA_API_KEY = os.getenv("BRIGHT_DATA_API_KEY", "")
+# Every scraped record is cached so reels with fresh metrics are not re-scraped
+scrape_cache = ScrapeCache()
+metrics_updater = MetricsUpdater(CODA_CONFIG, None, cache=scrape_cache)
+# Records applied from a snapshot downloaded after a ready notification; the
+# download runs inside the request, so it is cut off there. Reels past the cut
+# keep their old metrics until the worker's refresh scrapes them again
+BRIGHT_DATA_CALLBACK_MAX_RECORDS = int(os.getenv("BRIGHT_DATA_CALLBACK_MAX_RECORDS", "500"))
+
+# Share one keep-alive pool for Telegram, Coda and Bright Data calls
+# (module-level, so it survives across warm invocations)
+transport.configure_telebot()
+
 # Initialize Telegram Bot
 print("Initializing Telegram Bot")
 bot = telebot.TeleBot(BOT_TOKEN)
 print("Bot initialized successfully")
 
+# Paces replies under Telegram's flood limits and retries 429s after retry_after
+telegram_sender = TelegramSender()
+
+def post_telegram_message(bot_token, chat_id, text):
+    """Call sendMessage once; a 429 raises so the sender can retry it"""
+    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+    payload = {
+        "chat_id": chat_id,
+        "text": text
+    }
+    
+    response = transport.post(url, json=payload)
+    print(f"Telegram response: {response.status_code} - {response.text}")
+    if response.status_code == 429:
+        response.raise_for_status()
+    return response.status_code == 200
+
 def send_telegram_message(chat_id, text):
     """Send a message to a Telegram chat."""
     bot_token = os.environ.get('TELEGRAM_BOT_TOKEN', '').strip()
@@ -50,21 +151,40 @@ def send_telegram_message(chat_id, text):
     if not bot_token:
         print("Error: No Telegram bot token found in environment variables")
         return False
-        
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": text
-    }
     
     try:
-        response = requests.post(url, json=payload)
-        print(f"Telegram response: {response.status_code} - {response.text}")
-        return response.status_code == 200
+        return telegram_sender.send(chat_id, post_telegram_message, bot_token, chat_id, text,
+                                    timeout=TELEGRAM_SEND_TIMEOUT)
     except Exception as e:
         print(f"Error sending Telegram message: {e}")
         return False
 
+def notify_saved(entry, row_id):
+    """Tell the user a fast-acked link has been written to Coda"""
+    if entry.get("notify") and entry.get("chat_id"):
+        send_telegram_message(entry["chat_id"], "✅ Link saved successfully to the DDF database!")
+
+outbox_drainer = OutboxDrainer(outbox, coda_writer, on_done=notify_saved, row_index=row_index,
+                               shortcode_index=shortcode_index)
+
+def seed_shortcode_index():
+    """
+    Load the shortcodes already in Coda on the first webhook of this instance
+
+    Vercel starts every cold instance with an empty /tmp, so without this the
+    index would only know the links this instance has seen. A failed sync is
+    retried on the next webhook; meanwhile duplicates are only caught locally.
+    """
+    try:
+        shortcode_index.ensure_seeded(CODA_CONFIG)
+    except Exception as e:
+        print(f"Could not sync the shortcode index with Coda: {e}")
+
+def release_update(dedup_key):
+    """Let Telegram's redelivery of an update we failed to record be processed"""
+    if dedup_key:
+        processed_updates.release(dedup_key)
+
 # Process webhook calls - this is the endpoint Vercel will expose
 @app.route('/api/webhook', methods=['POST'])
 def webhook():
@@ -81,10 +201,22 @@ def webhook():
         print(f"Failed to parse JSON: {e}")
         return jsonify({"status": "error", "message": "Invalid JSON payload"}), 400
     
+    # Drop redeliveries of updates we already handled or are handling now
+    update_id = data.get('update_id')
+    dedup_key = update_key(update_id) if update_id is not None else None
+    if dedup_key and not processed_updates.claim(dedup_key):
+        print(f"Ignoring redelivered update {update_id}")
+        return jsonify({"status": "success", "message": "Duplicate update ignored"}), 200
+    
     # Extract message text from webhook data
+    recorded = False
     try:
         message = data.get('message', {})
-        text = message.get('text', '')
+        # Links can be in the text or in a media caption
+        if 'text' in message:
+            text, entities = message.get('text', ''), message.get('entities')
+        else:
+            text, entities = message.get('caption', ''), message.get('caption_entities')
         chat_id = message.get('chat', {}).get('id')
         
         if not chat_id:
@@ -93,44 +225,164 @@ def webhook():
             
         print(f"Received message: {text}")
         
-        # Extract Instagram links using shared utility function
-        instagram_links = extract_instagram_links(text)
+        # Extract Instagram links, using Telegram's URL entities when present
+        instagram_links = [link.url for link in extract_message_links(text, entities)]
         print(f"Extracted Instagram links: {instagram_links}")
         
+        if instagram_links:
+            monitor.record_valid_link(len(instagram_links))
+        
         if not instagram_links:
             print("No Instagram links found in message")
+            monitor.record_invalid_link()
             send_telegram_message(chat_id, "I don't recognize any Instagram links in your message. Please send a valid Instagram link.")
             return jsonify({"status": "success", "message": "No Instagram links found"}), 200
         
-        # Create coda config from environment variables
-        coda_config = {
-            "api_key": CODA_API_KEY,
-            "doc_id": DOC_ID,
-            "table_id": TABLE_ID,
-            "column_name": "Link"  # Use column name for stability
-        }
-        
-        # Process each link
-        success_count = 0
-        for link in instagram_links:
-            success, _ = send_to_coda(link, coda_config)
-            
-            if success:
-                success_count += 1
+        # Cold instances load the reels already in Coda before checking duplicates
+        seed_shortcode_index()
+        
+        # Under load, defer the Coda write and confirm once the link is saved
+        admitted = WEBHOOK_FAST_ACK or admission is None or admission.admit()
+        
+        # Record new links durably; reels we already have are skipped
+        results = link_intake.accept(
+            instagram_links,
+            chat_id=chat_id,
+            message_id=message.get('message_id'),
+            notify=WEBHOOK_FAST_ACK or not admitted
+        )
+        entry_ids = [detail for _, outcome, detail in results if outcome == LINK_ACCEPTED]
+        
+        # The links are in the outbox now; a redelivery must not record them again
+        recorded = True
+        
+        if not entry_ids:
+            send_telegram_message(chat_id, "ℹ️ This reel is already saved in the DDF database.")
+            return jsonify({"status": "success", "message": "All links were already saved"}), 200
+        
+        if WEBHOOK_FAST_ACK:
+            # Acknowledge now; /api/flush writes to Coda and replies
+            return jsonify({"status": "success", "message": f"Queued {len(entry_ids)} links"}), 200
+        
+        if not admitted:
+            send_telegram_message(chat_id, "⏳ Queued! We're busy right now; I'll confirm once your link is saved.")
+            return jsonify({"status": "success", "message": f"Deferred {len(entry_ids)} links"}), 200
+        
+        # Push due outbox entries (including earlier failures) to Coda
+        outbox_drainer.drain(max_seconds=WEBHOOK_DRAIN_SECONDS)
+        
+        statuses = outbox.statuses(entry_ids)
+        success_count = sum(1 for entry_id in entry_ids if statuses.get(entry_id) == STATUS_DONE)
+        failed_count = sum(1 for entry_id in entry_ids if statuses.get(entry_id) == STATUS_FAILED)
             
         # Send response back to user
-        if success_count > 0:
+        if success_count == len(entry_ids):
             send_telegram_message(chat_id, "✅ Link saved successfully to the DDF database!")
+        elif failed_count:
+            send_telegram_message(chat_id, "❌ Coda rejected this link, so it was not saved. Please contact an admin.")
+        elif ON_VERCEL:
+            # This instance's outbox may be gone before anything retries it
+            stranded = [
+                {"id": entry_id, "link": link} for link, outcome, entry_id in results
+                if outcome == LINK_ACCEPTED and statuses.get(entry_id) != STATUS_DONE
+            ]
+            outbox_drainer.give_up(stranded, "Coda did not answer before the webhook returned")
+            send_telegram_message(chat_id, "❌ Coda is not responding right now, so your link was not saved. Please send it again in a few minutes.")
         else:
-            send_telegram_message(chat_id, "❌ Failed to save link to the database. Please try again later or contact support.")
+            send_telegram_message(chat_id, "⏳ Coda is not responding right now. Your link is stored and will be saved automatically.")
         
         return jsonify({"status": "success", "message": f"Processed {len(instagram_links)} links, saved {success_count} successfully"}), 200
             
     except Exception as e:
         print(f"Error in webhook handler: {e}")
         print(f"Traceback: {traceback.format_exc()}")
+        if not recorded:
+            release_update(dedup_key)
         return jsonify({"status": "error", "message": f"Failed to process webhook: {str(e)}"}), 500
 
+@app.route('/api/flush', methods=['GET', 'POST'])
+def flush():
+    """
+    Push queued links to Coda and send the pending replies.
+    Meant to be called by a cron; each call is bounded to FLUSH_MAX_SECONDS.
+    """
+    authorization = request.headers.get('Authorization', '')
+    if not CRON_SECRET or not hmac.compare_digest(authorization, f"Bearer {CRON_SECRET}"):
+        return jsonify({"status": "error", "message": "Unauthorized"}), 401
+    
+    try:
+        max_seconds = min(float(request.args.get('max_seconds', FLUSH_MAX_SECONDS)), FLUSH_MAX_SECONDS)
+    except ValueError:
+        max_seconds = FLUSH_MAX_SECONDS
+    
+    try:
+        # Load the shortcodes already in Coda on the first flush of this instance
+        shortcode_index.ensure_seeded(CODA_CONFIG)
+        
+        written = outbox_drainer.drain(max_seconds=max_seconds)
+        pending = outbox.pending_count()
+        print(f"Flush wrote {written} links, {pending} still pending")
+        return jsonify({"status": "success", "written": written, "pending": pending}), 200
+    except Exception as e:
+        print(f"Error in flush handler: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return jsonify({"status": "error", "message": f"Failed to flush outbox: {str(e)}"}), 500
+
+@app.route('/api/brightdata', methods=['POST'])
+def brightdata_callback():
+    """
+    Receive finished Bright Data snapshots.
+    Accepts either a delivery (the scraped records as NDJSON, or a JSON list)
+    or a notification ({"snapshot_id": ..., "status": ...}), after which the
+    snapshot is downloaded.
+    """
+    # Bright Data sends the configured auth_header verbatim
+    authorization = request.headers.get('Authorization', '')
+    if not BRIGHT_DATA_WEBHOOK_SECRET or not hmac.compare_digest(authorization, BRIGHT_DATA_WEBHOOK_SECRET):
+        return jsonify({"status": "error", "message": "Unauthorized"}), 401
+    
+    downloaded = None
+    try:
+        # Read the body line by line, so a large delivery is never held in memory
+        records = brightdata.iter_ndjson(request.stream)
+        first = next(records, None)
+        
+        if isinstance(first, list):
+            records = first
+        elif isinstance(first, dict) and first.get('snapshot_id') and 'status' in first:
+            snapshot_id = first['snapshot_id']
+            status = first.get('status')
+            if status != SNAPSHOT_READY:
+                # Failed reels are picked up again by the worker's metrics refresh
+                print(f"Snapshot {snapshot_id} finished with status {status}")
+                return jsonify({"status": "success", "message": f"Snapshot {status}"}), 200
+            downloaded = brightdata.iter_snapshot_records(snapshot_id, BRIGHT_DATA_API_KEY)
+            records = itertools.islice(downloaded, BRIGHT_DATA_CALLBACK_MAX_RECORDS)
+        elif isinstance(first, dict):
+            records = itertools.chain([first], records)
+        else:
+            return jsonify({"status": "error", "message": "Expected scraped records or a snapshot notification"}), 400
+        
+        # Bright Data redelivers on a non-2xx reply, and row upserts are idempotent
+        result = metrics_updater.apply(records)
+        if downloaded is not None and next(downloaded, None) is not None:
+            print(f"Snapshot has more than {BRIGHT_DATA_CALLBACK_MAX_RECORDS} records, the rest is left to the refresh")
+            result["truncated"] = True
+        print(f"Bright Data callback updated {result['updated']} rows, skipped {result['skipped']}")
+        return jsonify({"status": "success", **result}), 200
+    except json.JSONDecodeError as e:
+        # Redelivering a body that is not JSON would fail the same way
+        print(f"Malformed Bright Data callback: {e}")
+        return jsonify({"status": "error", "message": f"Malformed payload: {str(e)}"}), 400
+    except Exception as e:
+        print(f"Error in Bright Data callback: {e}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return jsonify({"status": "error", "message": f"Failed to apply snapshot: {str(e)}"}), 500
+    finally:
+        if downloaded is not None:
+            # Release the download stream
+            downloaded.close()
+
 # The main entry point for Vercel
 @app.route('/', methods=['GET'])
 def index():
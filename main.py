@@ -4,11 +4,17 @@ DDF Reels Bot - Local Development Entrypoint
 
 This is the main entry point for local development.
 It allows running the bot in polling mode locally.
+Set BOT_RUNTIME=async to use the asyncio runtime (src/async_bot.py).
 """
 
-from src.bot import run_polling
+import os
 
 if __name__ == "__main__":
     print("Starting DDF Reels Bot in polling mode...")
     print("Press Ctrl+C to stop")
-    run_polling() 
\ No newline at end of file
+    if os.getenv("BOT_RUNTIME", "threaded") == "async":
+        from src.async_bot import main
+        main()
+    else:
+        from src.bot import run_polling
+        run_polling()
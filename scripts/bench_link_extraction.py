@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for Instagram link extraction.
+
+Compares the previous findall-based regex with the linear-time scanner in
+src/links.py on ordinary and adversarial inputs.
+
+Usage:
+    python -m scripts.bench_link_extraction [--repeat N]
+"""
+
+import re
+import sys
+import time
+import argparse
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.links import scan_instagram_links
+
+# The pattern extract_instagram_links used before the scanner
+LEGACY_PATTERN = r'https?://(?:www\.)?instagram\.com/[a-zA-Z0-9_.-]+/[a-zA-Z0-9_.-]+/?(?:\?[^\s]*)?'
+
+def build_inputs():
+    """Return (name, text) pairs covering ordinary and adversarial inputs"""
+    words = "check out this reel from yesterday it is great " * 4
+    return [
+        ("short message", "Look at this https://www.instagram.com/reel/C4bC9xYz1Ab/?igsh=abc"),
+        ("1 MB chat dump, 1 link per 200 chars",
+         ((words + "https://www.instagram.com/reel/C4bC9xYz1Ab/ ") * 5000)[:1_000_000]),
+        ("1 MB of repeated hosts", ("https://instagram.com/" * 50_000)[:1_000_000]),
+        ("1 MB host + endless path", "https://instagram.com/" + "a" * 1_000_000),
+        ("1 MB host + dotted segments", "https://instagram.com/" + "a." * 500_000),
+        ("1 MB link + endless query", "https://instagram.com/reel/ABC/?" + "x" * 1_000_000),
+        ("1 MB no links", "x" * 1_000_000),
+    ]
+
+def bench(func, text, repeat):
+    """Return the best wall time of ``repeat`` runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    """Run the benchmark and print throughput for both extractors"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per input (best time is reported)")
+    args = parser.parse_args()
+
+    legacy = re.compile(LEGACY_PATTERN)
+
+    print(f"{'input':40} {'size':>9} {'legacy MB/s':>12} {'scanner MB/s':>13} {'links':>6}")
+    for name, text in build_inputs():
+        megabytes = len(text) / 1_000_000
+        legacy_time = bench(legacy.findall, text, args.repeat)
+        scanner_time = bench(scan_instagram_links, text, args.repeat)
+        links = len(scan_instagram_links(text))
+        print(
+            f"{name:40} {len(text):>9} "
+            f"{megabytes / max(legacy_time, 1e-9):>12.1f} "
+            f"{megabytes / max(scanner_time, 1e-9):>13.1f} {links:>6}"
+        )
+
+if __name__ == "__main__":
+    main()
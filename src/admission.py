@@ -0,0 +1,60 @@
+"""
+Admission control for incoming links.
+
+Pending link work is measured as the outbox backlog. Once it reaches
+ADMISSION_HIGH_WATER the controller starts shedding, and stops when the
+backlog has drained to ADMISSION_LOW_WATER, so the decision does not flap
+around a single threshold. Links are recorded in the outbox either way.
+
+What shedding saves depends on the entry point. The webhook (outside Vercel,
+where admission is off) skips its in-request drain for a deferred update, so
+Coda writes stop competing with intake. The polling bot always leaves Coda
+writes to the drainer, so there admission is only a backpressure signal: the
+user is told the link is queued behind a backlog instead of the usual reply.
+"""
+
+import os
+import logging
+import threading
+
+from src.monitoring import monitor
+
+# Backlog at which new links are deferred
+ADMISSION_HIGH_WATER = int(os.getenv("ADMISSION_HIGH_WATER", "200"))
+# Backlog below which links are processed normally again
+ADMISSION_LOW_WATER = int(os.getenv("ADMISSION_LOW_WATER", "50"))
+
+logger = logging.getLogger("Admission")
+
+class AdmissionController:
+    """Decides whether an incoming message is handled normally or deferred behind the backlog"""
+
+    def __init__(self, pending, high_water=ADMISSION_HIGH_WATER, low_water=ADMISSION_LOW_WATER):
+        self.pending = pending  # Callable returning the current backlog
+        self.high_water = high_water
+        self.low_water = min(low_water, high_water)
+        self.shedding = False
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """
+        Decide for one incoming message
+
+        Returns:
+            True to handle its links normally, False to defer them
+        """
+        depth = self.pending()
+        with self.lock:
+            if self.shedding and depth <= self.low_water:
+                self.shedding = False
+                logger.info(f"Backlog down to {depth}, processing links again")
+            elif not self.shedding and depth >= self.high_water:
+                self.shedding = True
+                logger.warning(f"Backlog at {depth}, deferring new links")
+            admitted = not self.shedding
+
+        if admitted:
+            monitor.record_admitted()
+        else:
+            monitor.record_deferred()
+        return admitted
@@ -0,0 +1,151 @@
+"""
+Asyncio runtime for the polling bot.
+
+Runs the handlers of src/bot.py on pyTelegramBotAPI's AsyncTeleBot instead of
+the threaded TeleBot. All Telegram calls share one event loop and one aiohttp
+connection pool, so hundreds of replies can be in flight at once instead of
+waiting for a free telebot worker thread. The handler logic itself (outbox
+writes in SQLite) still blocks, so it runs on a pool of BOT_ASYNC_CONCURRENCY
+threads, and at most that many updates are handled at the same time. Commands
+and admin traffic skip that limit and run on their own executor, so a burst of
+links never delays /stats. Replies go through the same TelegramSender as the
+threaded bot, so they share its flood limits and 429 retries; the sender only
+schedules each call on the loop and never waits for Telegram's answer.
+
+Usage:
+    python -m src.async_bot
+    BOT_RUNTIME=async python main.py
+"""
+
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.async_telebot import AsyncTeleBot
+
+from src import transport
+from src.replies import ProgressMessage
+from src.sender import TELEGRAM_SEND_TIMEOUT
+from src.bot import (
+    BOT_TOKEN, CODA_CONFIG, BOT_DRAIN_OUTBOX, MESSAGE_CONTENT_TYPES, logger, monitor, telegram_sender,
+    shortcode_index, outbox_drainer, is_priority_update, welcome_replies, stats_replies, version_replies, message_replies
+)
+
+# Updates handled at the same time; the rest wait on the event loop
+BOT_ASYNC_CONCURRENCY = int(os.getenv("BOT_ASYNC_CONCURRENCY", "100"))
+# Threads reserved for commands and admin traffic
+BOT_PRIORITY_WORKERS = int(os.getenv("BOT_PRIORITY_WORKERS", "1"))
+
+transport.configure_async_telebot()
+
+async_bot = AsyncTeleBot(BOT_TOKEN)
+
+# The default executor would cap handlers at min(32, cpu + 4) threads
+handler_executor = ThreadPoolExecutor(max_workers=BOT_ASYNC_CONCURRENCY, thread_name_prefix="handler")
+priority_executor = ThreadPoolExecutor(max_workers=BOT_PRIORITY_WORKERS, thread_name_prefix="priority")
+
+# Created lazily so it binds to the loop started by asyncio.run()
+_handler_slots = None
+
+def handler_slots():
+    """Semaphore bounding concurrent handlers"""
+    global _handler_slots
+    if _handler_slots is None:
+        _handler_slots = asyncio.Semaphore(BOT_ASYNC_CONCURRENCY)
+    return _handler_slots
+
+def telegram_call(loop, method, *args):
+    """
+    Schedule an AsyncTeleBot call on the loop (used from sender threads)
+
+    Returns:
+        The concurrent Future of the call; the sender completes the paced
+        call with it, so no sender thread waits for Telegram's answer
+    """
+    return asyncio.run_coroutine_threadsafe(method(*args), loop)
+
+async def respond(message, build_replies):
+    """Build the replies off the event loop, then send them through the paced sender"""
+    loop = asyncio.get_running_loop()
+    priority = is_priority_update(message)
+    if priority:
+        replies = await loop.run_in_executor(priority_executor, build_replies, message)
+    else:
+        async with handler_slots():
+            replies = await loop.run_in_executor(handler_executor, build_replies, message)
+    for text in replies:
+        await asyncio.wrap_future(telegram_sender.submit(
+            message.chat.id, telegram_call, loop, async_bot.reply_to, message, text, priority=priority
+        ))
+
+@async_bot.message_handler(commands=['start', 'help'])
+async def send_welcome(message):
+    """Handle /start and /help commands"""
+    await respond(message, welcome_replies)
+
+@async_bot.message_handler(commands=['stats'])
+async def send_stats(message):
+    """Send bot statistics (admin only)"""
+    await respond(message, stats_replies)
+
+@async_bot.message_handler(commands=['version'])
+async def send_version(message):
+    """Send bot version information (admin only)"""
+    await respond(message, version_replies)
+
+@async_bot.message_handler(func=lambda message: True, content_types=MESSAGE_CONTENT_TYPES)
+async def handle_message(message):
+    """Handle all incoming messages and check for Instagram links"""
+    loop = asyncio.get_running_loop()
+    chat_id = message.chat.id
+
+    # message_replies runs in a handler thread; the paced sender runs the
+    # Telegram calls on the loop
+    def send(text):
+        return telegram_sender.send(chat_id, telegram_call, loop, async_bot.reply_to, message, text,
+                                    timeout=TELEGRAM_SEND_TIMEOUT)
+
+    def edit(sent, text):
+        return telegram_sender.submit(chat_id, telegram_call, loop, async_bot.edit_message_text,
+                                      text, sent.chat.id, sent.message_id)
+
+    def edit_final(sent, text):
+        return telegram_sender.send(chat_id, telegram_call, loop, async_bot.edit_message_text,
+                                    text, sent.chat.id, sent.message_id, timeout=TELEGRAM_SEND_TIMEOUT)
+
+    progress = ProgressMessage(send=send, edit=edit, edit_final=edit_final)
+    await respond(message, functools.partial(message_replies, progress=progress))
+
+async def run_polling():
+    """Start the bot in asyncio polling mode"""
+    # First, remove any webhook
+    await async_bot.delete_webhook()
+
+    # Load the shortcodes already in Coda on first run
+    try:
+        await asyncio.to_thread(shortcode_index.ensure_seeded, CODA_CONFIG)
+    except Exception as e:
+        monitor.record_error(e, "Failed to seed shortcode index")
+    shortcode_index.start_resync(CODA_CONFIG)
+
+    # Coda writes stay in the outbox drainer thread, off the event loop
+    if BOT_DRAIN_OUTBOX:
+        outbox_drainer.start()
+
+    logger.info(f"Starting bot in asyncio polling mode ({BOT_ASYNC_CONCURRENCY} concurrent handlers)...")
+    try:
+        await async_bot.polling(non_stop=True, interval=0)
+    finally:
+        # The sender needs the loop to deliver what is still queued
+        await asyncio.to_thread(telegram_sender.close, 10)
+        outbox_drainer.stop(timeout=10)
+        handler_executor.shutdown(wait=False)
+        await async_bot.close_session()
+
+def main():
+    """Command line entry point"""
+    asyncio.run(run_polling())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Coalescing batch writer for Coda row inserts.
+
+Links submitted from any thread are buffered for a short window (or until the
+batch is full) and written with one multi-row insert. Every caller still gets
+its own future that resolves to the Coda row id of its link.
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future
+
+from src import coda
+
+# Flush as soon as this many links are buffered...
+BATCH_MAX_SIZE = int(os.getenv("CODA_BATCH_MAX_SIZE", "25"))
+# ...or once the oldest buffered link has waited this long
+BATCH_WINDOW_MS = int(os.getenv("CODA_BATCH_WINDOW_MS", "200"))
+
+logger = logging.getLogger("CodaBatchWriter")
+
+class CodaBatchWriter:
+    """Buffer links and flush them to Coda as multi-row inserts"""
+
+    def __init__(self, coda_config, max_batch_size=BATCH_MAX_SIZE, window_ms=BATCH_WINDOW_MS):
+        self.coda_config = coda_config
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0, window_ms) / 1000.0
+        self._pending = []  # List of (link, future, enqueued_at)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, link):
+        """
+        Queue a link for insertion
+
+        Returns:
+            A Future resolving to the new row id (or None if Coda did not
+            report one), or raising the exception of a failed flush
+        """
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("CodaBatchWriter is closed")
+            self._pending.append((link, future, time.monotonic()))
+            self._ensure_thread()
+            self._cond.notify()
+        return future
+
+    def flush(self, timeout=None):
+        """
+        Write everything currently buffered from the calling thread
+
+        ``timeout`` caps each Coda request, in seconds.
+        """
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._write_batch(batch, timeout)
+
+    def close(self):
+        """Flush outstanding links and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _ensure_thread(self):
+        """Start the background flusher on first use (caller holds the lock)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="coda-batch-writer", daemon=True
+            )
+            self._thread.start()
+
+    def _take_batch(self):
+        """Pop up to max_batch_size pending entries"""
+        with self._cond:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        """Background loop: wait for the window or a full batch, then flush"""
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+
+                # Hold the batch open until it fills up or the window expires
+                deadline = self._pending[0][2] + self.window
+                while len(self._pending) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            batch = self._take_batch()
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch, timeout=None):
+        """Insert one batch and resolve its futures"""
+        links = [link for link, _, _ in batch]
+        logger.info(f"Flushing {len(links)} links to Coda in one request")
+
+        try:
+            response = coda.insert_rows(links, self.coda_config, timeout=timeout)
+        except Exception as e:
+            logger.error(f"Batch insert of {len(links)} links failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        row_ids = response.get("addedRowIds") or []
+        for index, (_, future, _) in enumerate(batch):
+            future.set_result(row_ids[index] if index < len(row_ids) else None)
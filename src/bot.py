@@ -1,9 +1,22 @@
 import os
-import telebot
 import sys
 import logging
-from src.utils import get_required_env, extract_instagram_links, send_to_coda
+from src.utils import get_required_env
+from src.links import extract_message_links
 from src.monitoring import setup_logging, monitor, error_handler
+from src import transport
+from src.batching import CodaBatchWriter
+from src.outbox import LinkOutbox, OutboxDrainer
+from src.dedup import UpdateDeduplicator, message_key
+from src.shortcode_index import ShortcodeIndex
+from src.row_index import RowIndex
+from src.intake import LinkIntake, LINK_FAILED
+from src.dispatch import LaneTeleBot
+from src.admission import AdmissionController
+from src.sender import TelegramSender, TELEGRAM_SEND_TIMEOUT
+from src.replies import (
+    ProgressMessage, summarize_results, progress_text, REPLY_PROGRESS_THRESHOLD, PROGRESS_CHUNK_SIZE
+)
 
 # Configure logging using our enhanced logging setup
 logger = setup_logging()
@@ -39,10 +52,61 @@ logger.info(f"Authorized users: {len(AUTHORIZED_USERS)}")
 ADMIN_USERS = [int(id) for id in os.getenv("ADMIN_USERS", "").split(",") if id.strip()] if os.getenv("ADMIN_USERS") else []
 logger.info(f"Admin users: {len(ADMIN_USERS)}")
 
-# Initialize Telegram Bot
-bot = telebot.TeleBot(BOT_TOKEN)
+# Coda configuration shared by every handler
+CODA_CONFIG = {
+    "api_key": CODA_API_KEY,
+    "doc_id": DOC_ID,
+    "table_id": TABLE_ID,
+    "column_name": "Link"  # Use column name for stability
+}
+
+# Links are recorded in a durable outbox before replying; the drainer pushes
+# them to Coda in multi-row inserts and retries when Coda is unavailable.
+# The row ids Coda returns are kept so metric updates can address rows directly.
+coda_writer = CodaBatchWriter(CODA_CONFIG)
+outbox = LinkOutbox()
+row_index = RowIndex()
+
+# Shortcodes of every saved reel, so known links never reach Coda again
+shortcode_index = ShortcodeIndex()
+link_intake = LinkIntake(outbox, shortcode_index)
+
+outbox_drainer = OutboxDrainer(outbox, coda_writer, row_index=row_index, shortcode_index=shortcode_index)
+
+# Set to false when `python -m src.worker` drains the outbox instead
+BOT_DRAIN_OUTBOX = os.getenv("BOT_DRAIN_OUTBOX", "true").lower() in ("1", "true", "yes")
+
+# Tells users their links are queued while the outbox backlog is above its
+# high water mark; the drainer writes every link either way
+admission = AdmissionController(outbox.pending_count)
+
+# Remembers handled (chat_id, message_id) pairs so repeated deliveries are ignored
+processed_messages = UpdateDeduplicator()
+
+# Route telebot's API calls through the shared keep-alive pool
+transport.configure_telebot()
+
+def is_priority_update(update):
+    """Commands and admin traffic run on the priority lane"""
+    text = getattr(update, "text", None)
+    if isinstance(text, str) and text.startswith("/"):
+        return True
+    user = getattr(update, "from_user", None)
+    return user is not None and is_admin(user.id)
+
+# Initialize Telegram Bot; handlers run in per-chat lanes so replies within a
+# chat keep their order while different chats are served in parallel
+bot = LaneTeleBot(BOT_TOKEN, is_priority=is_priority_update)
+monitor.set_queue_depths(bot.dispatcher.queue_depths)
+monitor.set_drains_outbox(BOT_DRAIN_OUTBOX)
+
+# Paces every reply under Telegram's global and per-chat flood limits
+telegram_sender = TelegramSender()
 logger.info("Bot initialized successfully")
 
+# Message types checked for Instagram links (text, or the caption of media)
+MESSAGE_CONTENT_TYPES = ['text', 'photo', 'video', 'animation', 'document']
+
 def is_authorized(user_id, username):
     """Check if the user is authorized to use the bot"""
     # If no authorized users specified, everyone is authorized
@@ -61,30 +125,24 @@ def is_admin(user_id):
     return user_id in ADMIN_USERS
 
 @error_handler
-def process_instagram_link(link, sender_info):
-    """Process an Instagram link and save it to Coda"""
-    # Create coda config from environment variables
-    coda_config = {
-        "api_key": CODA_API_KEY,
-        "doc_id": DOC_ID,
-        "table_id": TABLE_ID,
-        "column_name": "Link"  # Use column name for stability
-    }
-    
-    # Send to Coda using the shared utility
-    success, result = send_to_coda(link, coda_config)
-    
-    # Update monitoring stats
-    if success:
-        monitor.record_successful_submission()
-    else:
-        monitor.record_failed_submission()
-    
-    return success, result
+def process_instagram_links(links, sender_info, message):
+    """Record new Instagram links in the outbox; the drainer saves them to Coda"""
+    return link_intake.accept(
+        links,
+        chat_id=message.chat.id,
+        message_id=message.message_id,
+        sender=sender_info
+    )
 
-@bot.message_handler(commands=['start', 'help'])
-def send_welcome(message):
-    """Handle /start and /help commands"""
+UNAUTHORIZED_TEXT = "⛔ You are not authorized to use this bot. Please contact the administrator."
+ADMIN_ONLY_TEXT = "⛔ This command is only available to administrators."
+
+# Reply builders hold the logic of every handler. They return the texts to
+# send back, so the threaded bot below and the asyncio runtime in
+# src/async_bot.py share the same behaviour.
+
+def welcome_replies(message):
+    """Replies to /start and /help"""
     # Update monitoring stats
     monitor.record_message()
     
@@ -94,11 +152,7 @@ def send_welcome(message):
     
     # Check if user is authorized
     if not is_authorized(user_id, username):
-        bot.reply_to(
-            message,
-            "⛔ You are not authorized to use this bot. Please contact the administrator."
-        )
-        return
+        return [UNAUTHORIZED_TEXT]
     
     welcome_text = (
         "👋 Welcome to DDF Reels Bot!\n\n"
@@ -116,43 +170,28 @@ def send_welcome(message):
             "/version - Show bot version info\n"
         )
     
-    bot.reply_to(message, welcome_text)
+    return [welcome_text]
 
-@bot.message_handler(commands=['stats'])
-def send_stats(message):
-    """Send bot statistics (admin only)"""
+def stats_replies(message):
+    """Replies to /stats (admin only)"""
     # Update monitoring stats
     monitor.record_message()
     
-    user_id = message.from_user.id
-    
     # Check if user is admin
-    if not is_admin(user_id):
-        bot.reply_to(
-            message,
-            "⛔ This command is only available to administrators."
-        )
-        return
+    if not is_admin(message.from_user.id):
+        return [ADMIN_ONLY_TEXT]
     
     # Get stats from the monitor
-    stats_report = monitor.get_status_report()
-    bot.reply_to(message, stats_report)
+    return [monitor.get_status_report()]
 
-@bot.message_handler(commands=['version'])
-def send_version(message):
-    """Send bot version information (admin only)"""
+def version_replies(message):
+    """Replies to /version (admin only)"""
     # Update monitoring stats
     monitor.record_message()
     
-    user_id = message.from_user.id
-    
     # Check if user is admin
-    if not is_admin(user_id):
-        bot.reply_to(
-            message,
-            "⛔ This command is only available to administrators."
-        )
-        return
+    if not is_admin(message.from_user.id):
+        return [ADMIN_ONLY_TEXT]
     
     # Get version info
     version_info = (
@@ -161,65 +200,156 @@ def send_version(message):
         "Built with ❤️ for DDF\n"
     ).format(ENVIRONMENT)
     
-    bot.reply_to(message, version_info)
+    return [version_info]
 
-@bot.message_handler(func=lambda message: True)
-def handle_message(message):
-    """Handle all incoming messages and check for Instagram links"""
+def message_replies(message, progress=None):
+    """
+    Check a message for Instagram links and return the replies
+
+    All links of a message are answered with one reply. When ``progress`` (a
+    ProgressMessage) is given, the message has many links and recording them
+    is slow, a progress message is sent and edited into the final summary;
+    nothing is returned then.
+    """
+    # Ignore messages we have already handled or are handling now
+    dedup_key = message_key(message.chat.id, message.message_id)
+    if not processed_messages.claim(dedup_key):
+        logger.info(f"Ignoring repeated delivery of message {message.message_id}")
+        return []
+    
     # Update monitoring stats
     monitor.record_message()
     
-    # Extract the message text and sender information
-    text = message.text.strip()
+    # Extract the message text (or media caption) and sender information
+    raw_text = message.text if message.text is not None else (message.caption or "")
+    entities = message.entities if message.text is not None else message.caption_entities
+    text = raw_text.strip()
     user_id = message.from_user.id
     username = message.from_user.username
     
     # Check if user is authorized
     if not is_authorized(user_id, username):
-        bot.reply_to(
-            message,
-            "⛔ You are not authorized to use this bot. Please contact the administrator."
-        )
-        return
+        return [UNAUTHORIZED_TEXT]
         
     sender = username or message.from_user.first_name or "Unknown"
     logger.info(f"Received message from {sender}: {text[:50]}...")
     
-    # Extract Instagram links using regex
-    instagram_links = extract_instagram_links(text)
+    # Extract Instagram links, using Telegram's URL entities when present
+    instagram_links = [link.url for link in extract_message_links(raw_text, entities)]
     
-    if instagram_links:
-        logger.info(f"Found {len(instagram_links)} Instagram links")
-        
-        for link in instagram_links:
-            success, result = process_instagram_link(link, sender)
-            
-            if success:
-                bot.reply_to(
-                    message, 
-                    f"✅ Link saved successfully to the DDF database!"
-                )
-            else:
-                bot.reply_to(
-                    message,
-                    f"❌ Failed to save link. Error: {result}. Please try again later."
-                )
-    else:
+    if not instagram_links:
         logger.info("No Instagram links found in message")
-        bot.reply_to(
-            message,
+        monitor.record_invalid_link()
+        return [
             "❓ I didn't recognize any Instagram links in your message.\n\n"
             "Please send a valid Instagram link that starts with https://instagram.com/ or https://www.instagram.com/"
-        )
+        ]
+    
+    total = len(instagram_links)
+    logger.info(f"Found {total} Instagram links")
+    monitor.record_valid_link(total)
+    
+    # Only changes the reply: under load the user is told the links wait behind a backlog
+    admitted = admission.admit()
+    
+    # Long, slow batches show their progress in one message edited in place
+    show_progress = progress is not None and total >= REPLY_PROGRESS_THRESHOLD
+    
+    results = []
+    all_recorded = True
+    for start in range(0, total, PROGRESS_CHUNK_SIZE):
+        chunk = instagram_links[start:start + PROGRESS_CHUNK_SIZE]
+        chunk_results = process_instagram_links(chunk, sender, message)
+        if chunk_results is None:
+            all_recorded = False
+            chunk_results = [(link, LINK_FAILED, "Internal error") for link in chunk]
+        results.extend(chunk_results)
+        # The last chunk goes straight to the summary
+        if show_progress and len(results) < total:
+            progress.update(progress_text(len(results), total))
+    
+    if not all_recorded:
+        # Let a redelivery retry the links we could not record
+        processed_messages.release(dedup_key)
+    
+    summary = summarize_results(results, admitted)
+    if progress is not None and progress.started:
+        progress.finish(summary)
+        return []
+    return [summary]
+
+def send_replies(message, replies):
+    """Queue each reply to the message it answers; the sender keeps their order"""
+    priority = is_priority_update(message)
+    for text in replies:
+        telegram_sender.submit(message.chat.id, bot.reply_to, message, text, priority=priority)
+
+def progress_message(message):
+    """A ProgressMessage answering ``message`` through the paced sender"""
+    def edit(sent, text):
+        return telegram_sender.submit(message.chat.id, bot.edit_message_text, text, sent.chat.id, sent.message_id)
+
+    def edit_final(sent, text):
+        # Wait for the summary edit, so a failure falls back to a plain reply
+        return telegram_sender.send(message.chat.id, bot.edit_message_text, text, sent.chat.id, sent.message_id,
+                                    timeout=TELEGRAM_SEND_TIMEOUT)
+
+    return ProgressMessage(
+        # The sent message's id is needed for the edits, so wait for it
+        send=lambda text: telegram_sender.send(message.chat.id, bot.reply_to, message, text,
+                                               timeout=TELEGRAM_SEND_TIMEOUT),
+        edit=edit,
+        edit_final=edit_final
+    )
+
+@bot.message_handler(commands=['start', 'help'])
+def send_welcome(message):
+    """Handle /start and /help commands"""
+    send_replies(message, welcome_replies(message))
+
+@bot.message_handler(commands=['stats'])
+def send_stats(message):
+    """Send bot statistics (admin only)"""
+    send_replies(message, stats_replies(message))
+
+@bot.message_handler(commands=['version'])
+def send_version(message):
+    """Send bot version information (admin only)"""
+    send_replies(message, version_replies(message))
+
+@bot.message_handler(func=lambda message: True, content_types=MESSAGE_CONTENT_TYPES)
+def handle_message(message):
+    """Handle all incoming messages and check for Instagram links"""
+    send_replies(message, message_replies(message, progress=progress_message(message)))
 
 def run_polling():
     """Start the bot in polling mode"""
     # First, remove any webhook
     bot.remove_webhook()
     
+    # Load the shortcodes already in Coda on first run
+    try:
+        shortcode_index.ensure_seeded(CODA_CONFIG)
+    except Exception as e:
+        monitor.record_error(e, "Failed to seed shortcode index")
+    # Reels deleted in Coda drop out of the index on the next re-sync
+    shortcode_index.start_resync(CODA_CONFIG)
+    
+    # Push queued links to Coda in the background, unless a worker does it
+    if BOT_DRAIN_OUTBOX:
+        outbox_drainer.start()
+    
     logger.info("Starting bot in polling mode...")
-    # Start polling
-    bot.polling(none_stop=True, interval=0)
+    try:
+        # Start polling
+        bot.polling(none_stop=True, interval=0)
+    finally:
+        # Answer the updates already queued before the lane workers stop
+        if not bot.dispatcher.join(timeout=10):
+            logger.warning(f"Stopping with queued updates unhandled: {bot.dispatcher.queue_depths()}")
+        bot.dispatcher.stop(timeout=10)
+        telegram_sender.close(timeout=10)
+        outbox_drainer.stop(timeout=10)
 
 if __name__ == "__main__":
     run_polling() 
\ No newline at end of file
@@ -0,0 +1,421 @@
+"""
+Bright Data client for scraping reel metrics.
+
+Reels waiting for metrics are queued locally and packed into batched
+``datasets/v3/trigger`` calls: one job per batch instead of one per link.
+Every snapshot remembers which shortcodes it covers so results can be routed
+back to the right Coda rows.
+"""
+
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+
+from src import storage, transport
+from src.links import canonicalize_instagram_link
+from src.metrics import row_to_record
+
+BRIGHT_DATA_API_BASE = "https://api.brightdata.com/datasets/v3"
+# Instagram Reels dataset
+BRIGHT_DATA_DATASET_ID = os.getenv("BRIGHT_DATA_DATASET_ID", "gd_lyclm20il4r5helnj")
+
+# A batch is triggered once it holds this many reels...
+SCRAPE_BATCH_MAX_SIZE = int(os.getenv("SCRAPE_BATCH_MAX_SIZE", "100"))
+# ...or once its oldest reel has waited this many seconds
+SCRAPE_BATCH_MAX_WAIT = float(os.getenv("SCRAPE_BATCH_MAX_WAIT", "300"))
+# Failed snapshots in a row after which a reel is no longer scraped again
+SCRAPE_MAX_ATTEMPTS = int(os.getenv("SCRAPE_MAX_ATTEMPTS", "3"))
+
+# Ask for gzip-compressed snapshot downloads
+SNAPSHOT_COMPRESS = os.getenv("SNAPSHOT_COMPRESS", "false").lower() in ("1", "true", "yes")
+
+# When set, Bright Data delivers finished snapshots to this URL (the
+# /api/brightdata route) with the secret as its Authorization header
+BRIGHT_DATA_WEBHOOK_URL = os.getenv("BRIGHT_DATA_WEBHOOK_URL", "")
+BRIGHT_DATA_WEBHOOK_SECRET = os.getenv("BRIGHT_DATA_WEBHOOK_SECRET", "")
+
+# Seconds after which a snapshot Bright Data was to deliver, but whose reels
+# never changed in Coda, is given up as failed
+SNAPSHOT_DELIVERY_TIMEOUT = float(os.getenv("SNAPSHOT_DELIVERY_TIMEOUT", "86400"))
+
+SNAPSHOT_TRIGGERED = "triggered"
+SNAPSHOT_READY = "ready"
+SNAPSHOT_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scrape_queue (
+    shortcode TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    queued_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    reel_count INTEGER NOT NULL,
+    triggered_at REAL NOT NULL,
+    completed_at REAL
+);
+CREATE TABLE IF NOT EXISTS snapshot_reels (
+    snapshot_id TEXT NOT NULL,
+    shortcode TEXT NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, shortcode)
+);
+CREATE INDEX IF NOT EXISTS snapshot_reels_shortcode ON snapshot_reels (shortcode);
+"""
+
+logger = logging.getLogger("BrightData")
+
+def brightdata_headers(api_key):
+    """Return the auth headers for the Bright Data API"""
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+def delivery_params(webhook_url=BRIGHT_DATA_WEBHOOK_URL, secret=BRIGHT_DATA_WEBHOOK_SECRET):
+    """Return the trigger query parameters that ask for webhook delivery, or {}"""
+    if not webhook_url:
+        return {}
+    return {
+        "endpoint": webhook_url,
+        "auth_header": secret,
+        "format": "ndjson",
+        "uncompressed_webhook": "true"
+    }
+
+def trigger_snapshot(urls, api_key, dataset_id=BRIGHT_DATA_DATASET_ID, params=None):
+    """
+    Start one scraping job covering several reels
+
+    ``params`` are extra query parameters, e.g. from delivery_params().
+
+    Returns:
+        The snapshot id of the job
+
+    Raises:
+        requests.exceptions.RequestException: If the trigger call fails
+        ValueError: If Bright Data does not return a snapshot id
+    """
+    payload = {
+        "dataset_id": dataset_id,
+        "inputs": [{"url": url} for url in urls]
+    }
+    response = transport.post(
+        f"{BRIGHT_DATA_API_BASE}/trigger",
+        params=params,
+        json=payload,
+        headers=brightdata_headers(api_key)
+    )
+    response.raise_for_status()
+
+    snapshot_id = response.json().get("snapshot_id")
+    if not snapshot_id:
+        raise ValueError(f"No snapshot_id in Bright Data response: {response.text[:200]}")
+    return snapshot_id
+
+def get_snapshot_progress(snapshot_id, api_key):
+    """
+    Return the status of a snapshot: ``running``, ``ready`` or ``failed``
+
+    Raises:
+        requests.exceptions.RequestException: If the progress call fails
+    """
+    response = transport.get(f"{BRIGHT_DATA_API_BASE}/progress/{snapshot_id}", headers=brightdata_headers(api_key))
+    response.raise_for_status()
+    return response.json().get("status")
+
+def iter_ndjson(lines):
+    """
+    Parse NDJSON one line at a time
+
+    Raises:
+        ValueError: If a line is not JSON
+    """
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+def iter_snapshot_records(snapshot_id, api_key, compress=SNAPSHOT_COMPRESS):
+    """
+    Stream the records of a ready snapshot one at a time
+
+    The snapshot is requested as NDJSON and read line by line, so memory
+    stays flat however many reels it covers. With ``compress`` Bright Data
+    sends a gzip file, which is decompressed as it streams in.
+
+    Raises:
+        requests.exceptions.RequestException: If the download fails
+        ValueError: If the snapshot is not ready yet or a line is not JSON
+    """
+    params = {"format": "ndjson"}
+    if compress:
+        params["compress"] = "true"
+
+    with transport.get(
+        f"{BRIGHT_DATA_API_BASE}/snapshot/{snapshot_id}",
+        params=params,
+        headers=brightdata_headers(api_key),
+        stream=True
+    ) as response:
+        response.raise_for_status()
+        # 202 means the snapshot is still being built
+        if response.status_code == 202:
+            raise ValueError(f"Snapshot {snapshot_id} is not ready")
+
+        if compress:
+            # Content-Encoding gzip is undone by requests; a gzip file body is not
+            response.raw.decode_content = True
+            lines = gzip.GzipFile(fileobj=response.raw)
+        else:
+            lines = response.iter_lines()
+
+        yield from iter_ndjson(lines)
+
+class BatchedScrapeTrigger:
+    """Queue reels needing metrics and trigger them in batched jobs"""
+
+    def __init__(self, api_key, dataset_id=BRIGHT_DATA_DATASET_ID, path=None,
+                 max_batch_size=SCRAPE_BATCH_MAX_SIZE, max_wait=SCRAPE_BATCH_MAX_WAIT, cache=None):
+        self.api_key = api_key
+        self.cache = cache  # Optional ScrapeCache; reels with fresh metrics are not queued
+        self.dataset_id = dataset_id
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.conn = storage.connect(path)
+        self.lock = threading.Lock()
+        # Held while a flush picks and triggers batches, so two threads
+        # flushing at once never send the same queued reels twice
+        self.flush_lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+
+    def enqueue(self, link, force=False):
+        """
+        Queue a reel for scraping
+
+        ``force`` queues it even when its cached metrics are still fresh.
+
+        Returns:
+            True if it was queued, False if it is already waiting, its
+            cached metrics are still fresh, or it is not a reel link
+        """
+        shortcode = canonicalize_instagram_link(link)
+        if not shortcode:
+            return False
+        if not force and self.cache is not None and self.cache.is_fresh(shortcode):
+            return False
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO scrape_queue (shortcode, url, queued_at) VALUES (?, ?, ?)",
+                (shortcode, link, time.time())
+            )
+        return cursor.rowcount == 1
+
+    def enqueue_missing_metrics(self, mirror, metric_column="Views"):
+        """
+        Queue every mirrored reel that has no value in ``metric_column``
+
+        Reels that were triggered before are left to the refresh scheduler,
+        so a reel Bright Data cannot scrape is not paid for on every call.
+
+        Returns:
+            The number of reels queued
+        """
+        queued = 0
+        for row in mirror.rows():
+            if not row["link"] or row["values"].get(metric_column) not in (None, ""):
+                continue
+            shortcode = canonicalize_instagram_link(row["link"])
+            if shortcode and not self.was_triggered(shortcode):
+                queued += int(self.enqueue(row["link"]))
+        return queued
+
+    def was_triggered(self, shortcode):
+        """True if a snapshot was ever triggered for ``shortcode``"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM snapshot_reels WHERE shortcode = ? LIMIT 1", (shortcode,)
+            ).fetchone() is not None
+
+    def failed_attempts(self, shortcode):
+        """Return how many snapshots of ``shortcode`` failed since its last ready one"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM snapshot_reels r JOIN snapshots s ON s.snapshot_id = r.snapshot_id "
+                "WHERE r.shortcode = ? AND s.status = ? AND s.triggered_at > COALESCE(("
+                "SELECT MAX(s2.triggered_at) FROM snapshot_reels r2 "
+                "JOIN snapshots s2 ON s2.snapshot_id = r2.snapshot_id "
+                "WHERE r2.shortcode = ? AND s2.status = ?), 0)",
+                (shortcode, SNAPSHOT_FAILED, shortcode, SNAPSHOT_READY)
+            ).fetchone()[0]
+
+    def pending_count(self):
+        """Return the number of reels waiting to be triggered"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM scrape_queue").fetchone()[0]
+
+    def waiting(self, shortcodes):
+        """Return the subset of ``shortcodes`` still waiting to be triggered"""
+        with self.lock:
+            return {
+                shortcode for shortcode in shortcodes
+                if self.conn.execute("SELECT 1 FROM scrape_queue WHERE shortcode = ?", (shortcode,)).fetchone()
+            }
+
+    def is_due(self, now=None):
+        """True when a full batch is waiting or the oldest reel hit max_wait"""
+        now = now or time.time()
+        with self.lock:
+            count, oldest = self.conn.execute(
+                "SELECT COUNT(*), MIN(queued_at) FROM scrape_queue"
+            ).fetchone()
+        if count == 0:
+            return False
+        return count >= self.max_batch_size or now - oldest >= self.max_wait
+
+    def flush(self, force=False, shortcodes=None):
+        """
+        Trigger jobs for the queued reels
+
+        Full batches are always sent; a partial batch is sent only once its
+        oldest reel waited max_wait seconds, or when ``force`` is set.
+        With ``shortcodes``, only those queued reels are sent, whatever their
+        age, and every other reel keeps waiting.
+
+        Returns:
+            List of the snapshot ids that were triggered
+        """
+        with self.flush_lock:
+            if shortcodes is not None:
+                return self._flush_only(shortcodes)
+
+            snapshot_ids = []
+            while force and self.pending_count() or self.is_due():
+                with self.lock:
+                    batch = self.conn.execute(
+                        "SELECT shortcode, url FROM scrape_queue ORDER BY queued_at LIMIT ?",
+                        (self.max_batch_size,)
+                    ).fetchall()
+                if not batch:
+                    break
+                snapshot_ids.append(self._trigger_batch(batch))
+            return snapshot_ids
+
+    def _flush_only(self, shortcodes):
+        """Trigger the queued reels among ``shortcodes`` in full-size batches"""
+        queued = []
+        with self.lock:
+            for shortcode in dict.fromkeys(shortcodes):
+                row = self.conn.execute(
+                    "SELECT shortcode, url FROM scrape_queue WHERE shortcode = ?", (shortcode,)
+                ).fetchone()
+                if row:
+                    queued.append(row)
+        return [
+            self._trigger_batch(queued[start:start + self.max_batch_size])
+            for start in range(0, len(queued), self.max_batch_size)
+        ]
+
+    def _trigger_batch(self, batch):
+        """Start one job for a batch of queued rows and return its snapshot id"""
+        snapshot_id = trigger_snapshot(
+            [row["url"] for row in batch], self.api_key, self.dataset_id, params=delivery_params()
+        )
+        self._record_snapshot(snapshot_id, batch)
+        logger.info(f"Triggered snapshot {snapshot_id} for {len(batch)} reels")
+        return snapshot_id
+
+    def _record_snapshot(self, snapshot_id, batch):
+        """Move a triggered batch from the queue to the snapshot tables"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO snapshots (snapshot_id, status, reel_count, triggered_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (snapshot_id, SNAPSHOT_TRIGGERED, len(batch), time.time())
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO snapshot_reels (snapshot_id, shortcode, url) VALUES (?, ?, ?)",
+                    [(snapshot_id, row["shortcode"], row["url"]) for row in batch]
+                )
+                self.conn.executemany(
+                    "DELETE FROM scrape_queue WHERE shortcode = ?",
+                    [(row["shortcode"],) for row in batch]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def shortcodes_for(self, snapshot_id):
+        """Return {shortcode: url} for the reels covered by a snapshot"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT shortcode, url FROM snapshot_reels WHERE snapshot_id = ?", (snapshot_id,)
+            ).fetchall()
+        return {row["shortcode"]: row["url"] for row in rows}
+
+    def open_snapshots(self):
+        """Return the ids of snapshots that have not completed yet"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT snapshot_id FROM snapshots WHERE status = ? ORDER BY triggered_at",
+                (SNAPSHOT_TRIGGERED,)
+            ).fetchall()
+        return [row["snapshot_id"] for row in rows]
+
+    def absorb_deliveries(self, mirror, now=None, timeout=SNAPSHOT_DELIVERY_TIMEOUT):
+        """
+        Cache the metrics /api/brightdata wrote to Coda for open snapshots
+
+        Delivered snapshots never reach this process, so a reel whose
+        mirrored row changed after its snapshot was triggered is taken as
+        delivered. A snapshot is marked ready once all of its reels were,
+        and failed once ``timeout`` seconds passed without that.
+
+        Returns:
+            The number of reels cached
+        """
+        from src.refresh import parse_timestamp
+
+        now = now or time.time()
+        cached = 0
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT s.snapshot_id, s.triggered_at, r.shortcode, r.url FROM snapshots s "
+                "JOIN snapshot_reels r ON r.snapshot_id = s.snapshot_id WHERE s.status = ?",
+                (SNAPSHOT_TRIGGERED,)
+            ).fetchall()
+
+        snapshots = {}
+        for row in rows:
+            snapshot = snapshots.setdefault(row["snapshot_id"], {"triggered_at": row["triggered_at"], "waiting": 0})
+            mirrored = mirror.get(row["shortcode"])
+            updated_at = parse_timestamp(mirrored["updated_at"]) if mirrored else None
+            if updated_at is None or updated_at < row["triggered_at"]:
+                snapshot["waiting"] += 1
+                continue
+            if self.cache is not None and (self.cache.scraped_at(row["shortcode"]) or 0) < updated_at:
+                self.cache.put(row_to_record(row["url"], mirrored["values"]), now=updated_at)
+                cached += 1
+
+        for snapshot_id, snapshot in snapshots.items():
+            if not snapshot["waiting"]:
+                self.mark_snapshot(snapshot_id, SNAPSHOT_READY)
+            elif now - snapshot["triggered_at"] >= timeout:
+                logger.warning(f"Snapshot {snapshot_id} was not delivered for {snapshot['waiting']} reels")
+                self.mark_snapshot(snapshot_id, SNAPSHOT_FAILED)
+        return cached
+
+    def mark_snapshot(self, snapshot_id, status):
+        """Record that a snapshot finished (ready or failed)"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE snapshots SET status = ?, completed_at = ? WHERE snapshot_id = ?",
+                (status, time.time(), snapshot_id)
+            )
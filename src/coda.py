@@ -0,0 +1,227 @@
+"""
+Thin helpers around the Coda REST API used by the bot and the workers.
+"""
+
+import os
+import json
+import time
+
+from src import transport
+
+CODA_API_BASE = "https://coda.io/apis/v1"
+
+# Rows requested per page when listing; bounds the memory a page takes
+DEFAULT_PAGE_SIZE = int(os.getenv("CODA_PAGE_SIZE", "200"))
+
+# Largest request body sent to a row mutation endpoint; kept well under
+# Coda's documented limit so JSON overhead never tips a request over
+MAX_PAYLOAD_BYTES = int(os.getenv("CODA_MAX_PAYLOAD_BYTES", "85000"))
+
+def coda_headers(coda_config):
+    """Return the auth headers for a Coda config"""
+    return {
+        "Authorization": f"Bearer {coda_config['api_key']}",
+        "Content-Type": "application/json"
+    }
+
+def rows_url(coda_config):
+    """Return the rows endpoint for the configured table"""
+    return f"{CODA_API_BASE}/docs/{coda_config['doc_id']}/tables/{coda_config['table_id']}/rows"
+
+def get_table(coda_config):
+    """Return the table metadata (``name``, ``rowCount`` ...)"""
+    url = f"{CODA_API_BASE}/docs/{coda_config['doc_id']}/tables/{coda_config['table_id']}"
+    response = transport.get(url, headers=coda_headers(coda_config))
+    response.raise_for_status()
+    return response.json()
+
+def insert_rows(links, coda_config, timeout=None):
+    """
+    Insert several links into Coda with a single multi-row request
+
+    Args:
+        links: List of Instagram links, one row per link
+        coda_config: Dictionary with Coda configuration
+        timeout: Optional cap, in seconds, on the connect and read timeouts
+
+    Returns:
+        The parsed response body (``requestId`` and ``addedRowIds``)
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails or Coda
+            answers with a 4XX/5XX status
+    """
+    column_name = coda_config.get("column_name", "Link")
+    body = {
+        "rows": [
+            {"cells": [{"column": column_name, "value": link}]}
+            for link in links
+        ]
+    }
+
+    response = transport.post(rows_url(coda_config), json=body, headers=coda_headers(coda_config),
+                              timeout=transport.default_timeout(timeout))
+    response.raise_for_status()
+
+    try:
+        return response.json()
+    except ValueError:
+        return {}
+
+def list_rows_page(coda_config, params=None):
+    """
+    Fetch one page of rows
+
+    Returns:
+        The parsed page, including ``items`` and, when present,
+        ``nextPageToken`` and ``nextSyncToken``
+    """
+    response = transport.get(rows_url(coda_config), params=params or {}, headers=coda_headers(coda_config))
+    response.raise_for_status()
+    return response.json()
+
+def iter_pages(url, api_key, params=None):
+    """
+    Yield the ``items`` of a Coda list endpoint one page at a time
+
+    Only the current page is held in memory. When a ``nextPageToken`` is
+    returned it replaces the original query, as the token encodes it.
+    """
+    headers = {"Authorization": f"Bearer {api_key}"}
+    params = dict(params or {})
+    while True:
+        response = transport.get(url, params=params, headers=headers)
+        response.raise_for_status()
+        page = response.json()
+
+        yield page.get("items", [])
+
+        next_token = page.get("nextPageToken")
+        if not next_token:
+            return
+        params = {"pageToken": next_token}
+
+def iter_rows(coda_config, columns=None, use_column_names=True, value_format="simple",
+              sort_by=None, page_size=DEFAULT_PAGE_SIZE, visible_only=False):
+    """
+    Stream the rows of the configured table page by page
+
+    Args:
+        coda_config: Dictionary with Coda configuration
+        columns: Optional list of column names (or ids) to keep. The Coda API
+            has no server-side projection, so other columns are dropped as
+            each page arrives and never accumulate in memory.
+        use_column_names: Key ``values`` by column name instead of id
+        value_format: ``simple``, ``simpleWithArrays`` or ``rich``
+        sort_by: Optional ``createdAt``, ``natural`` or ``updatedAt``
+        page_size: Rows requested per page
+        visible_only: Skip hidden columns on the server side
+
+    Yields:
+        Row dictionaries (``id``, ``updatedAt``, ``values`` ...)
+    """
+    params = {
+        "useColumnNames": "true" if use_column_names else "false",
+        "valueFormat": value_format,
+        "limit": page_size,
+    }
+    if sort_by:
+        params["sortBy"] = sort_by
+    if visible_only:
+        params["visibleOnly"] = "true"
+
+    wanted = set(columns) if columns is not None else None
+    for items in iter_pages(rows_url(coda_config), coda_config["api_key"], params):
+        for row in items:
+            if wanted is not None:
+                row["values"] = {
+                    column: value for column, value in row.get("values", {}).items()
+                    if column in wanted
+                }
+            yield row
+
+def iter_tables(doc_id, api_key, page_size=DEFAULT_PAGE_SIZE):
+    """Stream the tables of a doc"""
+    url = f"{CODA_API_BASE}/docs/{doc_id}/tables"
+    for items in iter_pages(url, api_key, {"limit": page_size}):
+        yield from items
+
+def iter_columns(doc_id, table_id, api_key, page_size=DEFAULT_PAGE_SIZE):
+    """Stream the columns of a table"""
+    url = f"{CODA_API_BASE}/docs/{doc_id}/tables/{table_id}/columns"
+    for items in iter_pages(url, api_key, {"limit": page_size}):
+        yield from items
+
+def chunk_rows(rows, max_bytes=MAX_PAYLOAD_BYTES):
+    """
+    Split row payloads into lists whose JSON body stays under ``max_bytes``
+
+    A single row larger than the limit is still sent on its own.
+    """
+    chunk, size = [], 0
+    for row in rows:
+        # Measured the way requests serialises ``json=`` bodies, plus the separator
+        row_size = len(json.dumps(row)) + 2
+        if chunk and size + row_size > max_bytes:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(row)
+        size += row_size
+    if chunk:
+        yield chunk
+
+def upsert_rows(rows, key_columns, coda_config, max_bytes=MAX_PAYLOAD_BYTES):
+    """
+    Insert or update many rows, matching existing ones on ``key_columns``
+
+    Args:
+        rows: List of cell lists (``[{"column": ..., "value": ...}, ...]``)
+        key_columns: Column names (or ids) identifying a row
+        coda_config: Dictionary with Coda configuration
+        max_bytes: Request body limit; rows are split across requests to fit
+
+    Returns:
+        The ``requestId`` of every request sent, for get_mutation_status()
+
+    Raises:
+        requests.exceptions.RequestException: If a request fails
+    """
+    # Leave room for the keyColumns part of the body
+    overhead = len(json.dumps({"rows": [], "keyColumns": key_columns}))
+    request_ids = []
+    for chunk in chunk_rows(({"cells": cells} for cells in rows), max_bytes - overhead):
+        body = {"rows": chunk, "keyColumns": key_columns}
+        response = transport.post(rows_url(coda_config), json=body, headers=coda_headers(coda_config))
+        response.raise_for_status()
+        request_ids.append(response.json().get("requestId"))
+    return request_ids
+
+def get_mutation_status(request_id, coda_config):
+    """Return the status of a mutation (``completed`` and an optional ``warning``)"""
+    response = transport.get(f"{CODA_API_BASE}/mutationStatus/{request_id}", headers=coda_headers(coda_config))
+    response.raise_for_status()
+    return response.json()
+
+def wait_for_mutations(request_ids, coda_config, timeout=30, poll_interval=1):
+    """
+    Poll the mutation status endpoint until every request has been applied
+
+    Returns:
+        Dictionary with the ``completed`` and still ``pending`` request ids
+        and any ``warnings`` Coda reported
+    """
+    pending = [request_id for request_id in request_ids if request_id]
+    completed, warnings = [], {}
+    deadline = time.monotonic() + timeout
+    while pending:
+        for request_id in list(pending):
+            status = get_mutation_status(request_id, coda_config)
+            if status.get("completed"):
+                pending.remove(request_id)
+                completed.append(request_id)
+                if status.get("warning"):
+                    warnings[request_id] = status["warning"]
+        if not pending or time.monotonic() + poll_interval > deadline:
+            break
+        time.sleep(poll_interval)
+    return {"completed": completed, "pending": pending, "warnings": warnings}
@@ -0,0 +1,122 @@
+"""
+Idempotency cache for Telegram updates.
+
+Telegram redelivers an update whenever the webhook is slow or fails, and a
+restarted poller may see the same message again. Keys are remembered in a
+bounded in-memory LRU and, optionally, in a shared SQLite table so separate
+processes (or warm serverless instances on the same disk) agree on what has
+already been handled.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from src import storage
+
+# Number of keys remembered (per process, and in the shared table)
+DEDUP_CAPACITY = int(os.getenv("DEDUP_CAPACITY", "10000"))
+# "memory" keeps keys in-process only; "sqlite" also shares them on disk
+DEDUP_STORE = os.getenv("DEDUP_STORE", "memory").lower()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS processed_updates (
+    key TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS processed_updates_seen_at ON processed_updates (seen_at);
+"""
+
+def update_key(update_id):
+    """Key for a webhook update"""
+    return f"u:{update_id}"
+
+def message_key(chat_id, message_id):
+    """Key for a polled message"""
+    return f"m:{chat_id}:{message_id}"
+
+class UpdateDeduplicator:
+    """Bounded set of already-processed update keys"""
+
+    def __init__(self, capacity=DEDUP_CAPACITY, store=DEDUP_STORE, path=None):
+        self.capacity = max(1, capacity)
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._inserts = 0
+
+        if store == "sqlite":
+            self._conn = storage.connect(path)
+            self._conn.executescript(SCHEMA)
+
+    def seen(self, key):
+        """Return True if ``key`` has already been processed"""
+        with self._lock:
+            if key in self._recent:
+                self._recent.move_to_end(key)
+                return True
+            if self._conn is None:
+                return False
+
+            row = self._conn.execute(
+                "SELECT 1 FROM processed_updates WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._remember(key)
+                return True
+            return False
+
+    def add(self, key):
+        """Mark ``key`` as processed"""
+        self.claim(key)
+
+    def claim(self, key):
+        """
+        Atomically mark ``key`` as processed unless it already was
+
+        Concurrent deliveries of the same update race on this single check,
+        so exactly one of them gets True and goes on to handle it.
+
+        Returns:
+            True if ``key`` was new
+        """
+        with self._lock:
+            if key in self._recent:
+                self._recent.move_to_end(key)
+                return False
+            if self._conn is None:
+                self._remember(key)
+                return True
+
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO processed_updates (key, seen_at) VALUES (?, ?)",
+                (key, time.time())
+            )
+            if cursor.rowcount == 0:
+                # Another process claimed it first; not cached, as it may still release it
+                return False
+            self._remember(key)
+            # Trim the shared table now and then rather than on every insert
+            self._inserts += 1
+            if self._inserts % 100 == 0:
+                self._conn.execute(
+                    "DELETE FROM processed_updates WHERE key NOT IN "
+                    "(SELECT key FROM processed_updates ORDER BY seen_at DESC LIMIT ?)",
+                    (self.capacity,)
+                )
+            return True
+
+    def release(self, key):
+        """Forget a claimed ``key`` whose handling failed, so a redelivery is processed"""
+        with self._lock:
+            self._recent.pop(key, None)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM processed_updates WHERE key = ?", (key,))
+
+    def _remember(self, key):
+        """Insert into the in-memory LRU, evicting the oldest key when full"""
+        self._recent[key] = True
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.capacity:
+            self._recent.popitem(last=False)
@@ -0,0 +1,159 @@
+"""
+Per-chat ordered, cross-chat parallel dispatch of bot handlers.
+
+telebot hands every update to a shared thread pool, so one slow Coda write can
+occupy all workers and two messages from the same chat can be answered out of
+order. LaneDispatcher hashes each chat id to one of BOT_LANES lanes. A lane is
+a bounded queue with a single worker thread: updates of one chat run in order,
+different chats run in parallel, and a full lane blocks the caller instead of
+growing without limit. The caller is telebot's single polling thread, so while
+one lane is full no update of any chat is dispatched; BOT_LANE_QUEUE_SIZE
+trades that stall against memory.
+
+Commands and admin traffic go to a separate priority lane with its own
+workers, so /stats still answers while a burst of links backs up the lanes.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+
+import telebot
+
+from src.monitoring import monitor
+
+# Worker lanes; throughput scales with active chats up to this number
+BOT_LANES = int(os.getenv("BOT_LANES", "8"))
+# Updates one lane may queue before the poller waits for it
+BOT_LANE_QUEUE_SIZE = int(os.getenv("BOT_LANE_QUEUE_SIZE", "100"))
+# Workers reserved for the priority lane
+BOT_PRIORITY_WORKERS = int(os.getenv("BOT_PRIORITY_WORKERS", "1"))
+
+logger = logging.getLogger("Dispatch")
+
+def chat_key(update):
+    """
+    Return the chat id an update belongs to, or None
+
+    Works for messages and for updates that wrap one (callback queries).
+    """
+    chat = getattr(update, "chat", None)
+    if chat is None:
+        chat = getattr(getattr(update, "message", None), "chat", None)
+    return getattr(chat, "id", None)
+
+class LaneDispatcher:
+    """Runs tasks on lanes chosen by key; tasks sharing a key run in order"""
+
+    def __init__(self, lanes=BOT_LANES, queue_size=BOT_LANE_QUEUE_SIZE, priority_workers=BOT_PRIORITY_WORKERS):
+        self.lanes = [queue.Queue(maxsize=queue_size) for _ in range(max(1, lanes))]
+        self.priority_lane = queue.Queue(maxsize=queue_size)
+        self.priority_workers = max(1, priority_workers)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def lane_for(self, key):
+        """Index of the lane that handles ``key``"""
+        return hash(key) % len(self.lanes) if key is not None else 0
+
+    def submit(self, key, task, *args, **kwargs):
+        """
+        Queue a task on its key's lane, blocking while that lane is full
+
+        The block holds up the caller for every key, not just this lane's.
+        """
+        self._ensure_started()
+        self.lanes[self.lane_for(key)].put((task, args, kwargs))
+
+    def submit_priority(self, task, *args, **kwargs):
+        """Queue a task on the priority lane, which bulk work never occupies"""
+        self._ensure_started()
+        self.priority_lane.put((task, args, kwargs))
+
+    def depths(self):
+        """Queued tasks per lane"""
+        return [lane.qsize() for lane in self.lanes]
+
+    def queue_depths(self):
+        """Queued tasks on the priority lane and on each regular lane"""
+        return {"priority": self.priority_lane.qsize(), "lanes": self.depths()}
+
+    def join(self, timeout=None):
+        """
+        Wait until every queued task has run
+
+        Returns:
+            True if the lanes are empty, False if ``timeout`` expired first
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for lane in [self.priority_lane] + self.lanes:
+            with lane.all_tasks_done:
+                while lane.unfinished_tasks:
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    lane.all_tasks_done.wait(remaining)
+        return True
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for index, lane in enumerate(self.lanes):
+                thread = threading.Thread(target=self._run, args=(lane,), name=f"lane-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            for index in range(self.priority_workers):
+                thread = threading.Thread(target=self._run, args=(self.priority_lane,),
+                                          name=f"lane-priority-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop the lane workers after their current task; call join() first to run queued tasks"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self, lane):
+        """Lane worker loop"""
+        while not self._stop.is_set():
+            try:
+                task, args, kwargs = lane.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                task(*args, **kwargs)
+            except Exception as e:
+                monitor.record_error(e, "Handler error")
+            finally:
+                lane.task_done()
+
+class LaneTeleBot(telebot.TeleBot):
+    """
+    TeleBot whose handlers run on a LaneDispatcher keyed by chat id
+
+    ``is_priority(update)`` selects the updates sent to the priority lane.
+    """
+
+    def __init__(self, token, lanes=BOT_LANES, lane_queue_size=BOT_LANE_QUEUE_SIZE,
+                 priority_workers=BOT_PRIORITY_WORKERS, is_priority=None, **kwargs):
+        # Lanes replace telebot's own worker pool
+        kwargs["threaded"] = False
+        super().__init__(token, **kwargs)
+        self.dispatcher = LaneDispatcher(lanes, lane_queue_size, priority_workers)
+        self.is_priority = is_priority
+
+    def _exec_task(self, task, *args, **kwargs):
+        update = args[0] if args else None
+        if self.is_priority is not None and update is not None and self.is_priority(update):
+            self.dispatcher.submit_priority(task, *args, **kwargs)
+        else:
+            self.dispatcher.submit(chat_key(update), task, *args, **kwargs)
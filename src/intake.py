@@ -0,0 +1,52 @@
+"""
+Link intake shared by the polling bot and the webhook.
+
+Every extracted link is reduced to its shortcode, checked against the index
+of reels already saved, and - if new - recorded in the outbox for the drainer
+to write to Coda.
+"""
+
+from src.links import canonicalize_instagram_link
+from src.monitoring import monitor
+
+# Outcome of accepting a single link
+LINK_ACCEPTED = "accepted"
+LINK_DUPLICATE = "duplicate"
+LINK_FAILED = "failed"
+
+class LinkIntake:
+    """Deduplicate links by shortcode and record new ones in the outbox"""
+
+    def __init__(self, outbox, shortcode_index):
+        self.outbox = outbox
+        self.shortcode_index = shortcode_index
+
+    def accept(self, links, chat_id=None, message_id=None, sender=None, notify=False):
+        """
+        Accept the links of one message
+
+        Returns:
+            List of (link, outcome, detail) tuples, where detail is the outbox
+            entry id for accepted links and the shortcode for duplicates
+        """
+        results = []
+        for link in links:
+            shortcode = canonicalize_instagram_link(link) or link
+
+            # Known reels (including repeats within this message) skip Coda entirely
+            if not self.shortcode_index.add(shortcode, link):
+                monitor.record_duplicate_link()
+                results.append((link, LINK_DUPLICATE, shortcode))
+                continue
+
+            try:
+                entry_id = self.outbox.add(
+                    link, chat_id=chat_id, message_id=message_id, sender=sender, notify=notify
+                )
+            except Exception:
+                # Not recorded, so it must not count as saved
+                self.shortcode_index.discard(shortcode)
+                raise
+            results.append((link, LINK_ACCEPTED, entry_id))
+
+        return results
@@ -0,0 +1,209 @@
+"""
+Extraction and canonical form of Instagram links.
+
+The same reel can arrive as ``/reel/X/``, ``/p/X?hl=en``, ``/reels/X`` or
+``instagram.com/username/reel/X``; all of them reduce to the shortcode ``X``.
+
+Links are taken from the ``url``/``text_link`` entities Telegram already
+parsed when a message carries them, and otherwise found by a linear-time
+scanner: one ``finditer`` pass of a host-anchored pattern whose quantifiers
+are all bounded, so no input can trigger catastrophic backtracking.
+"""
+
+import re
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+# Path segments that are followed by a media shortcode, mapped to the link type
+MEDIA_SEGMENTS = {
+    "reel": "reel",
+    "reels": "reel",
+    "p": "post",
+    "tv": "tv",
+}
+
+SHORTCODE_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Paths that look like media links but are not (``/reels/audio/<id>/``)
+NON_MEDIA_SEGMENTS = {"audio"}
+
+def canonicalize_instagram_link(link):
+    """
+    Reduce an Instagram link to its media shortcode
+
+    Returns:
+        The shortcode, or None if the link does not point at a reel/post/tv.
+        Share links (``/share/reel/X``) carry an opaque id rather than the
+        media shortcode, so they are returned as ``share:X``.
+    """
+    media = parse_instagram_link(link)
+    return media[0] if media else None
+
+def parse_instagram_link(link):
+    """
+    Return (shortcode, link_type) for an Instagram media link, or None
+
+    link_type is one of "reel", "post", "tv" or "share".
+    """
+    if "://" not in link:
+        link = "https://" + link
+
+    try:
+        parts = urlsplit(link)
+    except ValueError:
+        return None
+
+    host = (parts.hostname or "").lower()
+    if host not in ("instagram.com", "www.instagram.com", "m.instagram.com"):
+        return None
+
+    segments = [segment for segment in parts.path.split("/") if segment]
+
+    if len(segments) >= 3 and segments[0] == "share" and segments[1] in MEDIA_SEGMENTS:
+        if SHORTCODE_PATTERN.match(segments[2]):
+            return f"share:{segments[2]}", "share"
+        return None
+
+    # /reel/X, /p/X, /tv/X, optionally preceded by a username
+    for index in (0, 1):
+        if len(segments) > index + 1 and segments[index] in MEDIA_SEGMENTS:
+            shortcode = segments[index + 1]
+            if SHORTCODE_PATTERN.match(shortcode) and shortcode not in NON_MEDIA_SEGMENTS:
+                return shortcode, MEDIA_SEGMENTS[segments[index]]
+            return None
+
+    return None
+
+# A link found in a message: the URL as written, its shortcode and link type
+InstagramLink = namedtuple("InstagramLink", ["url", "shortcode", "link_type"])
+
+# Subdomains that may precede the host
+HOST_PREFIXES = ("www.", "m.")
+
+# Characters that may not precede the host, so hosts such as notinstagram.com
+# or evil-instagram.com do not match
+HOST_BOUNDARY_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789.-")
+
+# Matched against the lowercased text. The pattern starts with the host
+# literal, so the regex engine skips to its occurrences with a fast literal
+# search instead of trying every position. Every quantifier is bounded and the
+# alternatives cannot overlap, so each match attempt does constant work.
+MEDIA_LINK_PATTERN = re.compile(
+    r'instagram\.com/'
+    r'(?:(share)/|[a-z0-9_.]{1,30}/)?'  # share link or optional username
+    r'(reels?|p|tv)/'                   # media segment
+    r'(?!audio(?![a-z0-9_-]))'          # /reels/audio/<id>/ is not a reel
+    r'([a-z0-9_-]{1,64})'               # shortcode
+    r'/?(?:\?[^\s]{0,512})?'             # optional trailing slash and query
+)
+
+# Schemes that may precede the host
+LINK_PREFIXES = ("https://", "http://")
+
+# Lowercases ASCII only, so offsets in the folded text match the original
+ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+def scan_instagram_links(text):
+    """
+    Find Instagram media links in plain text in a single pass
+
+    The host is matched case-insensitively, as in parse_instagram_link; the
+    path and the shortcode are taken from the original text.
+
+    Returns:
+        List of InstagramLink, de-duplicated by shortcode, in order of appearance
+    """
+    links = []
+    seen = set()
+    if not text:
+        return links
+
+    folded = text.lower()
+    if len(folded) != len(text):
+        # A few non-ASCII characters change length when lowercased
+        folded = text.translate(ASCII_LOWER)
+
+    for match in MEDIA_LINK_PATTERN.finditer(folded):
+        share = match.group(1)
+        # The segment and shortcode are case-sensitive, so read them as written
+        segment = text[match.start(2):match.end(2)]
+        shortcode = text[match.start(3):match.end(3)]
+        key = f"share:{shortcode}" if share else shortcode
+        if key in seen or segment not in MEDIA_SEGMENTS:
+            continue
+
+        start = match.start()
+        window = folded[max(0, start - 4):start]
+        for prefix in HOST_PREFIXES:
+            if window.endswith(prefix):
+                start -= len(prefix)
+                break
+        if start > 0 and text[start - 1] in HOST_BOUNDARY_CHARS:
+            continue
+        if not SHORTCODE_PATTERN.match(shortcode):
+            continue
+        seen.add(key)
+
+        window = folded[max(0, start - 8):start]
+        for prefix in LINK_PREFIXES:
+            if window.endswith(prefix):
+                start -= len(prefix)
+                break
+        link_type = "share" if share else MEDIA_SEGMENTS[segment]
+        links.append(InstagramLink(text[start:match.end()], key, link_type))
+
+    return links
+
+def extract_message_links(text, entities=None):
+    """
+    Extract Instagram links from message text, preferring Telegram's entities
+
+    Args:
+        text: The message text or caption
+        entities: The matching ``entities``/``caption_entities``, either as
+            telebot MessageEntity objects or as webhook dictionaries
+
+    Returns:
+        List of InstagramLink, de-duplicated by shortcode
+    """
+    candidates = []
+    for entity in entities or []:
+        entity_type = _entity_field(entity, "type")
+        if entity_type == "text_link":
+            candidates.append(_entity_field(entity, "url") or "")
+        elif entity_type == "url":
+            candidates.append(_entity_text(text, entity))
+
+    if not candidates:
+        return scan_instagram_links(text)
+
+    links = []
+    seen = set()
+    for candidate in candidates:
+        _append_link(links, seen, candidate)
+    return links
+
+def _append_link(links, seen, url):
+    """Parse a candidate URL and keep it if it is a new media link"""
+    media = parse_instagram_link(url)
+    if media and media[0] not in seen:
+        seen.add(media[0])
+        links.append(InstagramLink(url, media[0], media[1]))
+
+def _entity_field(entity, name):
+    """Read a field from a MessageEntity object or an entity dictionary"""
+    if isinstance(entity, dict):
+        return entity.get(name)
+    return getattr(entity, name, None)
+
+def _entity_text(text, entity):
+    """
+    Slice the text covered by an entity
+
+    Telegram measures offsets in UTF-16 code units, so the slice is taken on
+    the UTF-16 encoding to stay correct after emoji and other astral characters.
+    """
+    offset = _entity_field(entity, "offset") or 0
+    length = _entity_field(entity, "length") or 0
+    encoded = (text or "").encode("utf-16-le")
+    return encoded[offset * 2:(offset + length) * 2].decode("utf-16-le", errors="ignore")
@@ -0,0 +1,134 @@
+"""
+Coda update stage for scraped reel metrics.
+
+Maps Bright Data reel records to cells of the Reels table and upserts them
+with ``keyColumns`` on the Link column, a few hundred rows per request. With
+a shortcode -> row index, the Link value of each reel is taken from it, so it
+matches the stored cell exactly and the upsert never adds a row. Without one
+(the /api/brightdata route, which cannot afford a table sync per request) the
+link the reel was triggered with is used; it was read from that same cell.
+Records are consumed in fixed-size batches, so a streamed snapshot is never
+held in memory as a whole.
+"""
+
+import os
+import logging
+from itertools import islice
+
+from src import coda
+
+# Records mapped and written per batch
+METRICS_BATCH_SIZE = int(os.getenv("METRICS_BATCH_SIZE", "100"))
+# Seconds to wait for Coda to confirm the upserts (0 to not wait)
+METRICS_MUTATION_WAIT = float(os.getenv("METRICS_MUTATION_WAIT", "10"))
+
+logger = logging.getLogger("Metrics")
+
+def iter_batches(iterable, size):
+    """Yield lists of up to ``size`` items without materialising the iterable"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def record_link(record):
+    """Return the link a Bright Data record was scraped for"""
+    return (record.get("input") or {}).get("url") or record.get("url")
+
+def record_to_cells(record):
+    """Map a Bright Data reel record to Coda cells"""
+    return [
+        {"column": "Account", "value": record.get("username", record.get("user_posted", ""))},
+        {"column": "Name", "value": record.get("description", "")},
+        {"column": "Likes", "value": record.get("likes", 0)},
+        {"column": "Comments", "value": record.get("comments", record.get("num_comments", 0))},
+        {"column": "Views", "value": record.get("views", 0)}
+    ]
+
+def row_to_record(link, values):
+    """Rebuild the Bright Data fields of a reel from the cells record_to_cells wrote"""
+    return {
+        "url": link,
+        "user_posted": values.get("Account") or None,
+        "description": values.get("Name") or None,
+        "likes": values.get("Likes"),
+        "num_comments": values.get("Comments"),
+        "views": values.get("Views"),
+    }
+
+class MetricsUpdater:
+    """Write scraped records to their rows in the Reels table"""
+
+    def __init__(self, coda_config, row_index, batch_size=METRICS_BATCH_SIZE, cache=None,
+                 mutation_wait=METRICS_MUTATION_WAIT):
+        self.coda_config = coda_config
+        self.row_index = row_index  # Optional RowIndex resolving the stored Link cell
+        self.key_column = coda_config.get("column_name", "Link")
+        self.cache = cache  # Optional ScrapeCache that keeps every record we paid for
+        self.batch_size = max(1, batch_size)
+        self.mutation_wait = mutation_wait
+
+    def apply(self, records):
+        """
+        Upsert the metrics of every record into its Coda row
+
+        ``records`` may be any iterable, e.g. a streamed snapshot. Records
+        Bright Data could not scrape, and reels the row index has no row
+        for, are skipped.
+
+        Returns:
+            Dictionary with the rows ``updated``, records ``skipped``, upsert
+            ``requests`` sent and requests still ``pending`` in Coda
+
+        Raises:
+            requests.exceptions.RequestException: If a Coda call fails
+        """
+        updated = skipped = 0
+        request_ids = []
+        for batch in iter_batches(records, self.batch_size):
+            rows, scraped = self._map_batch(batch)
+            skipped += len(batch) - len(rows)
+            if rows:
+                request_ids.extend(coda.upsert_rows(rows, [self.key_column], self.coda_config))
+                updated += len(rows)
+            # Cached only once Coda took the batch, so a failed upsert is scraped again
+            if self.cache is not None:
+                for record in scraped:
+                    self.cache.put(record)
+
+        pending = len(request_ids)
+        if request_ids and self.mutation_wait > 0:
+            status = coda.wait_for_mutations(request_ids, self.coda_config, timeout=self.mutation_wait)
+            pending = len(status["pending"])
+            for request_id, warning in status["warnings"].items():
+                logger.warning(f"Coda mutation {request_id}: {warning}")
+
+        return {"updated": updated, "skipped": skipped, "requests": len(request_ids), "pending": pending}
+
+    def _map_batch(self, batch):
+        """
+        Return the upsert cells of the records of a batch that have a row,
+        and the records that were scraped successfully
+        """
+        rows = []
+        scraped = []
+        for record in batch:
+            link = record_link(record)
+            if not link or record.get("error"):
+                continue
+            scraped.append(record)
+
+            stored_link = link
+            if self.row_index is not None:
+                entry = self.row_index.find_entry(link, self.coda_config)
+                if not entry:
+                    logger.warning(f"No Coda row for scraped reel {link}")
+                    continue
+                stored_link = entry["link"] or link
+
+            # The key must equal the stored cell, or Coda would add a new row
+            key = {"column": self.key_column, "value": stored_link}
+            rows.append([key] + record_to_cells(record))
+        return rows, scraped
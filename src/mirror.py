@@ -0,0 +1,128 @@
+"""
+Local SQLite mirror of the Coda Reels table.
+
+The mirror is a read view over the rows RowIndex keeps: one incremental sync
+(Coda ``syncToken``) fills both the shortcode -> row id index and the cell
+values read here, so the table is copied once. The first sync pages through
+the whole table; later ones only receive rows changed since the last token.
+Deletions, which sync tokens do not report, are found by comparing the
+table's row ids with the local ones (ids only); the walk runs when the
+table's ``rowCount`` differs from the local count, and at least every
+ROW_INDEX_RECONCILE_INTERVAL seconds.
+
+Usage:
+    python -m src.mirror sync          # bring the mirror up to date
+    python -m src.mirror stats         # row count and last sync
+    python -m src.mirror get <link>    # show the mirrored row of a reel
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+
+from src.row_index import RowIndex
+from src.links import canonicalize_instagram_link
+
+logger = logging.getLogger("ReelsMirror")
+
+class ReelsMirror:
+    """Local, incrementally synced copy of the Reels table"""
+
+    def __init__(self, path=None, row_index=None):
+        # Share the worker's RowIndex so a sync run by either keeps both current
+        self.row_index = row_index or RowIndex(path)
+
+    # -- reads --------------------------------------------------------------
+
+    def get(self, link_or_shortcode):
+        """Return the mirrored row of a reel as a dict, or None"""
+        shortcode = canonicalize_instagram_link(link_or_shortcode) or link_or_shortcode
+        rows = self.row_index.row_values(shortcode=shortcode)
+        return self._to_dict(rows[0]) if rows else None
+
+    def get_row(self, row_id):
+        """Return a mirrored row by Coda row id, or None"""
+        rows = self.row_index.row_values(row_id=row_id)
+        return self._to_dict(rows[0]) if rows else None
+
+    def rows(self):
+        """Yield every mirrored row"""
+        for row in self.row_index.row_values():
+            yield self._to_dict(row)
+
+    def __len__(self):
+        return self.row_index.synced_count()
+
+    @property
+    def last_sync(self):
+        """Time of the last sync, or None before the first one"""
+        return self.row_index.last_synced_at()
+
+    @staticmethod
+    def _to_dict(row):
+        return {
+            "row_id": row["row_id"],
+            "shortcode": row["shortcode"],
+            "link": row["link"],
+            "values": json.loads(row["row_values"]),
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    # -- sync ---------------------------------------------------------------
+
+    def sync(self, coda_config):
+        """
+        Bring the mirror up to date
+
+        Returns:
+            Dictionary with the number of reels ``upserted``, rows ``deleted``
+            and whether this was a ``full`` load
+        """
+        full = not self.row_index.is_synced()
+        upserted = self.row_index.sync(coda_config)
+        deleted = 0 if full else self.row_index.prune_deleted(coda_config)
+        logger.info(f"Mirror {'full load' if full else 'delta sync'}: {upserted} reels, {deleted} removed")
+        return {"full": full, "upserted": upserted, "deleted": deleted}
+
+def main(argv=None):
+    """Command line entry point"""
+    from src.utils import get_required_env
+
+    parser = argparse.ArgumentParser(description="Local mirror of the Coda Reels table")
+    parser.add_argument("--db", help="SQLite path (defaults to DATA_DB_PATH)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("sync", help="bring the mirror up to date")
+    subparsers.add_parser("stats", help="show row count and last sync")
+    get_parser = subparsers.add_parser("get", help="show the mirrored row of a reel")
+    get_parser.add_argument("link", help="Instagram link or shortcode")
+    args = parser.parse_args(argv)
+
+    mirror = ReelsMirror(args.db)
+
+    if args.command == "sync":
+        coda_config = {
+            "api_key": get_required_env("CODA_API_KEY").strip(),
+            "doc_id": get_required_env("CODA_DOC_ID"),
+            "table_id": get_required_env("CODA_TABLE_ID"),
+            "column_name": "Link"
+        }
+        result = mirror.sync(coda_config)
+        kind = "Full load" if result["full"] else "Delta sync"
+        print(f"✅ {kind}: {result['upserted']} rows updated, {result['deleted']} removed, {len(mirror)} rows mirrored")
+    elif args.command == "stats":
+        print(f"Rows: {len(mirror)}")
+        last_sync = mirror.last_sync
+        print(f"Last sync: {time.ctime(last_sync) if last_sync else 'never synced'}")
+    elif args.command == "get":
+        row = mirror.get(args.link)
+        if row is None:
+            print(f"❌ Not in the mirror: {args.link}")
+            return 1
+        print(json.dumps(row, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -53,22 +53,39 @@ class BotMonitor:
             "messages_received": 0,
             "valid_links_received": 0,
             "invalid_links_received": 0,
+            "duplicate_links_received": 0,
             "successful_submissions": 0,
             "failed_submissions": 0,
             "errors": 0,
+            "messages_admitted": 0,
+            "messages_deferred": 0,
+            "telegram_throttled": 0,
+            "telegram_delayed": 0,
             "last_activity": self.start_time.isoformat()
         }
         self.logger = logging.getLogger("BotMonitor")
         self.log_path = "logs/stats.json"
+        # Optional callable returning {"priority": depth, "lanes": [depths]}
+        self.queue_depths = None
+        # Submissions are counted by the outbox drainer of whichever process runs it
+        self.drains_outbox = True
+    
+    def set_queue_depths(self, provider):
+        """Report dispatch queue depths from ``provider`` in the status report"""
+        self.queue_depths = provider
+    
+    def set_drains_outbox(self, drains):
+        """Tell whether this process drains the outbox, and so counts submissions"""
+        self.drains_outbox = drains
     
     def record_message(self):
         """Record a received message"""
         self.stats["messages_received"] += 1
         self.update_activity()
     
-    def record_valid_link(self):
-        """Record a valid Instagram link"""
-        self.stats["valid_links_received"] += 1
+    def record_valid_link(self, count=1):
+        """Record ``count`` valid Instagram links"""
+        self.stats["valid_links_received"] += count
         self.update_activity()
     
     def record_invalid_link(self):
@@ -76,6 +93,11 @@ class BotMonitor:
         self.stats["invalid_links_received"] += 1
         self.update_activity()
     
+    def record_duplicate_link(self):
+        """Record a link that was already saved"""
+        self.stats["duplicate_links_received"] += 1
+        self.update_activity()
+    
     def record_successful_submission(self):
         """Record a successful submission to Coda"""
         self.stats["successful_submissions"] += 1
@@ -86,6 +108,24 @@ class BotMonitor:
         self.stats["failed_submissions"] += 1
         self.update_activity()
     
+    def record_admitted(self):
+        """Record a message whose links were processed right away"""
+        self.stats["messages_admitted"] += 1
+        self.update_activity()
+    
+    def record_deferred(self):
+        """Record a message whose links were deferred under load"""
+        self.stats["messages_deferred"] += 1
+        self.update_activity()
+    
+    def record_throttled_send(self):
+        """Record a Telegram call answered with 429 and retried later"""
+        self.stats["telegram_throttled"] += 1
+    
+    def record_delayed_send(self):
+        """Record a Telegram call held back by the rate limiter"""
+        self.stats["telegram_delayed"] += 1
+    
     def record_error(self, error, error_type="General Error"):
         """Record an error with details"""
         self.stats["errors"] += 1
@@ -125,17 +165,33 @@ class BotMonitor:
         uptime = datetime.now() - self.start_time
         uptime_str = f"{uptime.days}d {uptime.seconds // 3600}h {(uptime.seconds // 60) % 60}m"
         
-        return (
+        report = (
             f"📊 Bot Status Report 📊\n\n"
             f"🕒 Uptime: {uptime_str}\n"
             f"📨 Messages: {self.stats['messages_received']}\n"
             f"✅ Valid links: {self.stats['valid_links_received']}\n"
             f"❌ Invalid links: {self.stats['invalid_links_received']}\n"
+            f"🔁 Duplicate links: {self.stats['duplicate_links_received']}\n"
             f"📤 Successful submissions: {self.stats['successful_submissions']}\n"
             f"📥 Failed submissions: {self.stats['failed_submissions']}\n"
             f"⚠️ Errors: {self.stats['errors']}\n"
+            f"🚪 Admitted / deferred: {self.stats['messages_admitted']} / {self.stats['messages_deferred']}\n"
+            f"🐢 Replies throttled / delayed: {self.stats['telegram_throttled']} / {self.stats['telegram_delayed']}\n"
             f"🔄 Last activity: {self.format_time_ago(self.stats['last_activity'])}"
         )
+        
+        if not self.drains_outbox:
+            report += "\nℹ️ Submissions are made by the worker draining the outbox and are not counted here"
+        
+        if self.queue_depths is not None:
+            depths = self.queue_depths()
+            lanes = ", ".join(str(depth) for depth in depths["lanes"])
+            report += (
+                f"\n🚦 Priority queue: {depths['priority']}\n"
+                f"🛣️ Lane queues: {lanes}"
+            )
+        
+        return report
     
     def format_time_ago(self, iso_time_str):
         """Format time as 'X minutes ago'"""
@@ -171,8 +227,5 @@ def error_handler(func):
             if os.getenv("ENVIRONMENT") == "development":
                 raise
             
-            # Return a suitable fallback value based on function context
-            if func.__name__ == "send_to_coda":
-                return False, f"Internal error: {str(e)}"
             return None
     return wrapper 
\ No newline at end of file
@@ -0,0 +1,302 @@
+"""
+Durable outbox for Coda writes.
+
+Every extracted link is appended to a local SQLite table (WAL mode) before
+the user gets a reply. A drainer pushes pending entries to Coda in batches
+and retries failures with jittered exponential backoff, honouring the
+``Retry-After`` header Coda sends with 429 responses. Entries are never
+deleted; they move from ``pending`` to ``done``, or to ``failed`` when Coda
+rejects them with a client error that retrying cannot fix. Coda rejects a
+whole multi-row insert for one bad row, so a rejected batch is retried row by
+row before any entry is failed.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+
+from src import storage, transport
+from src.links import canonicalize_instagram_link
+from src.monitoring import monitor
+
+# Entries claimed per drain pass (one multi-row insert)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "25"))
+# Seconds the drainer sleeps when there is nothing due
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+# Backoff: base delay and cap, in seconds
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))
+# A claimed entry that was never resolved (e.g. crash) becomes due again after this
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Client errors that are worth retrying: a rotated or expired API key (401/403),
+# a doc or table that is briefly unavailable (404), timeouts and rate limits.
+# Any other 4xx is final
+RETRYABLE_CLIENT_ERRORS = {401, 403, 404, 408, 429}
+
+logger = logging.getLogger("Outbox")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    link TEXT NOT NULL,
+    chat_id INTEGER,
+    message_id INTEGER,
+    sender TEXT,
+    notify INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    row_id TEXT,
+    created_at REAL NOT NULL,
+    done_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+def backoff_delay(attempts, base=OUTBOX_BACKOFF_BASE, cap=OUTBOX_BACKOFF_MAX):
+    """Full-jitter exponential backoff for the given number of failed attempts"""
+    return random.uniform(0, min(cap, base * (2 ** max(0, attempts - 1))))
+
+def is_retryable(error):
+    """False when the error carries a 4xx response that retrying cannot fix"""
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if not isinstance(status_code, int):
+        return True
+    return not 400 <= status_code < 500 or status_code in RETRYABLE_CLIENT_ERRORS
+
+class LinkOutbox:
+    """Append-only SQLite log of links waiting to be written to Coda"""
+
+    def __init__(self, path=None):
+        self.conn = storage.connect(path)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+
+    def add(self, link, chat_id=None, message_id=None, sender=None, notify=False):
+        """Record a link and return its outbox entry id"""
+        now = time.time()
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT INTO outbox (link, chat_id, message_id, sender, notify, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (link, chat_id, message_id, sender, int(notify), now, now)
+            )
+            return cursor.lastrowid
+
+    def claim(self, limit=OUTBOX_BATCH_SIZE):
+        """
+        Take up to ``limit`` due entries for sending
+
+        Claimed entries are leased: their next attempt is pushed out by
+        OUTBOX_LEASE_SECONDS so a concurrent drainer skips them, and they
+        become due again if this one never reports back.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT * FROM outbox WHERE status = ? AND next_attempt_at <= ? "
+                    "ORDER BY id LIMIT ?",
+                    (STATUS_PENDING, now, limit)
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE outbox SET next_attempt_at = ? WHERE id = ?",
+                    [(now + OUTBOX_LEASE_SECONDS, row["id"]) for row in rows]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [dict(row) for row in rows]
+
+    def mark_done(self, entry_id, row_id=None):
+        """Mark an entry as written to Coda"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, row_id = ?, done_at = ?, last_error = NULL WHERE id = ?",
+                (STATUS_DONE, row_id, time.time(), entry_id)
+            )
+
+    def mark_retry(self, entry_id, error, delay):
+        """Record a failed attempt and schedule the next one ``delay`` seconds out"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                (str(error), time.time() + delay, entry_id)
+            )
+
+    def mark_failed(self, entry_id, error):
+        """Record a final failed attempt; the entry is not claimed again"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ? WHERE id = ?",
+                (STATUS_FAILED, str(error), entry_id)
+            )
+
+    def statuses(self, entry_ids):
+        """Return a dict of entry id to status for the given ids"""
+        if not entry_ids:
+            return {}
+        placeholders = ",".join("?" for _ in entry_ids)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT id, status FROM outbox WHERE id IN ({placeholders})", list(entry_ids)
+            ).fetchall()
+        return {row["id"]: row["status"] for row in rows}
+
+    def pending_count(self):
+        """Return the number of entries not yet written to Coda"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = ?", (STATUS_PENDING,)
+            ).fetchone()[0]
+
+class OutboxDrainer:
+    """Push pending outbox entries to Coda through a CodaBatchWriter"""
+
+    def __init__(self, outbox, writer, batch_size=OUTBOX_BATCH_SIZE,
+                 poll_interval=OUTBOX_POLL_INTERVAL, on_done=None, row_index=None, shortcode_index=None):
+        self.outbox = outbox
+        self.writer = writer
+        self.row_index = row_index  # Optional RowIndex fed with the inserted row ids
+        self.shortcode_index = shortcode_index  # Optional ShortcodeIndex to forget failed links in
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.on_done = on_done  # Optional callback(entry, row_id) after each write
+        self._stop = threading.Event()
+        self._thread = None
+
+    def drain_once(self, timeout=None):
+        """
+        Send one batch of due entries
+
+        ``timeout`` bounds the Coda requests of this pass, in seconds; an
+        entry whose write did not finish in time is retried later.
+
+        Returns:
+            Tuple of (claimed_count, written_count)
+        """
+        entries = self.outbox.claim(self.batch_size)
+        if not entries:
+            return 0, 0
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        outcomes = self._send(entries, deadline)
+        rejected = [
+            index for index, (_, error) in enumerate(outcomes)
+            if error is not None and not is_retryable(error)
+        ]
+        if len(entries) > 1 and rejected:
+            # One bad row makes Coda reject the whole insert; resend row by row
+            # so only the entries Coda really refuses are failed
+            logger.warning(f"Coda rejected a batch of {len(entries)} entries, retrying them one by one")
+            for index in rejected:
+                outcomes[index] = self._send([entries[index]], deadline)[0]
+
+        written = 0
+        for entry, (row_id, error) in zip(entries, outcomes):
+            if error is not None:
+                monitor.record_failed_submission()
+                if not is_retryable(error):
+                    logger.error(f"Outbox entry {entry['id']} rejected by Coda, giving up: {error}")
+                    self.outbox.mark_failed(entry["id"], error)
+                    self._forget(entry)
+                    continue
+                delay = self._retry_delay(entry, error)
+                logger.warning(f"Outbox entry {entry['id']} failed, retrying in {delay:.1f}s: {error}")
+                self.outbox.mark_retry(entry["id"], error, delay)
+                continue
+
+            self.outbox.mark_done(entry["id"], row_id)
+            if self.row_index is not None and row_id:
+                self.row_index.record(entry["link"], row_id)
+            monitor.record_successful_submission()
+            written += 1
+            if self.on_done:
+                self.on_done(entry, row_id)
+
+        return len(entries), written
+
+    def _send(self, entries, deadline=None):
+        """Write entries through the batch writer and return (row_id, error) for each"""
+        timeout = max(0.1, deadline - time.monotonic()) if deadline is not None else None
+        futures = [self.writer.submit(entry["link"]) for entry in entries]
+        self.writer.flush(timeout=timeout)
+
+        outcomes = []
+        for future in futures:
+            try:
+                # The background flusher may hold the batch; do not wait past the deadline
+                outcomes.append((future.result(timeout), None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+
+    def give_up(self, entries, error):
+        """Fail entries that will not be retried and forget their shortcodes"""
+        for entry in entries:
+            self.outbox.mark_failed(entry["id"], error)
+            self._forget(entry)
+
+    def _forget(self, entry):
+        """Drop a failed entry's shortcode so the link can be sent again"""
+        if self.shortcode_index is None:
+            return
+        shortcode = canonicalize_instagram_link(entry["link"]) or entry["link"]
+        self.shortcode_index.discard(shortcode)
+
+    def drain(self, max_seconds=None):
+        """Drain due entries until none are left or ``max_seconds`` elapse, Coda requests included"""
+        deadline = time.monotonic() + max_seconds if max_seconds else None
+        total = 0
+        while deadline is None or time.monotonic() < deadline:
+            claimed, written = self.drain_once(deadline - time.monotonic() if deadline else None)
+            total += written
+            if claimed == 0:
+                break
+        return total
+
+    def _retry_delay(self, entry, error):
+        """Honour Retry-After on 429, otherwise back off with jitter"""
+        response = getattr(error, "response", None)
+        if response is not None and response.status_code == 429:
+            retry_after = transport.retry_after_seconds(response)
+            if retry_after is not None:
+                return retry_after
+        return backoff_delay(entry["attempts"] + 1)
+
+    def start(self):
+        """Run the drainer in a background daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-drainer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Ask the background thread to finish its current batch and exit"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        """Background loop"""
+        while not self._stop.is_set():
+            try:
+                claimed, _ = self.drain_once()
+            except Exception as e:
+                monitor.record_error(e, "Outbox drainer error")
+                claimed = 0
+            if claimed == 0:
+                self._stop.wait(self.poll_interval)
@@ -0,0 +1,274 @@
+"""
+Staged link -> metrics pipeline.
+
+link -> Coda insert -> Bright Data scrape -> snapshot poll -> Coda metrics update
+
+Each stage owns a bounded queue, a pool of worker threads and a batching
+policy (up to ``batch_size`` items, waiting at most ``batch_wait`` seconds to
+fill a batch). Workers hand their output to the next stage with a blocking
+put, so a slow stage fills its queue and stalls the stages before it instead
+of letting work pile up. Every stage keeps depth, latency and error counters.
+
+Stages take plain callables, so each one can be run alone against fakes.
+Items live in memory only; durable retries belong to the link outbox.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+
+# Default queue bound per stage
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "500"))
+# Worker threads of the Coda insert, scrape trigger and metrics update stages
+PIPELINE_INSERT_WORKERS = int(os.getenv("PIPELINE_INSERT_WORKERS", "1"))
+PIPELINE_SCRAPE_WORKERS = int(os.getenv("PIPELINE_SCRAPE_WORKERS", "1"))
+PIPELINE_UPDATE_WORKERS = int(os.getenv("PIPELINE_UPDATE_WORKERS", "1"))
+
+logger = logging.getLogger("Pipeline")
+
+class StageStats:
+    """Counters of one stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+        self.batches = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record_batch(self, size, latency, failed=False):
+        with self.lock:
+            self.batches += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            if failed:
+                self.errors += size
+            else:
+                self.processed += size
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "processed": self.processed,
+                "errors": self.errors,
+                "batches": self.batches,
+                "latency_avg_ms": round(1000 * self.latency_total / self.batches, 1) if self.batches else 0.0,
+                "latency_max_ms": round(1000 * self.latency_max, 1),
+            }
+
+class Stage:
+    """
+    One pipeline stage
+
+    ``handler(batch)`` receives a list of items and returns an iterable of
+    outputs for the next stage (or None). If it raises, the batch is counted
+    as failed and dropped.
+    """
+
+    def __init__(self, name, handler, workers=1, batch_size=1, batch_wait=0.0, queue_size=PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = StageStats()
+        self.downstream = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def put(self, item, timeout=None):
+        """
+        Add an item, blocking while the queue is full
+
+        Raises:
+            queue.Full: If ``timeout`` expires first
+        """
+        self.queue.put(item, timeout=timeout)
+
+    def depth(self):
+        """Number of items waiting in the queue"""
+        return self.queue.qsize()
+
+    def start(self):
+        """Start the worker threads"""
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"stage-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stop the workers after their current batch"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _next_batch(self):
+        """Block for one item, then gather more for up to batch_wait seconds"""
+        try:
+            batch = [self.queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def process(self, batch):
+        """Run the handler on a batch and pass its outputs downstream"""
+        start = time.monotonic()
+        try:
+            outputs = list(self.handler(batch) or [])
+        except Exception as e:
+            self.stats.record_batch(len(batch), time.monotonic() - start, failed=True)
+            logger.error(f"Stage {self.name} failed on {len(batch)} items: {e}")
+            return
+        self.stats.record_batch(len(batch), time.monotonic() - start)
+
+        if self.downstream is not None:
+            for output in outputs:
+                # Blocks while the next stage is full: backpressure
+                self.downstream.put(output)
+
+    def _run(self):
+        """Worker loop"""
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.process(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+class Pipeline:
+    """A chain of stages; each stage's outputs feed the next one"""
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self._by_name = {stage.name: stage for stage in self.stages}
+        for upstream, downstream in zip(self.stages, self.stages[1:]):
+            upstream.downstream = downstream
+
+    def stage(self, name):
+        """Return a stage by name"""
+        return self._by_name[name]
+
+    def submit(self, item, stage=None, timeout=None):
+        """Feed an item into the first stage, or into the named one"""
+        target = self._by_name[stage] if stage else self.stages[0]
+        target.put(item, timeout=timeout)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def join(self):
+        """Wait until every queued item has passed through every stage"""
+        for stage in self.stages:
+            stage.queue.join()
+
+    def stop(self, drain=True, timeout=None):
+        """Stop all stages, first letting queued items finish when ``drain``"""
+        if drain:
+            self.join()
+        for stage in self.stages:
+            stage.stop(timeout)
+
+    def stats(self):
+        """Return {stage name: counters and current depth}"""
+        return {stage.name: {"depth": stage.depth(), **stage.stats.snapshot()} for stage in self.stages}
+
+def build_metrics_pipeline(coda_config, row_index, trigger, updater, poller,
+                           insert_batch_size=25, update_batch_size=100, batch_wait=1.0,
+                           queue_size=PIPELINE_QUEUE_SIZE, max_attempts=None,
+                           insert_workers=PIPELINE_INSERT_WORKERS, scrape_workers=PIPELINE_SCRAPE_WORKERS,
+                           update_workers=PIPELINE_UPDATE_WORKERS):
+    """
+    Wire the link -> metrics pipeline
+
+    Args:
+        coda_config: Dictionary with Coda configuration
+        row_index: RowIndex fed with the ids of inserted rows
+        trigger: BatchedScrapeTrigger that packs links into Bright Data jobs
+        updater: MetricsUpdater that upserts scraped records
+        poller: SnapshotPoller; its ``on_ready`` is pointed at the update stage.
+            None when Bright Data delivers snapshots to /api/brightdata: the
+            pipeline then ends once the scrape is triggered
+        max_attempts: Failed snapshots in a row after which a reel is no
+            longer scraped again (defaults to SCRAPE_MAX_ATTEMPTS)
+        insert_workers, scrape_workers, update_workers: Threads of the
+            coda_insert, scrape_trigger and metrics_update stages
+
+    Links enter at ``coda_insert``; links already in Coda can be submitted
+    straight to ``scrape_trigger``. The scrape stage only queues reels and
+    sends the batches that are due; the owner must call ``trigger.flush()``
+    periodically so partial batches go out after their max wait. Finished
+    snapshots are marked ready or failed in the trigger's table; the reels of
+    a failed one are scraped again, up to ``max_attempts`` times.
+    """
+    from src import coda
+    from src.brightdata import SNAPSHOT_READY, SNAPSHOT_FAILED, SCRAPE_MAX_ATTEMPTS
+
+    if max_attempts is None:
+        max_attempts = SCRAPE_MAX_ATTEMPTS
+
+    def insert(links):
+        added = coda.insert_rows(links, coda_config).get("addedRowIds") or []
+        for link, row_id in zip(links, added):
+            row_index.record(link, row_id)
+        return links
+
+    def scrape(links):
+        # Reels whose cached metrics are still fresh are not scraped again
+        for link in links:
+            trigger.enqueue(link)
+        return trigger.flush()
+
+    def track(snapshot_ids):
+        for snapshot_id in snapshot_ids:
+            poller.add(snapshot_id)
+
+    def update(records):
+        updater.apply(records)
+
+    scrape_stage = Stage("scrape_trigger", scrape, workers=scrape_workers, batch_size=trigger.max_batch_size,
+                         batch_wait=batch_wait, queue_size=queue_size)
+    update_stage = Stage("metrics_update", update, workers=update_workers, batch_size=update_batch_size,
+                         batch_wait=batch_wait, queue_size=queue_size)
+
+    def on_failed(snapshot_id, status):
+        trigger.mark_snapshot(snapshot_id, SNAPSHOT_FAILED)
+        reels = trigger.shortcodes_for(snapshot_id)
+        links = [link for shortcode, link in reels.items() if trigger.failed_attempts(shortcode) < max_attempts]
+        logger.warning(f"Snapshot {snapshot_id} {status}, scraping {len(links)} of its {len(reels)} reels again")
+        for link in links:
+            scrape_stage.put(link)
+
+    def on_ready(snapshot_id, records):
+        # Blocks the poller worker while the update stage is full; a broken
+        # download raises before the snapshot is marked, so the poller retries
+        for record in records:
+            update_stage.put(record)
+        trigger.mark_snapshot(snapshot_id, SNAPSHOT_READY)
+
+    stages = [
+        Stage("coda_insert", insert, workers=insert_workers, batch_size=insert_batch_size,
+              batch_wait=batch_wait, queue_size=queue_size),
+        scrape_stage,
+    ]
+    if poller is not None:
+        poller.on_ready = on_ready
+        poller.on_failed = on_failed
+        stages += [Stage("snapshot_poll", track, batch_size=50, queue_size=queue_size), update_stage]
+    return Pipeline(stages)
@@ -0,0 +1,284 @@
+"""
+Metrics refresh scheduler.
+
+Views and likes move fast in a reel's first days and barely at all after
+that, so each reel is refreshed on an interval that grows with its age:
+REFRESH_BASE_INTERVAL for a new reel, one more base interval per day of age,
+capped at REFRESH_MAX_INTERVAL. Reels sit in a priority queue ordered by
+next-due time; every tick takes the due ones (youngest first on ties) within
+the daily record budget and sends them to Bright Data as batched jobs.
+
+Usage:
+    python -m src.refresh                   # queue due reels and trigger jobs
+    python -m src.refresh --dry-run         # show what would run and what it costs
+    python -m src.refresh --dry-run --days 7
+"""
+
+import os
+import sys
+import time
+import heapq
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+
+from src import storage
+from src.links import canonicalize_instagram_link
+
+DAY = 86400
+
+# Refresh interval of a brand-new reel; one more is added per day of age
+REFRESH_BASE_INTERVAL = float(os.getenv("REFRESH_BASE_INTERVAL", "21600"))
+# Longest interval, for old reels
+REFRESH_MAX_INTERVAL = float(os.getenv("REFRESH_MAX_INTERVAL", str(30 * DAY)))
+# Bright Data records the scheduler may spend per UTC day
+REFRESH_DAILY_BUDGET = int(os.getenv("REFRESH_DAILY_BUDGET", "500"))
+# Price of one scraped record, for cost projections
+REFRESH_COST_PER_RECORD = float(os.getenv("REFRESH_COST_PER_RECORD", "0.0015"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS refresh_schedule (
+    shortcode TEXT PRIMARY KEY,
+    link TEXT NOT NULL,
+    posted_at REAL NOT NULL,
+    next_due REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refresh_budget (
+    day TEXT PRIMARY KEY,
+    used INTEGER NOT NULL
+);
+"""
+
+logger = logging.getLogger("RefreshScheduler")
+
+def refresh_interval(age, base=REFRESH_BASE_INTERVAL, cap=REFRESH_MAX_INTERVAL):
+    """Return the refresh interval, in seconds, of a reel ``age`` seconds old"""
+    return min(cap, base * (1 + max(0, age) / DAY))
+
+def parse_timestamp(value):
+    """Convert an ISO 8601 string (Coda or Bright Data) or a number to epoch seconds"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+def budget_day(now):
+    """Return the UTC date the daily budget of ``now`` is counted against"""
+    return datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d")
+
+class RefreshScheduler:
+    """Priority queue of reels by next metrics refresh"""
+
+    def __init__(self, trigger, path=None, daily_budget=REFRESH_DAILY_BUDGET,
+                 base_interval=REFRESH_BASE_INTERVAL, max_interval=REFRESH_MAX_INTERVAL):
+        self.trigger = trigger  # BatchedScrapeTrigger the due reels are sent to
+        self.daily_budget = daily_budget
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.conn = storage.connect(path)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+            rows = self.conn.execute("SELECT * FROM refresh_schedule").fetchall()
+        # (next_due, -posted_at, shortcode): the youngest reel wins a tie
+        self._reels = {row["shortcode"]: dict(row) for row in rows}
+        self._heap = [(row["next_due"], -row["posted_at"], row["shortcode"]) for row in rows]
+        heapq.heapify(self._heap)
+
+    def interval(self, posted_at, now):
+        """Refresh interval of a reel posted at ``posted_at``"""
+        return refresh_interval(now - posted_at, self.base_interval, self.max_interval)
+
+    def add(self, link, posted_at, last_scraped=None):
+        """
+        Schedule a reel; reels already scheduled are left alone
+
+        A reel that was never scraped is due immediately.
+
+        Returns:
+            True if the reel was added
+        """
+        shortcode = canonicalize_instagram_link(link)
+        if not shortcode or shortcode in self._reels:
+            return False
+        next_due = posted_at if last_scraped is None else last_scraped + self.interval(posted_at, last_scraped)
+        reel = {"shortcode": shortcode, "link": link, "posted_at": posted_at, "next_due": next_due}
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO refresh_schedule (shortcode, link, posted_at, next_due) VALUES (?, ?, ?, ?)",
+                (shortcode, link, posted_at, next_due)
+            )
+            self._reels[shortcode] = reel
+            heapq.heappush(self._heap, (next_due, -posted_at, shortcode))
+        return True
+
+    def load_mirror(self, mirror, cache=None):
+        """
+        Schedule every reel of a ReelsMirror
+
+        The post date comes from the scrape cache when known, otherwise from
+        the Coda row's creation time; the last scrape time from the cache.
+
+        Returns:
+            The number of reels added
+        """
+        added = 0
+        for row in mirror.rows():
+            if not row["link"]:
+                continue
+            cached = cache.get(row["link"]) if cache is not None else None
+            posted_at = parse_timestamp((cached or {}).get("posted_at")) or parse_timestamp(row["created_at"])
+            if posted_at is None:
+                continue
+            last_scraped = cache.scraped_at(row["link"]) if cache is not None else None
+            added += int(self.add(row["link"], posted_at, last_scraped))
+        return added
+
+    def __len__(self):
+        return len(self._reels)
+
+    def budget_left(self, now=None):
+        """Records still available in today's budget"""
+        now = now or time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT used FROM refresh_budget WHERE day = ?", (budget_day(now),)
+            ).fetchone()
+        return max(0, self.daily_budget - (row["used"] if row else 0))
+
+    def due(self, now=None):
+        """Return the number of reels due for a refresh"""
+        now = now or time.time()
+        with self.lock:
+            return sum(1 for reel in self._reels.values() if reel["next_due"] <= now)
+
+    def tick(self, now=None):
+        """
+        Send the due reels to Bright Data, within today's budget
+
+        Returns:
+            Dictionary with the reels ``due``, how many were ``queued`` and
+            the ``snapshots`` triggered
+
+        Raises:
+            Exception: Whatever the trigger raised; the reels it did not send
+                stay due and the budget is charged only for the sent ones
+        """
+        now = now or time.time()
+        due_count = self.due(now)
+        taken = self._pop_due(now, self.budget_left(now))
+
+        for reel in taken:
+            # The schedule decides freshness here, not the scrape cache TTL
+            self.trigger.enqueue(reel["link"], force=True)
+        error = None
+        try:
+            # Only the reels charged to the budget below are sent; anything
+            # else in the trigger's queue keeps its own batching
+            shortcodes = [reel["shortcode"] for reel in taken]
+            snapshot_ids = self.trigger.flush(shortcodes=shortcodes) if taken else []
+        except Exception as e:
+            snapshot_ids, error = [], e
+
+        # A failing flush leaves the reels it did not trigger in the trigger's
+        # queue; those keep their due time and go back on the heap
+        waiting = self.trigger.waiting([reel["shortcode"] for reel in taken]) if error else set()
+        sent = [reel for reel in taken if reel["shortcode"] not in waiting]
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO refresh_budget (day, used) VALUES (?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET used = used + excluded.used",
+                (budget_day(now), len(sent))
+            )
+            for reel in taken:
+                if reel["shortcode"] not in waiting:
+                    reel["next_due"] = now + self.interval(reel["posted_at"], now)
+                    self.conn.execute(
+                        "UPDATE refresh_schedule SET next_due = ? WHERE shortcode = ?",
+                        (reel["next_due"], reel["shortcode"])
+                    )
+                heapq.heappush(self._heap, (reel["next_due"], -reel["posted_at"], reel["shortcode"]))
+
+        if error is not None:
+            logger.error(f"Refresh tick: trigger failed with {len(waiting)} of {len(taken)} reels unsent: {error}")
+            raise error
+        logger.info(f"Refresh tick: {due_count} due, {len(sent)} queued, {len(snapshot_ids)} jobs")
+        return {"due": due_count, "queued": len(sent), "snapshots": snapshot_ids}
+
+    def _pop_due(self, now, limit):
+        """Pop up to ``limit`` due reels off the queue, earliest first"""
+        taken = []
+        with self.lock:
+            while self._heap and len(taken) < limit and self._heap[0][0] <= now:
+                taken.append(self._reels[heapq.heappop(self._heap)[2]])
+        return taken
+
+    def project(self, days=1, now=None, cost_per_record=REFRESH_COST_PER_RECORD):
+        """
+        Simulate the schedule without triggering anything
+
+        Returns:
+            Dictionary with the refreshes ``wanted`` over ``days``, the
+            ``records`` the budget allows, their ``cost`` and ``due_now``
+        """
+        now = now or time.time()
+        horizon = now + days * DAY
+        with self.lock:
+            heap = list(self._heap)
+        due_now = sum(1 for entry in heap if entry[0] <= now)
+
+        wanted = 0
+        while heap and heap[0][0] < horizon:
+            next_due, neg_posted, shortcode = heapq.heappop(heap)
+            when = max(next_due, now)
+            wanted += 1
+            heapq.heappush(heap, (when + self.interval(-neg_posted, when), neg_posted, shortcode))
+
+        records = min(wanted, self.daily_budget * days)
+        return {
+            "days": days,
+            "due_now": due_now,
+            "wanted": wanted,
+            "records": records,
+            "cost": records * cost_per_record,
+        }
+
+def main(argv=None):
+    """Command line entry point"""
+    from src.mirror import ReelsMirror
+    from src.scrape_cache import ScrapeCache
+    from src.brightdata import BatchedScrapeTrigger
+    from src.utils import get_required_env
+
+    parser = argparse.ArgumentParser(description="Refresh reel metrics, young reels first")
+    parser.add_argument("--db", help="SQLite path (defaults to DATA_DB_PATH)")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would be scraped and its cost")
+    parser.add_argument("--days", type=int, default=1, help="projection horizon for --dry-run")
+    args = parser.parse_args(argv)
+
+    api_key = os.getenv("BRIGHT_DATA_API_KEY", "") if args.dry_run else get_required_env("BRIGHT_DATA_API_KEY")
+    cache = ScrapeCache(args.db)
+    scheduler = RefreshScheduler(BatchedScrapeTrigger(api_key, path=args.db, cache=cache), args.db)
+    added = scheduler.load_mirror(ReelsMirror(args.db), cache)
+
+    if args.dry_run:
+        projection = scheduler.project(days=args.days)
+        print(f"Reels scheduled: {len(scheduler)} ({added} new)")
+        print(f"Due now: {projection['due_now']} (budget left today: {scheduler.budget_left()})")
+        print(f"Refreshes wanted in {args.days} day(s): {projection['wanted']}")
+        print(f"Records within budget: {projection['records']}")
+        print(f"Projected cost: ${projection['cost']:.2f}")
+        return 0
+
+    result = scheduler.tick()
+    print(f"✅ {result['queued']} of {result['due']} due reels sent in {len(result['snapshots'])} jobs")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""
+Aggregated replies: one Telegram message per incoming message.
+
+Instead of one reply per link, the outcomes of all links of a message are
+summarised in a single reply listing queued, duplicate and failed links. A
+long batch that is still being recorded after REPLY_PROGRESS_DELAY seconds
+gets a "processing N links…" message that is edited in place, at most once
+every REPLY_EDIT_INTERVAL seconds, and finally replaced by the summary. Fast
+batches only get the summary.
+"""
+
+import os
+import time
+import logging
+
+from src.intake import LINK_ACCEPTED, LINK_DUPLICATE
+
+# Messages with at least this many links get a progress message
+REPLY_PROGRESS_THRESHOLD = int(os.getenv("REPLY_PROGRESS_THRESHOLD", "5"))
+# Seconds a batch must take before its progress message is sent
+REPLY_PROGRESS_DELAY = float(os.getenv("REPLY_PROGRESS_DELAY", "2"))
+# Minimum seconds between two edits of the progress message
+REPLY_EDIT_INTERVAL = float(os.getenv("REPLY_EDIT_INTERVAL", "3"))
+
+# Links recorded between two progress updates
+PROGRESS_CHUNK_SIZE = 5
+
+# Telegram rejects longer message texts
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+logger = logging.getLogger("Replies")
+
+def progress_text(done, total):
+    """Text of the progress message"""
+    return f"⏳ Processing {total} links… {done}/{total} done"
+
+def summarize_results(results, admitted=True):
+    """
+    Build the single reply for a message's (link, outcome, detail) results
+
+    A message with one link gets the short reply for its outcome; longer
+    messages get the links grouped by outcome.
+    """
+    if len(results) == 1:
+        _, outcome, detail = results[0]
+        if outcome == LINK_ACCEPTED and not admitted:
+            return "⏳ Queued! We're busy right now; your link will be saved automatically."
+        if outcome == LINK_ACCEPTED:
+            return "✅ Link queued! It will appear in the DDF database shortly."
+        if outcome == LINK_DUPLICATE:
+            return "ℹ️ This reel is already saved in the DDF database."
+        return f"❌ Failed to save link. Error: {detail}. Please try again later."
+
+    accepted = [link for link, outcome, _ in results if outcome == LINK_ACCEPTED]
+    duplicates = [link for link, outcome, _ in results if outcome == LINK_DUPLICATE]
+    failed = [f"{link} ({detail})" for link, outcome, detail in results
+              if outcome not in (LINK_ACCEPTED, LINK_DUPLICATE)]
+
+    sections = [
+        ("⏳ Queued, will be saved automatically" if not admitted else "✅ Queued for the DDF database", accepted),
+        ("ℹ️ Already in the DDF database", duplicates),
+        ("❌ Failed, please try again later", failed),
+    ]
+    lines = [f"Processed {len(results)} links:"]
+    for title, links in sections:
+        if links:
+            lines.append("")
+            lines.append(f"{title} ({len(links)}):")
+            lines.extend(links)
+    return truncate("\n".join(lines))
+
+def truncate(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Cut a text at a line boundary so it fits in one Telegram message"""
+    if len(text) <= limit:
+        return text
+    # Leave room for the "… and N more lines" note
+    room = limit - 32
+    cut = text.rfind("\n", 0, room)
+    if cut <= 0:
+        # No line break to cut at: cut mid-line, which hides that line too
+        cut = room
+    hidden = text[cut:].count("\n") + (text[cut] != "\n")
+    return f"{text[:cut]}\n… and {hidden} more lines"
+
+class ProgressMessage:
+    """
+    A reply that is sent once and then edited in place
+
+    ``send(text)`` must return the sent message; ``edit(sent, text)``
+    replaces its text. Nothing is sent until an update comes ``start_delay``
+    seconds after the message was created, so fast work costs no extra
+    call. Intermediate updates are dropped when they come sooner than
+    ``min_interval`` after the previous edit. The final edit goes
+    through ``edit_final`` when given, which must raise if the edit failed;
+    the final text is then sent as a new reply instead.
+    """
+
+    def __init__(self, send, edit, edit_final=None, min_interval=REPLY_EDIT_INTERVAL,
+                 start_delay=REPLY_PROGRESS_DELAY, clock=time.monotonic):
+        self.send = send
+        self.edit = edit
+        self.edit_final = edit_final or edit
+        self.min_interval = min_interval
+        self.start_delay = start_delay
+        self.clock = clock
+        self.created_at = clock()
+        self.sent = None
+        self.text = None
+        self.edited_at = None
+
+    @property
+    def started(self):
+        return self.sent is not None
+
+    def start(self, text):
+        """Send the initial message; if that fails the caller replies normally"""
+        try:
+            self.sent = self.send(text)
+        except Exception as e:
+            logger.warning(f"Could not send progress message: {e}")
+            return
+        self.text = text
+        self.edited_at = self.clock()
+
+    def update(self, text, final=False):
+        """
+        Edit the message, unless it was edited too recently (final edits always go out)
+
+        The first update after ``start_delay`` sends the message instead.
+
+        Returns:
+            True if the message now shows ``text``
+        """
+        if not self.started:
+            if not final and self.clock() - self.created_at >= self.start_delay:
+                self.start(text)
+                return self.started
+            return False
+        if text == self.text:
+            return True
+        now = self.clock()
+        if not final and now - self.edited_at < self.min_interval:
+            return False
+        try:
+            (self.edit_final if final else self.edit)(self.sent, text)
+        except Exception as e:
+            logger.warning(f"Could not edit progress message: {e}")
+            return False
+        self.text = text
+        self.edited_at = now
+        return True
+
+    def finish(self, text):
+        """Replace the progress text with the final one, or send it as a new reply if that fails"""
+        if not self.started or self.update(text, final=True):
+            return
+        try:
+            self.send(text)
+        except Exception as e:
+            logger.error(f"Could not send the final reply: {e}")
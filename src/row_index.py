@@ -0,0 +1,236 @@
+"""
+Index from reel shortcode to Coda row id.
+
+Filled from the ``addedRowIds`` of our own inserts and from incremental,
+paginated syncs of the table (Coda ``syncToken``), so finding the row of a
+reel is a primary-key lookup instead of a scan over every cell of every row.
+The same syncs keep the cell values of every row, which src/mirror.py reads
+as the local copy of the Reels table.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from src import coda, storage
+from src.links import canonicalize_instagram_link
+
+# Seconds after which the row ids are compared with Coda's even when the row
+# counts agree, since a deletion and an insert between two checks cancel out
+ROW_INDEX_RECONCILE_INTERVAL = float(os.getenv("ROW_INDEX_RECONCILE_INTERVAL", "21600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS coda_rows (
+    shortcode TEXT PRIMARY KEY,
+    row_id TEXT NOT NULL,
+    link TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS coda_row_values (
+    row_id TEXT PRIMARY KEY,
+    shortcode TEXT,
+    link TEXT,
+    row_values TEXT NOT NULL,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS coda_row_values_shortcode ON coda_row_values (shortcode);
+CREATE TABLE IF NOT EXISTS row_index_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+logger = logging.getLogger("RowIndex")
+
+class RowIndex:
+    """Persistent shortcode -> Coda row id mapping"""
+
+    def __init__(self, path=None):
+        self.conn = storage.connect(path)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+            # Tokens from before row values were kept would never send the
+            # unchanged rows, so such databases start over with a full sync
+            if self.conn.execute("SELECT 1 FROM coda_row_values LIMIT 1").fetchone() is None:
+                self.conn.execute("DELETE FROM row_index_meta WHERE key = 'sync_token'")
+
+    def record(self, link, row_id):
+        """Remember the row id of a link; returns False if the link has no shortcode"""
+        shortcode = canonicalize_instagram_link(link)
+        if not shortcode or not row_id:
+            return False
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO coda_rows (shortcode, row_id, link, indexed_at) VALUES (?, ?, ?, ?)",
+                (shortcode, row_id, link, time.time())
+            )
+        return True
+
+    def lookup(self, link_or_shortcode):
+        """Return the row id for a link or shortcode, or None"""
+        entry = self.lookup_entry(link_or_shortcode)
+        return entry["row_id"] if entry else None
+
+    def lookup_entry(self, link_or_shortcode):
+        """Return ``{"row_id", "link"}`` for a link or shortcode, or None"""
+        shortcode = canonicalize_instagram_link(link_or_shortcode) or link_or_shortcode
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT row_id, link FROM coda_rows WHERE shortcode = ?", (shortcode,)
+            ).fetchone()
+        return {"row_id": row["row_id"], "link": row["link"]} if row else None
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM coda_rows").fetchone()[0]
+
+    def _get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM row_index_meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO row_index_meta (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def sync(self, coda_config):
+        """
+        Pull rows added or changed since the last sync
+
+        The first call walks the whole table page by page; later calls pass
+        the stored ``syncToken`` so Coda only returns what changed.
+
+        Returns:
+            The number of rows indexed
+        """
+        column_name = coda_config.get("column_name", "Link")
+        sync_token = self._get_meta("sync_token")
+
+        params = {"useColumnNames": "true", "valueFormat": "simple", "limit": 500}
+        if sync_token:
+            params["syncToken"] = sync_token
+
+        started = time.time()
+        indexed = 0
+        seen_ids = set()
+        while True:
+            page = coda.list_rows_page(coda_config, params)
+            for row in page.get("items", []):
+                seen_ids.add(row.get("id"))
+                link = row.get("values", {}).get(column_name)
+                self._store_values(row, link if isinstance(link, str) else None)
+                if isinstance(link, str) and self.record(link, row.get("id")):
+                    indexed += 1
+
+            next_page = page.get("nextPageToken")
+            if next_page:
+                params = {"pageToken": next_page}
+                continue
+
+            if page.get("nextSyncToken"):
+                self._set_meta("sync_token", page["nextSyncToken"])
+            break
+        self._set_meta("last_sync", str(time.time()))
+
+        if not sync_token:
+            # A full sync saw every row, so anything else was deleted in Coda
+            self._drop_rows_except(seen_ids)
+            self._set_meta("last_reconcile", str(started))
+
+        logger.info(f"Row index sync indexed {indexed} rows")
+        return indexed
+
+    def _store_values(self, row, link):
+        """Keep the cells of a synced row"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO coda_row_values "
+                "(row_id, shortcode, link, row_values, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (row["id"], canonicalize_instagram_link(link) if link else None, link,
+                 json.dumps(row.get("values", {})), row.get("createdAt"), row.get("updatedAt"))
+            )
+
+    def prune_deleted(self, coda_config, max_age=ROW_INDEX_RECONCILE_INTERVAL):
+        """
+        Drop rows deleted in Coda, which a syncToken sync does not report
+
+        The set of row ids is walked (ids only) and compared with the local
+        one when the table's ``rowCount`` differs from the number of synced
+        rows, or when the last comparison is older than ``max_age`` seconds:
+        a row deleted while another is added, but not yet synced, leaves the
+        counts equal.
+
+        Returns:
+            The number of rows removed
+        """
+        remote_count = coda.get_table(coda_config).get("rowCount")
+        reconciled_at = self._get_meta("last_reconcile")
+        overdue = reconciled_at is None or time.time() - float(reconciled_at) >= max_age
+        if remote_count is None or (remote_count == self.synced_count() and not overdue):
+            return 0
+
+        started = time.time()
+        # Ids only: every column is projected away as the pages arrive
+        remote_ids = {row["id"] for row in coda.iter_rows(coda_config, columns=[])}
+        removed = self._drop_rows_except(remote_ids)
+        self._set_meta("last_reconcile", str(started))
+        return removed
+
+    def _drop_rows_except(self, remote_ids):
+        """Delete every synced row whose id is not in ``remote_ids``"""
+        with self.lock:
+            local_ids = [r["row_id"] for r in self.conn.execute("SELECT row_id FROM coda_row_values")]
+            stale = [(row_id,) for row_id in local_ids if row_id not in remote_ids]
+            self.conn.executemany("DELETE FROM coda_row_values WHERE row_id = ?", stale)
+            self.conn.executemany("DELETE FROM coda_rows WHERE row_id = ?", stale)
+
+        if stale:
+            logger.info(f"Row index removed {len(stale)} deleted rows")
+        return len(stale)
+
+    def is_synced(self):
+        """True once a sync token is stored, i.e. later syncs are incremental"""
+        return self._get_meta("sync_token") is not None
+
+    def last_synced_at(self):
+        """Time of the last completed sync, or None"""
+        value = self._get_meta("last_sync")
+        return float(value) if value else None
+
+    def synced_count(self):
+        """Number of rows whose values have been synced"""
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM coda_row_values").fetchone()[0]
+
+    def row_values(self, row_id=None, shortcode=None):
+        """
+        Return synced rows, oldest first, as sqlite3.Row objects
+
+        Filters on ``row_id`` or ``shortcode`` when given; all rows otherwise.
+        """
+        query, args = "SELECT * FROM coda_row_values", ()
+        if row_id is not None:
+            query, args = query + " WHERE row_id = ?", (row_id,)
+        elif shortcode is not None:
+            query, args = query + " WHERE shortcode = ?", (shortcode,)
+        with self.lock:
+            return self.conn.execute(query + " ORDER BY created_at", args).fetchall()
+
+    def find(self, link_or_shortcode, coda_config):
+        """Look up a row id, syncing once on a miss"""
+        entry = self.find_entry(link_or_shortcode, coda_config)
+        return entry["row_id"] if entry else None
+
+    def find_entry(self, link_or_shortcode, coda_config):
+        """Look up the row id and stored link, syncing once on a miss"""
+        entry = self.lookup_entry(link_or_shortcode)
+        if entry is None:
+            self.sync(coda_config)
+            entry = self.lookup_entry(link_or_shortcode)
+        return entry
@@ -0,0 +1,141 @@
+"""
+Disk-backed cache of scraped reel metadata, keyed by shortcode.
+
+Bright Data bills per scraped record, so every record we receive is kept.
+Fields that never change once a reel is posted (owner, caption, duration)
+never expire; counters (views, likes, comments) are trusted for
+SCRAPE_CACHE_COUNTER_TTL seconds, after which the reel needs a new scrape.
+"""
+
+import os
+import json
+import time
+import threading
+
+from src import storage
+from src.links import canonicalize_instagram_link
+from src.metrics import record_link
+
+# Seconds scraped counters stay fresh
+SCRAPE_CACHE_COUNTER_TTL = float(os.getenv("SCRAPE_CACHE_COUNTER_TTL", "86400"))
+
+# Normalized field -> Bright Data keys, first one present wins
+IMMUTABLE_FIELDS = {
+    "owner": ("user_posted", "username"),
+    "caption": ("description", "caption"),
+    "duration": ("video_duration", "length"),
+    "posted_at": ("date_posted", "timestamp"),
+    "url": ("url",),
+}
+COUNTER_FIELDS = {
+    "views": ("views", "video_play_count"),
+    "likes": ("likes",),
+    "comments": ("num_comments", "comments"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scrape_cache (
+    shortcode TEXT PRIMARY KEY,
+    immutable TEXT NOT NULL,
+    counters TEXT NOT NULL,
+    first_scraped_at REAL NOT NULL,
+    counters_at REAL NOT NULL
+);
+"""
+
+def _pick(record, fields):
+    """Return {name: value} for the fields present in a record"""
+    picked = {}
+    for name, keys in fields.items():
+        for key in keys:
+            if record.get(key) is not None:
+                picked[name] = record[key]
+                break
+    return picked
+
+def normalize_record(record):
+    """Split a Bright Data record into (immutable, counters) dicts"""
+    return _pick(record, IMMUTABLE_FIELDS), _pick(record, COUNTER_FIELDS)
+
+class ScrapeCache:
+    """Persistent shortcode -> normalized scraped record mapping"""
+
+    def __init__(self, path=None, counter_ttl=SCRAPE_CACHE_COUNTER_TTL):
+        self.counter_ttl = counter_ttl
+        self.conn = storage.connect(path)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+
+    def put(self, record, now=None):
+        """
+        Store a Bright Data record
+
+        Immutable fields are merged into what is already known; counters
+        are replaced and their TTL restarts.
+
+        Returns:
+            False if the record has no link or is an error record
+        """
+        link = record_link(record)
+        shortcode = canonicalize_instagram_link(link) if link else None
+        if not shortcode or record.get("error"):
+            return False
+
+        now = now or time.time()
+        immutable, counters = normalize_record(record)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT immutable, first_scraped_at FROM scrape_cache WHERE shortcode = ?", (shortcode,)
+            ).fetchone()
+            if row:
+                immutable = {**json.loads(row["immutable"]), **immutable}
+            self.conn.execute(
+                "INSERT OR REPLACE INTO scrape_cache (shortcode, immutable, counters, first_scraped_at, counters_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (shortcode, json.dumps(immutable), json.dumps(counters),
+                 row["first_scraped_at"] if row else now, now)
+            )
+        return True
+
+    def get(self, link_or_shortcode, now=None):
+        """
+        Return the cached metadata of a reel, or None
+
+        Counters are only included while they are fresh.
+        """
+        row = self._row(link_or_shortcode)
+        if row is None:
+            return None
+        entry = json.loads(row["immutable"])
+        if self._fresh(row, now):
+            entry.update(json.loads(row["counters"]))
+        return entry
+
+    def is_fresh(self, link_or_shortcode, now=None):
+        """True when the reel is cached and its counters have not expired"""
+        row = self._row(link_or_shortcode)
+        return row is not None and self._fresh(row, now)
+
+    def scraped_at(self, link_or_shortcode):
+        """Return when the reel's counters were last scraped, or None"""
+        row = self._row(link_or_shortcode)
+        return row["counters_at"] if row else None
+
+    def needs_scrape(self, link_or_shortcode, now=None):
+        """True for reels that were never scraped or whose counters are stale"""
+        return not self.is_fresh(link_or_shortcode, now)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM scrape_cache").fetchone()[0]
+
+    def _fresh(self, row, now=None):
+        return (now or time.time()) - row["counters_at"] < self.counter_ttl
+
+    def _row(self, link_or_shortcode):
+        shortcode = canonicalize_instagram_link(link_or_shortcode) or link_or_shortcode
+        with self.lock:
+            return self.conn.execute(
+                "SELECT * FROM scrape_cache WHERE shortcode = ?", (shortcode,)
+            ).fetchone()
@@ -0,0 +1,297 @@
+"""
+Rate-limited sender for outbound Telegram calls.
+
+Telegram allows about 30 messages per second per bot and about one per second
+per chat, and answers bursts beyond that with 429 ``retry_after``. Every call
+submitted here waits for a token from a global bucket and from its chat's
+bucket. The buckets only decide when a call may start: calls run on a small
+pool of threads, and a call returning a Future (a coroutine scheduled on an
+event loop) holds no thread at all, so several calls are in flight at once.
+Calls of one chat leave in submission order, one at a time. Priority calls
+(commands, admin traffic) go out before bulk replies of other chats. A 429
+puts the call back at the head of its chat's queue and pauses that chat for
+``retry_after`` seconds, so replies keep flowing at the highest allowed rate
+instead of failing.
+"""
+
+import os
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from src import transport
+from src.monitoring import monitor
+
+# Global bucket: sustained messages per second, and burst size
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_GLOBAL_BURST = int(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))
+# Per-chat bucket
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+# 429 answers a single call may get before it fails
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "5"))
+# Threads running blocking Telegram calls at the same time
+TELEGRAM_SEND_WORKERS = int(os.getenv("TELEGRAM_SEND_WORKERS", "8"))
+# Longest a caller waits for a paced call to go out
+TELEGRAM_SEND_TIMEOUT = float(os.getenv("TELEGRAM_SEND_TIMEOUT", "10"))
+
+logger = logging.getLogger("TelegramSender")
+
+def retry_after_of(error):
+    """
+    Return the ``retry_after`` seconds of a 429 error, or None for other errors
+
+    Understands telebot's ApiTelegramException and requests' HTTPError.
+    """
+    if getattr(error, "error_code", None) == 429:
+        parameters = (getattr(error, "result_json", None) or {}).get("parameters") or {}
+        return float(parameters.get("retry_after", 1))
+
+    response = getattr(error, "response", None)
+    if response is None or getattr(response, "status_code", None) != 429:
+        return None
+    try:
+        return float(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        retry_after = transport.retry_after_seconds(response)
+        return retry_after if retry_after is not None else 1.0
+
+class TokenBucket:
+    """Classic token bucket refilled at ``rate`` tokens per second"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.clock = clock
+        self.tokens = float(self.capacity)
+        self.updated = clock()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now=None):
+        """Seconds until a token is available (0 if one is available now)"""
+        now = self.clock() if now is None else now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now=None):
+        """Consume a token; call only when wait_time() is 0"""
+        now = self.clock() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now=None):
+        """True once the bucket refilled completely, i.e. it is as good as new"""
+        now = self.clock() if now is None else now
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class TelegramSender:
+    """Paces Telegram API calls with global and per-chat token buckets"""
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, global_burst=TELEGRAM_GLOBAL_BURST,
+                 chat_rate=TELEGRAM_CHAT_RATE, chat_burst=TELEGRAM_CHAT_BURST,
+                 max_retries=TELEGRAM_MAX_RETRIES, workers=TELEGRAM_SEND_WORKERS,
+                 sweep_interval=60.0, clock=time.monotonic):
+        self.clock = clock
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.sweep_interval = sweep_interval  # Seconds between two evictions of idle chat buckets
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock)
+        self._chat_buckets = {}
+        self._chats = {}  # chat_id -> deque of queued calls
+        # Heaps of (ready_at, seq, chat_id), one entry per scheduled chat:
+        # the priority lane, then the bulk lane
+        self._lanes = ([], [])
+        self._scheduled = set()  # Chats in a lane or with a call in flight
+        self._in_flight = 0
+        self._last_sweep = clock()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="telegram-send")
+        self._thread = None
+        self._closed = False
+        self.stats = {"sent": 0, "failed": 0, "throttled": 0, "delayed": 0}
+
+    def submit(self, chat_id, func, *args, priority=False, **kwargs):
+        """
+        Queue ``func(*args, **kwargs)``, a Telegram call addressed to ``chat_id``
+
+        ``func`` may return a concurrent.futures.Future (e.g. from
+        ``asyncio.run_coroutine_threadsafe``); the call then completes with it.
+        ``priority`` calls are started before bulk calls of other chats.
+
+        Returns:
+            A Future resolving to the call's return value, or raising its
+            exception (after TELEGRAM_MAX_RETRIES for 429s)
+        """
+        future = Future()
+        call = {"future": future, "func": func, "args": args, "kwargs": kwargs,
+                "retries": 0, "delayed": False, "priority": priority}
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("TelegramSender is closed")
+            self._chats.setdefault(chat_id, deque()).append(call)
+            if chat_id not in self._scheduled:
+                self._schedule(chat_id, self.clock())
+            self._ensure_thread()
+            self._cond.notify()
+        return future
+
+    def send(self, chat_id, func, *args, timeout=None, **kwargs):
+        """Submit a call and wait for its result"""
+        return self.submit(chat_id, func, *args, **kwargs).result(timeout)
+
+    def pending_count(self):
+        """Calls waiting to be sent"""
+        with self._cond:
+            return sum(len(queued) for queued in self._chats.values())
+
+    def close(self, timeout=None):
+        """Send what is queued, then stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _ensure_thread(self):
+        """Start the scheduler thread on first use (caller holds the lock)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="telegram-sender", daemon=True)
+            self._thread.start()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self.clock)
+        return bucket
+
+    def _schedule(self, chat_id, ready_at):
+        """Put a chat in the lane of its next call (caller holds the lock)"""
+        lane = self._lanes[0 if self._chats[chat_id][0]["priority"] else 1]
+        heapq.heappush(lane, (ready_at, next(self._seq), chat_id))
+        self._scheduled.add(chat_id)
+
+    def _evict_idle_buckets(self, now):
+        """Forget the buckets of idle chats that refilled (caller holds the lock)"""
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        idle = [
+            chat_id for chat_id, bucket in self._chat_buckets.items()
+            if chat_id not in self._scheduled and bucket.is_full(now)
+        ]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    def _next_call(self):
+        """Block until a call may start; returns (chat_id, call) or None once closed and idle"""
+        with self._cond:
+            while True:
+                now = self.clock()
+                self._evict_idle_buckets(now)
+                lane = next((lane for lane in self._lanes if lane and lane[0][0] <= now), None)
+                if lane is None:
+                    heads = [lane[0][0] for lane in self._lanes if lane]
+                    if heads:
+                        self._cond.wait(min(heads) - now)
+                    elif self._closed and not self._in_flight:
+                        return None
+                    else:
+                        self._cond.wait()
+                    continue
+
+                ready_at, seq, chat_id = lane[0]
+                queued = self._chats[chat_id]
+                wait = self.global_bucket.wait_time(now)
+                if wait > 0:
+                    # Whichever chat is first once a token is back goes next
+                    queued[0]["delayed"] = True
+                    self._cond.wait(wait)
+                    continue
+                wait = self._chat_bucket(chat_id).wait_time(now)
+                if wait > 0:
+                    queued[0]["delayed"] = True
+                    heapq.heapreplace(lane, (now + wait, seq, chat_id))
+                    continue
+
+                heapq.heappop(lane)
+                self.global_bucket.take(now)
+                self._chat_bucket(chat_id).take(now)
+                self._in_flight += 1
+                return chat_id, queued.popleft()
+
+    def _run(self):
+        """Scheduler loop: start calls as the buckets allow"""
+        while True:
+            picked = self._next_call()
+            if picked is None:
+                # Nothing queued or in flight once closed
+                self._executor.shutdown(wait=False)
+                return
+            self._executor.submit(self._start, *picked)
+
+    def _start(self, chat_id, call):
+        """Run a call on a pool thread"""
+        try:
+            result = call["func"](*call["args"], **call["kwargs"])
+        except Exception as e:
+            self._finish(chat_id, call, None, e)
+            return
+        if isinstance(result, Future):
+            # Scheduled elsewhere (e.g. on an event loop): free the thread now
+            result.add_done_callback(lambda done: self._settle(chat_id, call, done))
+        else:
+            self._finish(chat_id, call, result, None)
+
+    def _settle(self, chat_id, call, done):
+        """Finish a call from the Future it returned"""
+        try:
+            result = done.result()
+        except Exception as e:
+            self._finish(chat_id, call, None, e)
+        else:
+            self._finish(chat_id, call, result, None)
+
+    def _finish(self, chat_id, call, result, error):
+        """Resolve a call, or put it back at the head of its chat after a 429"""
+        retry_after = retry_after_of(error) if error is not None else None
+        retried = retry_after is not None and call["retries"] < self.max_retries
+        with self._cond:
+            self._in_flight -= 1
+            if retried:
+                call["retries"] += 1
+                self.stats["throttled"] += 1
+                self._chats[chat_id].appendleft(call)
+                self._schedule(chat_id, self.clock() + retry_after)
+            else:
+                self.stats["failed" if error is not None else "sent"] += 1
+                if error is None and call["delayed"]:
+                    self.stats["delayed"] += 1
+                # Schedule the chat's next call, or forget the chat when it has none
+                if self._chats[chat_id]:
+                    self._schedule(chat_id, self.clock())
+                else:
+                    del self._chats[chat_id]
+                    self._scheduled.discard(chat_id)
+            self._cond.notify()
+
+        if retried:
+            monitor.record_throttled_send()
+            logger.warning(f"Telegram asked to retry chat {chat_id} after {retry_after}s")
+        elif error is not None:
+            logger.error(f"Telegram call to chat {chat_id} failed: {error}")
+            call["future"].set_exception(error)
+        else:
+            if call["delayed"]:
+                monitor.record_delayed_send()
+            call["future"].set_result(result)
@@ -0,0 +1,197 @@
+"""
+Index of every reel shortcode already saved to Coda.
+
+A Bloom filter sits in front of a persistent SQLite set: a negative answer
+from the filter is definitive and costs a few hashes, and only possible hits
+are confirmed against the table, so repeated links never take the write lock.
+The index is seeded from the existing Coda table, kept up to date as links are
+accepted, and re-synced every SHORTCODE_RESYNC_INTERVAL seconds so reels
+deleted in Coda can be saved again.
+"""
+
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+
+from src import coda, storage
+from src.links import canonicalize_instagram_link
+
+# Expected number of shortcodes and target false-positive rate for the filter
+BLOOM_CAPACITY = int(os.getenv("SHORTCODE_BLOOM_CAPACITY", "100000"))
+BLOOM_ERROR_RATE = float(os.getenv("SHORTCODE_BLOOM_ERROR_RATE", "0.01"))
+# Seconds after which the index is re-synced with the Coda table
+SHORTCODE_RESYNC_INTERVAL = float(os.getenv("SHORTCODE_RESYNC_INTERVAL", "21600"))
+
+# Shortcodes accepted this recently may still wait in the outbox, so a re-sync
+# keeps them even though Coda does not have them yet
+PENDING_GRACE_SECONDS = float(os.getenv("SHORTCODE_PENDING_GRACE_SECONDS", "3600"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shortcodes (
+    shortcode TEXT PRIMARY KEY,
+    link TEXT,
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shortcode_index_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+logger = logging.getLogger("ShortcodeIndex")
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity=BLOOM_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(1, capacity)
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, value):
+        """Derive num_hashes bit positions from one digest (double hashing)"""
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+class ShortcodeIndex:
+    """Persistent set of saved shortcodes with a Bloom filter in front"""
+
+    def __init__(self, path=None):
+        self.conn = storage.connect(path)
+        self.lock = threading.Lock()
+        self._resync_thread = None
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+            self.bloom = self._load_bloom()
+
+    def _load_bloom(self):
+        """Build a filter holding every shortcode in the table (caller holds the lock)"""
+        bloom = BloomFilter()
+        for row in self.conn.execute("SELECT shortcode FROM shortcodes"):
+            bloom.add(row["shortcode"])
+        return bloom
+
+    def __contains__(self, shortcode):
+        if shortcode not in self.bloom:
+            return False
+        with self.lock:
+            return self.conn.execute(
+                "SELECT 1 FROM shortcodes WHERE shortcode = ?", (shortcode,)
+            ).fetchone() is not None
+
+    def add(self, shortcode, link=None):
+        """
+        Record a shortcode
+
+        Returns:
+            True if it was new, False if it was already in the index
+        """
+        with self.lock:
+            if shortcode in self.bloom and self.conn.execute(
+                "SELECT 1 FROM shortcodes WHERE shortcode = ?", (shortcode,)
+            ).fetchone() is not None:
+                return False
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO shortcodes (shortcode, link, added_at) VALUES (?, ?, ?)",
+                (shortcode, link, time.time())
+            )
+            self.bloom.add(shortcode)
+            return cursor.rowcount == 1
+
+    def discard(self, shortcode):
+        """Forget a shortcode (the Bloom filter keeps it; the table is authoritative)"""
+        with self.lock:
+            self.conn.execute("DELETE FROM shortcodes WHERE shortcode = ?", (shortcode,))
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM shortcodes").fetchone()[0]
+
+    def seeded_at(self):
+        """Return when the index was last synced with Coda, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM shortcode_index_meta WHERE key = 'seeded_at'"
+            ).fetchone()
+        return float(row["value"]) if row else None
+
+    def is_seeded(self):
+        """Return True once the index has been loaded from Coda"""
+        return self.seeded_at() is not None
+
+    def seed_from_coda(self, coda_config):
+        """
+        Sync the index with every shortcode present in the Coda table
+
+        Shortcodes missing from Coda are dropped, unless they were accepted
+        within PENDING_GRACE_SECONDS and may still be on their way.
+
+        Returns:
+            The number of shortcodes added
+        """
+        started = time.time()
+        column_name = coda_config.get("column_name", "Link")
+        added = 0
+        in_coda = set()
+        for row in coda.iter_rows(coda_config, columns=[column_name]):
+            link = row.get("values", {}).get(column_name)
+            if not isinstance(link, str):
+                continue
+            shortcode = canonicalize_instagram_link(link)
+            if not shortcode:
+                continue
+            in_coda.add(shortcode)
+            if self.add(shortcode, link):
+                added += 1
+
+        with self.lock:
+            stale = [
+                row["shortcode"] for row in self.conn.execute(
+                    "SELECT shortcode FROM shortcodes WHERE added_at < ?", (started - PENDING_GRACE_SECONDS,)
+                )
+                if row["shortcode"] not in in_coda
+            ]
+            self.conn.executemany("DELETE FROM shortcodes WHERE shortcode = ?", [(code,) for code in stale])
+            if stale:
+                self.bloom = self._load_bloom()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO shortcode_index_meta (key, value) VALUES ('seeded_at', ?)",
+                (str(started),)
+            )
+        logger.info(f"Synced shortcode index with Coda: {added} added, {len(stale)} removed")
+        return added
+
+    def ensure_seeded(self, coda_config, max_age=SHORTCODE_RESYNC_INTERVAL):
+        """Sync with Coda unless that happened within the last ``max_age`` seconds"""
+        seeded_at = self.seeded_at()
+        if seeded_at is None or time.time() - seeded_at >= max_age:
+            self.seed_from_coda(coda_config)
+
+    def start_resync(self, coda_config, interval=SHORTCODE_RESYNC_INTERVAL):
+        """Re-sync with Coda every ``interval`` seconds in a background daemon thread"""
+        if self._resync_thread is not None and self._resync_thread.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.ensure_seeded(coda_config, max_age=interval)
+                except Exception as e:
+                    logger.error(f"Shortcode index re-sync failed: {e}")
+
+        self._resync_thread = threading.Thread(target=run, name="shortcode-resync", daemon=True)
+        self._resync_thread.start()
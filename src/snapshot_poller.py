@@ -0,0 +1,233 @@
+"""
+Adaptive poller for Bright Data snapshots.
+
+Tracks many in-flight snapshots at once and checks ``/progress/{id}`` only
+when a snapshot is due. The first check is timed from an EWMA of how long
+previous snapshots took to complete; once a snapshot outlives that estimate
+the interval backs off exponentially. Ready snapshots are downloaded straight
+away on a small thread pool, so no thread sleeps per job.
+"""
+
+import os
+import time
+import heapq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from src import brightdata
+
+# Threads used for progress checks and downloads
+SNAPSHOT_POLL_WORKERS = int(os.getenv("SNAPSHOT_POLL_WORKERS", "4"))
+# Bounds, in seconds, for the delay between two checks of one snapshot
+SNAPSHOT_POLL_MIN_INTERVAL = float(os.getenv("SNAPSHOT_POLL_MIN_INTERVAL", "5"))
+SNAPSHOT_POLL_MAX_INTERVAL = float(os.getenv("SNAPSHOT_POLL_MAX_INTERVAL", "120"))
+# Expected completion time before any snapshot has been observed
+SNAPSHOT_INITIAL_ESTIMATE = float(os.getenv("SNAPSHOT_INITIAL_ESTIMATE", "60"))
+# Checks of one snapshot that may end in a parse error before it is failed
+SNAPSHOT_MAX_PARSE_ERRORS = int(os.getenv("SNAPSHOT_MAX_PARSE_ERRORS", "5"))
+
+# Weight of the newest completion time in the estimate
+EWMA_ALPHA = 0.3
+# Growth of the check interval once a snapshot is overdue
+BACKOFF_FACTOR = 1.5
+# First check at this fraction of the estimate, to catch fast snapshots early
+FIRST_CHECK_FRACTION = 0.8
+
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+logger = logging.getLogger("SnapshotPoller")
+
+class SnapshotPoller:
+    """
+    Poll Bright Data snapshots and download them once they are ready
+
+    ``on_ready(snapshot_id, records)`` and ``on_failed(snapshot_id, status)``
+    are called from the poller's worker threads. ``records`` is a lazy
+    iterator over the streamed snapshot and must be consumed by on_ready.
+    Request errors are retried on a later check; parse errors too, up to
+    ``max_parse_errors`` times. Any other error from on_ready fails the
+    snapshot.
+    """
+
+    def __init__(self, api_key, on_ready, on_failed=None, workers=SNAPSHOT_POLL_WORKERS,
+                 min_interval=SNAPSHOT_POLL_MIN_INTERVAL, max_interval=SNAPSHOT_POLL_MAX_INTERVAL,
+                 initial_estimate=SNAPSHOT_INITIAL_ESTIMATE, max_parse_errors=SNAPSHOT_MAX_PARSE_ERRORS,
+                 clock=time.time):
+        self.api_key = api_key
+        self.on_ready = on_ready
+        self.on_failed = on_failed
+        self.max_parse_errors = max(1, max_parse_errors)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.estimate = initial_estimate
+        self.clock = clock
+        self.lock = threading.Lock()
+        self._heap = []  # (next_check, snapshot_id)
+        self._tracked = {}  # snapshot_id -> {"triggered_at", "interval"}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="snapshot-poller")
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, snapshot_id, triggered_at=None):
+        """Start tracking a snapshot triggered at ``triggered_at`` (defaults to now)"""
+        triggered_at = triggered_at or self.clock()
+        with self.lock:
+            if snapshot_id in self._tracked:
+                return
+            self._tracked[snapshot_id] = {
+                "triggered_at": triggered_at, "interval": self.min_interval, "parse_errors": 0
+            }
+            first_check = triggered_at + max(self.min_interval, self.estimate * FIRST_CHECK_FRACTION)
+            heapq.heappush(self._heap, (first_check, snapshot_id))
+        self._wakeup.set()
+
+    def pending_count(self):
+        """Return the number of snapshots still being tracked"""
+        with self.lock:
+            return len(self._tracked)
+
+    def next_due(self):
+        """Return the time of the next scheduled check, or None when idle"""
+        with self.lock:
+            return self._heap[0][0] if self._heap else None
+
+    def poll_once(self):
+        """
+        Check every due snapshot concurrently
+
+        Returns:
+            The number of snapshots that finished (ready or failed)
+        """
+        now = self.clock()
+        due = []
+        with self.lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[1])
+
+        futures = [self._executor.submit(self._check, snapshot_id) for snapshot_id in due]
+        return sum(1 for future in futures if future.result())
+
+    def _check(self, snapshot_id):
+        """Check one snapshot; returns True when it is no longer tracked"""
+        try:
+            status = brightdata.get_snapshot_progress(snapshot_id, self.api_key)
+            if status == STATUS_READY:
+                ready_at = self.clock()
+                # Records stream in while on_ready consumes them; a broken
+                # stream is retried on the next check
+                self.on_ready(snapshot_id, brightdata.iter_snapshot_records(snapshot_id, self.api_key))
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Snapshot {snapshot_id} check failed: {e}")
+            self._reschedule(snapshot_id)
+            return False
+        except ValueError as e:
+            # A snapshot that keeps failing to parse is malformed, not late
+            if self._count_parse_error(snapshot_id) < self.max_parse_errors:
+                logger.warning(f"Snapshot {snapshot_id} check failed: {e}")
+                self._reschedule(snapshot_id)
+                return False
+            logger.error(f"Snapshot {snapshot_id} failed to parse {self.max_parse_errors} times, giving up: {e}")
+            status = STATUS_FAILED
+        except Exception as e:
+            # Not a transient API error: give up on the snapshot so it is not
+            # left tracked without a scheduled check
+            logger.error(f"Snapshot {snapshot_id} could not be handled: {e}")
+            status = STATUS_FAILED
+
+        if status == STATUS_READY:
+            self._finish(snapshot_id, finished_at=ready_at)
+            return True
+        if status == STATUS_FAILED:
+            self._finish(snapshot_id)
+            if self.on_failed:
+                try:
+                    self.on_failed(snapshot_id, status)
+                except Exception as e:
+                    logger.error(f"Snapshot {snapshot_id} failure handler failed: {e}")
+            return True
+
+        self._reschedule(snapshot_id)
+        return False
+
+    def _count_parse_error(self, snapshot_id):
+        """Record a parse error of a snapshot and return how many it had"""
+        with self.lock:
+            tracked = self._tracked[snapshot_id]
+            tracked["parse_errors"] += 1
+            return tracked["parse_errors"]
+
+    def _reschedule(self, snapshot_id):
+        """Schedule the next check: wait out the estimate, then back off"""
+        now = self.clock()
+        with self.lock:
+            tracked = self._tracked[snapshot_id]
+            remaining = tracked["triggered_at"] + self.estimate - now
+            if remaining > self.min_interval:
+                delay = remaining
+            else:
+                tracked["interval"] = min(self.max_interval, tracked["interval"] * BACKOFF_FACTOR)
+                delay = tracked["interval"]
+            heapq.heappush(self._heap, (now + delay, snapshot_id))
+
+    def _finish(self, snapshot_id, finished_at=None):
+        """Stop tracking a snapshot; a ready one also updates the estimate"""
+        with self.lock:
+            tracked = self._tracked.pop(snapshot_id)
+            if finished_at is not None:
+                duration = finished_at - tracked["triggered_at"]
+                self.estimate = EWMA_ALPHA * duration + (1 - EWMA_ALPHA) * self.estimate
+                logger.info(f"Snapshot {snapshot_id} ready after {duration:.0f}s (estimate {self.estimate:.0f}s)")
+
+    def run_until_idle(self, timeout=None):
+        """
+        Poll in the calling thread until every snapshot finished
+
+        Returns:
+            True if nothing is left to poll, False if ``timeout`` expired first
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        while self.pending_count():
+            self.poll_once()
+            next_due = self.next_due()
+            if next_due is None:
+                continue
+            wait = max(0, next_due - self.clock())
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            self._stop.wait(wait)
+            if self._stop.is_set():
+                break
+        return self.pending_count() == 0
+
+    def start(self):
+        """Run the poller in a background daemon thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the background thread and the worker pool"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        """Background loop: sleep until the next check is due or a snapshot is added"""
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Snapshot poller error: {e}")
+            next_due = self.next_due()
+            wait = None if next_due is None else max(0, next_due - self.clock())
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
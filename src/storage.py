@@ -0,0 +1,38 @@
+"""
+Local SQLite storage shared by the outbox and the other on-disk indexes.
+"""
+
+import os
+import sqlite3
+
+def default_db_path():
+    """
+    Return the path of the local SQLite database
+
+    Vercel only allows writes under /tmp, so that is the default there.
+    """
+    if os.getenv("DATA_DB_PATH"):
+        return os.getenv("DATA_DB_PATH")
+    if os.getenv("VERCEL"):
+        return "/tmp/ddf_reels.sqlite3"
+    return os.path.join("data", "ddf_reels.sqlite3")
+
+def connect(path=None):
+    """
+    Open a SQLite connection in WAL mode
+
+    The connection may be shared between threads; callers serialise access
+    with their own lock.
+    """
+    path = path or default_db_path()
+    if path != ":memory:":
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
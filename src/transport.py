@@ -0,0 +1,134 @@
+"""
+Shared HTTP transport for all outbound API calls (Coda, Telegram, Bright Data).
+
+A single ``requests.Session`` is created lazily per process and kept at module
+level, so keep-alive connections survive across warm serverless invocations
+and across telebot handler threads.
+"""
+
+import os
+import time
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connection pool sizing: one pool per host, each holding up to POOL_MAXSIZE
+# idle keep-alive connections
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+
+# Default (connect, read) timeouts in seconds, applied when a caller passes none
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+
+# Concurrent connections of the aiohttp session used by the asyncio bot runtime
+ASYNC_REQUEST_LIMIT = int(os.getenv("HTTP_ASYNC_REQUEST_LIMIT", "100"))
+
+_session = None
+_session_lock = threading.Lock()
+
+def _build_session():
+    """Create a session with keep-alive pools mounted for http and https"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=False
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+def default_timeout(limit=None):
+    """Return the default (connect, read) timeout tuple, each capped at ``limit`` seconds"""
+    if limit is None:
+        return (CONNECT_TIMEOUT, READ_TIMEOUT)
+    return (min(CONNECT_TIMEOUT, limit), min(READ_TIMEOUT, limit))
+
+def request(method, url, **kwargs):
+    """
+    Send a request through the shared session
+
+    Accepts the same keyword arguments as ``requests.request``. A default
+    (connect, read) timeout is applied if the caller does not set one.
+    """
+    kwargs.setdefault("timeout", default_timeout())
+    return get_session().request(method, url, **kwargs)
+
+def get(url, **kwargs):
+    """Send a GET request through the shared session"""
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    """Send a POST request through the shared session"""
+    return request("POST", url, **kwargs)
+
+def put(url, **kwargs):
+    """Send a PUT request through the shared session"""
+    return request("PUT", url, **kwargs)
+
+def retry_after_seconds(response):
+    """
+    Return the delay requested by a 429/503 ``Retry-After`` header, or None
+
+    The header may hold either a number of seconds or an HTTP date.
+    """
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def configure_telebot():
+    """
+    Route pyTelegramBotAPI's own API calls through the shared session
+
+    telebot normally keeps one session per thread and recycles it every
+    10 minutes; pointing it at our session lets handler threads share a
+    single keep-alive pool to api.telegram.org.
+    """
+    from telebot import apihelper
+
+    apihelper.session = get_session()
+    apihelper.SESSION_TIME_TO_LIVE = None
+    apihelper.CONNECT_TIMEOUT = CONNECT_TIMEOUT
+    apihelper.READ_TIMEOUT = READ_TIMEOUT
+
+def configure_async_telebot(request_limit=ASYNC_REQUEST_LIMIT):
+    """
+    Size the aiohttp connection pool of pyTelegramBotAPI's AsyncTeleBot
+
+    The asyncio runtime shares one aiohttp session for all Telegram calls;
+    ``request_limit`` caps how many of them are open at once.
+    """
+    from telebot import asyncio_helper
+
+    asyncio_helper.REQUEST_LIMIT = request_limit
+    asyncio_helper.REQUEST_TIMEOUT = CONNECT_TIMEOUT + READ_TIMEOUT
+
+def reset_session():
+    """Close and drop the shared session (used by tests and on shutdown)"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
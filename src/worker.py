@@ -0,0 +1,260 @@
+"""
+Background worker: all heavy I/O outside the chat-facing process.
+
+Drains the link outbox into Coda through the batch writer, feeds every saved
+link into the scrape -> metrics pipeline, polls Bright Data snapshots and
+periodically runs the metrics refresh scheduler. When BRIGHT_DATA_WEBHOOK_URL
+is set, Bright Data delivers snapshots to /api/brightdata and the worker only
+triggers them instead of polling. SIGINT/SIGTERM stop intake,
+let queued work finish and then exit.
+
+Usage:
+    python -m src.worker [--no-scrape] [--no-refresh] [--outbox-batch-size N] ...
+
+Set BOT_DRAIN_OUTBOX=false on the bot when a worker is running, so only the
+worker writes to Coda.
+"""
+
+import os
+import sys
+import signal
+import logging
+import argparse
+import threading
+
+from src.utils import get_required_env
+from src.batching import CodaBatchWriter, BATCH_MAX_SIZE, BATCH_WINDOW_MS
+from src.outbox import LinkOutbox, OutboxDrainer, OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL
+from src.row_index import RowIndex
+from src.shortcode_index import ShortcodeIndex
+from src.mirror import ReelsMirror
+from src.scrape_cache import ScrapeCache
+from src import brightdata
+from src.brightdata import BatchedScrapeTrigger, SCRAPE_BATCH_MAX_SIZE, SCRAPE_BATCH_MAX_WAIT
+from src.snapshot_poller import SnapshotPoller, SNAPSHOT_POLL_WORKERS
+from src.metrics import MetricsUpdater, METRICS_BATCH_SIZE
+from src.pipeline import (
+    build_metrics_pipeline, PIPELINE_QUEUE_SIZE, PIPELINE_INSERT_WORKERS, PIPELINE_SCRAPE_WORKERS,
+    PIPELINE_UPDATE_WORKERS
+)
+from src.refresh import RefreshScheduler, REFRESH_DAILY_BUDGET
+
+# Seconds between two metrics refresh ticks
+WORKER_REFRESH_INTERVAL = float(os.getenv("WORKER_REFRESH_INTERVAL", "900"))
+# Seconds between two checks for scrape batches that waited long enough
+WORKER_SCRAPE_FLUSH_INTERVAL = float(os.getenv("WORKER_SCRAPE_FLUSH_INTERVAL", "10"))
+# Seconds given to queued work when shutting down
+WORKER_SHUTDOWN_TIMEOUT = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT", "30"))
+
+logger = logging.getLogger("Worker")
+
+def parse_args(argv=None):
+    """Parse the worker's command line"""
+    parser = argparse.ArgumentParser(description="DDF Reels background worker")
+    parser.add_argument("--db", help="SQLite path (defaults to DATA_DB_PATH)")
+    parser.add_argument("--outbox-batch-size", type=int, default=OUTBOX_BATCH_SIZE,
+                        help="outbox entries claimed per drain pass")
+    parser.add_argument("--outbox-poll-interval", type=float, default=OUTBOX_POLL_INTERVAL,
+                        help="seconds the drainer sleeps when the outbox is empty")
+    parser.add_argument("--coda-batch-size", type=int, default=BATCH_MAX_SIZE,
+                        help="links per multi-row Coda insert")
+    parser.add_argument("--coda-window-ms", type=int, default=BATCH_WINDOW_MS,
+                        help="how long links are buffered before a Coda insert")
+    parser.add_argument("--scrape-batch-size", type=int, default=SCRAPE_BATCH_MAX_SIZE,
+                        help="reels per Bright Data job")
+    parser.add_argument("--scrape-max-wait", type=float, default=SCRAPE_BATCH_MAX_WAIT,
+                        help="seconds a partial scrape batch may wait")
+    parser.add_argument("--poll-workers", type=int, default=SNAPSHOT_POLL_WORKERS,
+                        help="threads checking and downloading snapshots")
+    parser.add_argument("--insert-workers", type=int, default=PIPELINE_INSERT_WORKERS,
+                        help="threads of the Coda insert stage")
+    parser.add_argument("--scrape-workers", type=int, default=PIPELINE_SCRAPE_WORKERS,
+                        help="threads of the scrape trigger stage")
+    parser.add_argument("--update-workers", type=int, default=PIPELINE_UPDATE_WORKERS,
+                        help="threads of the metrics update stage")
+    parser.add_argument("--update-batch-size", type=int, default=METRICS_BATCH_SIZE,
+                        help="scraped records per Coda upsert batch")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE,
+                        help="items each pipeline stage may queue")
+    parser.add_argument("--refresh-interval", type=float, default=WORKER_REFRESH_INTERVAL,
+                        help="seconds between metrics refresh ticks")
+    parser.add_argument("--daily-budget", type=int, default=REFRESH_DAILY_BUDGET,
+                        help="Bright Data records the refresh may use per day")
+    parser.add_argument("--no-scrape", action="store_true", help="only drain the outbox into Coda")
+    parser.add_argument("--no-refresh", action="store_true", help="do not run the metrics refresh")
+    return parser.parse_args(argv)
+
+class Worker:
+    """Owns the background components and their lifecycle"""
+
+    def __init__(self, args, coda_config, bright_data_api_key=None):
+        self.args = args
+        self.coda_config = coda_config
+        self.stop_event = threading.Event()
+
+        self.writer = CodaBatchWriter(coda_config, max_batch_size=args.coda_batch_size,
+                                      window_ms=args.coda_window_ms)
+        self.outbox = LinkOutbox(args.db)
+        self.row_index = RowIndex(args.db)
+        self.shortcode_index = ShortcodeIndex(args.db)
+
+        self.pipeline = None
+        self.trigger = None
+        self.poller = None
+        self.refresh = None
+        self.mirror = None
+        self.cache = None
+        if bright_data_api_key and not args.no_scrape:
+            self.cache = ScrapeCache(args.db)
+            self.trigger = trigger = BatchedScrapeTrigger(bright_data_api_key, path=args.db, max_batch_size=args.scrape_batch_size,
+                                           max_wait=args.scrape_max_wait, cache=self.cache)
+            updater = None
+            # Delivered snapshots are applied by /api/brightdata; polling them
+            # as well would download and upsert every snapshot twice
+            if not brightdata.BRIGHT_DATA_WEBHOOK_URL:
+                updater = MetricsUpdater(coda_config, self.row_index, batch_size=args.update_batch_size,
+                                         cache=self.cache)
+                self.poller = SnapshotPoller(bright_data_api_key, on_ready=None, workers=args.poll_workers)
+            self.pipeline = build_metrics_pipeline(
+                coda_config, self.row_index, trigger, updater, self.poller,
+                update_batch_size=args.update_batch_size, queue_size=args.queue_size,
+                insert_workers=args.insert_workers, scrape_workers=args.scrape_workers,
+                update_workers=args.update_workers
+            )
+            if self.poller:
+                # Snapshots triggered before a restart are picked up again
+                for snapshot_id in trigger.open_snapshots():
+                    self.poller.add(snapshot_id)
+            if not args.no_refresh:
+                self.mirror = ReelsMirror(row_index=self.row_index)
+                self.refresh = RefreshScheduler(trigger, args.db, daily_budget=args.daily_budget)
+
+        # Links written by the drainer go straight to the scrape stage
+        self.drainer = OutboxDrainer(
+            self.outbox, self.writer, batch_size=args.outbox_batch_size,
+            poll_interval=args.outbox_poll_interval, row_index=self.row_index,
+            shortcode_index=self.shortcode_index,
+            on_done=self._scrape_saved_link if self.pipeline else None
+        )
+        self._refresh_thread = None
+        self._flush_thread = None
+
+    def _scrape_saved_link(self, entry, row_id):
+        """Outbox callback: queue a freshly saved reel for its first scrape"""
+        self.pipeline.submit(entry["link"], stage="scrape_trigger")
+
+    def start(self):
+        """Start every component"""
+        if self.pipeline:
+            self.pipeline.start()
+        if self.poller:
+            self.poller.start()
+        if self.trigger:
+            self._flush_thread = threading.Thread(target=self._run_scrape_flush, name="scrape-flush", daemon=True)
+            self._flush_thread.start()
+        if self.refresh:
+            self._refresh_thread = threading.Thread(target=self._run_refresh, name="refresh", daemon=True)
+            self._refresh_thread.start()
+        self.drainer.start()
+        logger.info("Worker started")
+
+    def flush_scrapes(self):
+        """Trigger the scrape batches that are due and poll their snapshots"""
+        snapshot_ids = self.trigger.flush()
+        if self.poller:
+            for snapshot_id in snapshot_ids:
+                self.poller.add(snapshot_id)
+        return snapshot_ids
+
+    def _run_scrape_flush(self):
+        """Send partial scrape batches once they waited --scrape-max-wait"""
+        while not self.stop_event.wait(WORKER_SCRAPE_FLUSH_INTERVAL):
+            try:
+                self.flush_scrapes()
+            except Exception as e:
+                logger.error(f"Scrape flush failed: {e}")
+
+    def refresh_once(self):
+        """
+        Sync the mirror, queue reels that never got metrics, run a refresh
+        tick and poll the snapshots it triggered
+        """
+        self.mirror.sync(self.coda_config)
+        if not self.poller:
+            # Metrics delivered to /api/brightdata only show up in Coda
+            self.trigger.absorb_deliveries(self.mirror)
+        backfilled = self.trigger.enqueue_missing_metrics(self.mirror)
+        if backfilled:
+            logger.info(f"Queued {backfilled} reels without metrics for scraping")
+        self.refresh.load_mirror(self.mirror, self.cache)
+        snapshot_ids = self.refresh.tick()["snapshots"]
+        if self.poller:
+            for snapshot_id in snapshot_ids:
+                self.poller.add(snapshot_id)
+
+    def _run_refresh(self):
+        """Run a refresh every refresh interval"""
+        while not self.stop_event.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                logger.error(f"Refresh tick failed: {e}")
+            self.stop_event.wait(self.args.refresh_interval)
+
+    def stop(self, timeout=WORKER_SHUTDOWN_TIMEOUT):
+        """Stop intake first, then let queued work drain downstream"""
+        logger.info("Worker stopping")
+        self.stop_event.set()
+        self.drainer.stop(timeout)
+        if self._refresh_thread is not None:
+            self._refresh_thread.join(timeout)
+        if self._flush_thread is not None:
+            self._flush_thread.join(timeout)
+        if self.pipeline:
+            self.pipeline.stop(drain=True, timeout=timeout)
+        if self.poller:
+            self.poller.stop(timeout)
+        self.writer.close()
+        logger.info("Worker stopped")
+
+    def stats(self):
+        """Return pipeline counters and outbox backlog"""
+        stats = {"outbox_pending": self.outbox.pending_count()}
+        if self.pipeline:
+            stats["pipeline"] = self.pipeline.stats()
+        if self.poller:
+            stats["snapshots_in_flight"] = self.poller.pending_count()
+        return stats
+
+def main(argv=None):
+    """Command line entry point"""
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    coda_config = {
+        "api_key": get_required_env("CODA_API_KEY").strip(),
+        "doc_id": get_required_env("CODA_DOC_ID"),
+        "table_id": get_required_env("CODA_TABLE_ID"),
+        "column_name": "Link"
+    }
+    bright_data_api_key = os.getenv("BRIGHT_DATA_API_KEY", "")
+    if not bright_data_api_key and not args.no_scrape:
+        logger.warning("BRIGHT_DATA_API_KEY is not set, scraping is disabled")
+
+    worker = Worker(args, coda_config, bright_data_api_key)
+
+    def request_stop(signum, frame):
+        logger.info(f"Received signal {signum}")
+        worker.stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    worker.start()
+    while not worker.stop_event.wait(60):
+        logger.info(f"Worker stats: {worker.stats()}")
+    worker.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
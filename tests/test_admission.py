@@ -0,0 +1,35 @@
+import unittest
+from unittest.mock import patch
+
+from src.admission import AdmissionController
+
+class TestAdmissionController(unittest.TestCase):
+    """Test suite for backlog-based admission control"""
+
+    def setUp(self):
+        self.depth = 0
+        self.controller = AdmissionController(lambda: self.depth, high_water=10, low_water=3)
+
+    @patch('src.admission.monitor')
+    def test_hysteresis(self, mock_monitor):
+        """Shedding starts at the high mark and stops only at the low mark"""
+        decisions = []
+        for depth in (0, 9, 10, 7, 4, 3, 5, 9):
+            self.depth = depth
+            decisions.append(self.controller.admit())
+
+        self.assertEqual(decisions, [True, True, False, False, False, True, True, True])
+        self.assertEqual(mock_monitor.record_admitted.call_count, 5)
+        self.assertEqual(mock_monitor.record_deferred.call_count, 3)
+
+    @patch('src.admission.monitor')
+    def test_low_mark_never_above_high_mark(self, mock_monitor):
+        """A misconfigured low mark is clamped to the high mark"""
+        controller = AdmissionController(lambda: self.depth, high_water=5, low_water=50)
+        self.depth = 5
+        self.assertFalse(controller.admit())
+        self.depth = 4
+        self.assertTrue(controller.admit())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import importlib
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from src.outbox import STATUS_FAILED
+
+def update(update_id, text, chat_id=7):
+    """A Telegram update as the webhook receives it"""
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": chat_id}, "text": text}}
+
+class ApiTestCase(unittest.TestCase):
+    """Loads api/index.py against a temporary database, with Telegram replies captured"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        env = {
+            "TELEGRAM_BOT_TOKEN": "123:abcdefghij", "CODA_API_KEY": "kkkkkkkkkkkk",
+            "CODA_DOC_ID": "doc", "CODA_TABLE_ID": "table",
+            "DATA_DB_PATH": os.path.join(cls.tmpdir.name, "api.sqlite3"),
+        }
+        with patch.dict(os.environ, env):
+            sys.modules.pop("api.index", None)
+            cls.module = importlib.import_module("api.index")
+        sys.modules.pop("api.index", None)
+        cls.client = cls.module.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        self.replies = []
+        self.monitor = MagicMock()
+        patches = [
+            patch.object(self.module, "monitor", self.monitor),
+            patch.object(self.module, "send_telegram_message",
+                         side_effect=lambda chat_id, text: self.replies.append(text) or True),
+            patch.object(self.module, "seed_shortcode_index"),
+            patch('src.outbox.monitor', MagicMock()),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+class TestWebhook(ApiTestCase):
+    """Test suite for the Telegram webhook, with Coda mocked"""
+
+    @patch('src.coda.insert_rows')
+    def test_link_is_saved_before_the_reply(self, mock_insert):
+        mock_insert.return_value = {"addedRowIds": ["i-1"]}
+        response = self.client.post("/api/webhook", json=update(1, "https://www.instagram.com/reel/SAVED/"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.replies, ["✅ Link saved successfully to the DDF database!"])
+        self.monitor.record_valid_link.assert_called_once_with(1)
+
+    @patch('src.coda.insert_rows')
+    def test_redelivered_update_is_dropped(self, mock_insert):
+        mock_insert.return_value = {"addedRowIds": ["i-1"]}
+        body = update(4, "https://www.instagram.com/reel/TWICE/")
+        self.client.post("/api/webhook", json=body)
+        response = self.client.post("/api/webhook", json=body)
+
+        self.assertEqual(response.get_json()["message"], "Duplicate update ignored")
+        self.assertEqual(mock_insert.call_count, 1)
+        self.assertEqual(len(self.replies), 1)
+
+    def test_update_that_was_not_recorded_is_processed_again(self):
+        """A failed update is released, so Telegram's redelivery is handled"""
+        body = update(5, "https://www.instagram.com/reel/RETRY/")
+        with patch.object(self.module.link_intake, "accept", side_effect=RuntimeError("disk full")):
+            self.assertEqual(self.client.post("/api/webhook", json=body).status_code, 500)
+        with patch('src.coda.insert_rows', return_value={"addedRowIds": ["i-1"]}):
+            self.client.post("/api/webhook", json=body)
+
+        self.assertEqual(self.replies, ["✅ Link saved successfully to the DDF database!"])
+
+    def test_message_without_links_counts_as_invalid(self):
+        self.client.post("/api/webhook", json=update(3, "hello there"))
+        self.monitor.record_invalid_link.assert_called_once_with()
+        self.monitor.record_valid_link.assert_not_called()
+
+    @patch('src.coda.insert_rows')
+    def test_unsaved_link_is_given_up_on_vercel(self, mock_insert):
+        """On Vercel a link Coda did not take in time is reported as not saved, not promised"""
+        mock_insert.side_effect = requests.exceptions.ConnectionError("Coda down")
+        with patch.object(self.module, "ON_VERCEL", True):
+            response = self.client.post("/api/webhook", json=update(2, "https://www.instagram.com/reel/LOST/"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("was not saved", self.replies[-1])
+        self.assertNotIn("LOST", self.module.shortcode_index)
+        status = self.module.outbox.conn.execute(
+            "SELECT status FROM outbox WHERE link = ?", ("https://www.instagram.com/reel/LOST/",)
+        ).fetchone()["status"]
+        self.assertEqual(status, STATUS_FAILED)
+
+class TestFlush(ApiTestCase):
+    """Test suite for /api/flush and the fast-ack webhook, with Coda mocked"""
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (patch.object(self.module, "CRON_SECRET", "cron"),
+                        patch.object(self.module.shortcode_index, "ensure_seeded")):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def flush(self, query="", secret="cron"):
+        return self.client.post(f"/api/flush{query}", headers={"Authorization": f"Bearer {secret}"})
+
+    def test_cron_secret_is_required(self):
+        self.assertEqual(self.flush(secret="wrong").status_code, 401)
+        with patch.object(self.module, "CRON_SECRET", ""):
+            self.assertEqual(self.flush(secret="").status_code, 401)
+
+    def test_max_seconds_is_clamped(self):
+        """A caller may shorten the time slice but not extend it past FLUSH_MAX_SECONDS"""
+        with patch.object(self.module.outbox_drainer, "drain", return_value=0) as mock_drain, \
+                patch.object(self.module, "FLUSH_MAX_SECONDS", 8):
+            self.flush("?max_seconds=60")
+            self.flush("?max_seconds=2")
+            self.flush("?max_seconds=soon")
+        self.assertEqual([c.kwargs["max_seconds"] for c in mock_drain.call_args_list], [8, 2, 8])
+
+    @patch('src.coda.insert_rows')
+    def test_fast_ack_defers_the_write_and_reply_to_flush(self, mock_insert):
+        """With WEBHOOK_FAST_ACK the webhook only records; /api/flush writes and confirms"""
+        mock_insert.return_value = {"addedRowIds": ["i-1"]}
+        with patch.object(self.module, "WEBHOOK_FAST_ACK", True):
+            response = self.client.post("/api/webhook", json=update(30, "https://www.instagram.com/reel/FAST/"))
+        self.assertEqual(response.status_code, 200)
+        mock_insert.assert_not_called()
+        self.assertEqual(self.replies, [])
+
+        response = self.flush()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["written"], 1)
+        self.assertEqual(response.get_json()["pending"], 0)
+        self.assertEqual(mock_insert.call_args[0][0], ["https://www.instagram.com/reel/FAST/"])
+        self.assertEqual(self.replies, ["✅ Link saved successfully to the DDF database!"])
+
+def scraped(shortcode, views=5):
+    return {"url": f"https://www.instagram.com/reel/{shortcode}/", "views": views}
+
+@patch('src.coda.upsert_rows', return_value=["r-1"])
+class TestBrightDataCallback(ApiTestCase):
+    """Test suite for the /api/brightdata route"""
+
+    def setUp(self):
+        super().setUp()
+        for patcher in (patch.object(self.module, "BRIGHT_DATA_WEBHOOK_SECRET", "secret"),
+                        patch.object(self.module.metrics_updater, "mutation_wait", 0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, body, content_type="application/x-ndjson", secret="secret"):
+        return self.client.post("/api/brightdata", data=body, content_type=content_type,
+                                headers={"Authorization": secret})
+
+    def test_bad_auth_is_rejected(self, mock_upsert):
+        self.assertEqual(self.post("[]", secret="wrong").status_code, 401)
+        mock_upsert.assert_not_called()
+
+    def test_ndjson_delivery(self, mock_upsert):
+        body = "\n".join(json.dumps(scraped(code)) for code in ("A", "B"))
+        response = self.post(body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["updated"], 2)
+        self.assertEqual(len(mock_upsert.call_args[0][0]), 2)
+
+    def test_json_list_delivery(self, mock_upsert):
+        response = self.post(json.dumps([scraped("A"), scraped("B"), scraped("C")]), "application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["updated"], 3)
+
+    def test_failed_notification_is_acknowledged(self, mock_upsert):
+        response = self.post(json.dumps({"snapshot_id": "s_1", "status": "failed"}), "application/json")
+        self.assertEqual(response.status_code, 200)
+        mock_upsert.assert_not_called()
+
+    def test_ready_notification_downloads_a_bounded_snapshot(self, mock_upsert):
+        """A ready snapshot is downloaded and applied, up to BRIGHT_DATA_CALLBACK_MAX_RECORDS records"""
+        downloaded = (scraped(f"R{n}") for n in range(5))
+        with patch('src.brightdata.iter_snapshot_records', return_value=downloaded) as mock_download, \
+                patch.object(self.module, "BRIGHT_DATA_CALLBACK_MAX_RECORDS", 3):
+            response = self.post(json.dumps({"snapshot_id": "s_1", "status": "ready"}), "application/json")
+
+        mock_download.assert_called_once_with("s_1", self.module.BRIGHT_DATA_API_KEY)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()["updated"], 3)
+        self.assertTrue(response.get_json()["truncated"])
+
+    def test_malformed_body_is_rejected(self, mock_upsert):
+        self.assertEqual(self.post("{not json").status_code, 400)
+        self.assertEqual(self.post("42", "application/json").status_code, 400)
+        mock_upsert.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
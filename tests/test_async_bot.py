@@ -0,0 +1,134 @@
+import os
+import sys
+import types
+import asyncio
+import importlib
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from src.sender import TelegramSender
+
+class FakeAsyncTeleBot:
+    """Stands in for telebot.async_telebot.AsyncTeleBot, which needs aiohttp"""
+
+    def __init__(self, token):
+        self.handlers = []
+        self.reply_to = AsyncMock(return_value=MagicMock())
+        self.edit_message_text = AsyncMock()
+
+    def message_handler(self, **filters):
+        def register(handler):
+            self.handlers.append((filters, handler))
+            return handler
+        return register
+
+def fake_message(text, chat_id=7, user_id=1):
+    message = MagicMock()
+    message.text = text
+    message.chat.id = chat_id
+    message.from_user.id = user_id
+    return message
+
+class TestAsyncBot(unittest.TestCase):
+    """Test suite for the asyncio bot runtime, with AsyncTeleBot mocked out"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        fake_modules = {
+            "telebot.async_telebot": types.SimpleNamespace(AsyncTeleBot=FakeAsyncTeleBot),
+            "telebot.asyncio_helper": types.SimpleNamespace(),
+        }
+        env = {
+            "TELEGRAM_BOT_TOKEN": "123:abcdefghij", "CODA_API_KEY": "kkkkkkkkkkkk",
+            "CODA_DOC_ID": "doc", "CODA_TABLE_ID": "table", "ADMIN_USERS": "",
+            "DATA_DB_PATH": os.path.join(cls.tmpdir.name, "bot.sqlite3"),
+            "BOT_ASYNC_CONCURRENCY": "40",
+        }
+        with patch.dict(sys.modules, fake_modules), patch.dict(os.environ, env):
+            sys.modules.pop("src.async_bot", None)
+            cls.module = importlib.import_module("src.async_bot")
+        sys.modules.pop("src.async_bot", None)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.module.handler_executor.shutdown(wait=False)
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        self.module._handler_slots = None
+        self.module.async_bot.reply_to.reset_mock()
+
+    def test_handlers_are_routed(self):
+        """Commands and plain messages reach their own handlers"""
+        routes = {
+            tuple(filters.get("commands") or ()) or "messages": handler.__name__
+            for filters, handler in self.module.async_bot.handlers
+        }
+        self.assertEqual(routes, {
+            ("start", "help"): "send_welcome",
+            ("stats",): "send_stats",
+            ("version",): "send_version",
+            "messages": "handle_message",
+        })
+
+    def test_replies_go_through_the_paced_sender(self):
+        """A handler's replies are sent by the shared TelegramSender"""
+        message = fake_message("/start")
+        with patch.object(self.module, "welcome_replies", return_value=["hello"]), \
+                patch.object(self.module.telegram_sender, "submit",
+                             wraps=self.module.telegram_sender.submit) as submit:
+            asyncio.run(self.module.send_welcome(message))
+
+        self.assertEqual(submit.call_args[0][0], 7)
+        self.module.async_bot.reply_to.assert_awaited_once_with(message, "hello")
+
+    def test_replies_are_in_flight_together(self):
+        """Paced replies do not wait for each other's round trip, even with one sender thread"""
+        chats = 10
+        sender = TelegramSender(global_rate=1000, global_burst=chats, workers=1)
+        self.addCleanup(sender.close, 2)
+
+        async def run_all():
+            started = []
+            release = asyncio.Event()
+
+            async def reply_to(message, text):
+                started.append(message.chat.id)
+                if len(started) == chats:
+                    release.set()
+                await release.wait()
+
+            with patch.object(self.module, "telegram_sender", sender), \
+                    patch.object(self.module.async_bot, "reply_to", reply_to):
+                await asyncio.wait_for(asyncio.gather(*(
+                    self.module.respond(fake_message("/start", chat_id=i), lambda message: ["hi"])
+                    for i in range(chats)
+                )), timeout=5)
+            return started
+
+        self.assertEqual(sorted(asyncio.run(run_all())), list(range(chats)))
+
+    def test_handlers_run_past_the_default_executor_limit(self):
+        """BOT_ASYNC_CONCURRENCY handlers block at the same time without starving each other"""
+        concurrency = self.module.BOT_ASYNC_CONCURRENCY
+        self.assertEqual(concurrency, 40)
+        barrier = threading.Barrier(concurrency, timeout=5)
+
+        def build(message):
+            barrier.wait()
+            return []
+
+        async def run_all():
+            await asyncio.gather(*(
+                self.module.respond(fake_message("link", chat_id=i, user_id=100 + i), build)
+                for i in range(concurrency)
+            ))
+
+        asyncio.run(run_all())
+        self.assertFalse(barrier.broken)
+
+if __name__ == '__main__':
+    unittest.main()
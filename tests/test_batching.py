@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from src.batching import CodaBatchWriter
+
+CODA_CONFIG = {"api_key": "key", "doc_id": "doc", "table_id": "table", "column_name": "Link"}
+
+class TestCodaBatchWriter(unittest.TestCase):
+    """Test suite for the coalescing Coda batch writer"""
+
+    @patch('src.coda.insert_rows')
+    def test_links_are_coalesced(self, mock_insert_rows):
+        """Links submitted together are written with one request"""
+        mock_insert_rows.return_value = {"requestId": "r-1", "addedRowIds": ["i-1", "i-2", "i-3"]}
+        writer = CodaBatchWriter(CODA_CONFIG, max_batch_size=10, window_ms=5000)
+
+        links = [f"https://www.instagram.com/reel/ABC{i}/" for i in range(3)]
+        futures = [writer.submit(link) for link in links]
+        writer.flush()
+
+        mock_insert_rows.assert_called_once_with(links, CODA_CONFIG, timeout=None)
+        self.assertEqual([f.result(timeout=5) for f in futures], ["i-1", "i-2", "i-3"])
+        writer.close()
+
+    @patch('src.coda.insert_rows')
+    def test_full_batch_flushes_without_waiting(self, mock_insert_rows):
+        """The background flusher does not wait for the window once the batch is full"""
+        mock_insert_rows.return_value = {"addedRowIds": ["i-1", "i-2"]}
+        writer = CodaBatchWriter(CODA_CONFIG, max_batch_size=2, window_ms=60000)
+
+        futures = [writer.submit("https://www.instagram.com/reel/A/"),
+                   writer.submit("https://www.instagram.com/reel/B/")]
+
+        self.assertEqual(futures[1].result(timeout=5), "i-2")
+        writer.close()
+
+    @patch('src.coda.insert_rows')
+    def test_failure_reaches_every_caller(self, mock_insert_rows):
+        """A failed flush is reported to each submitted link"""
+        mock_insert_rows.side_effect = requests.exceptions.RequestException("API Error")
+        writer = CodaBatchWriter(CODA_CONFIG, window_ms=5000)
+
+        futures = [writer.submit("https://www.instagram.com/reel/A/"),
+                   writer.submit("https://www.instagram.com/reel/B/")]
+        writer.flush()
+
+        for future in futures:
+            with self.assertRaises(requests.exceptions.RequestException):
+                future.result(timeout=5)
+        writer.close()
+
+if __name__ == '__main__':
+    unittest.main()
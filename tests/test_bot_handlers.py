@@ -0,0 +1,103 @@
+import os
+import sys
+import importlib
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.replies import ProgressMessage, progress_text
+
+def fake_message(text, message_id=1, chat_id=7, user_id=1):
+    message = MagicMock()
+    message.text = text
+    message.entities = None
+    message.message_id = message_id
+    message.chat.id = chat_id
+    message.from_user.id = user_id
+    message.from_user.username = "tester"
+    return message
+
+def reel_links(count):
+    return " ".join(f"https://www.instagram.com/reel/R{n:03d}/" for n in range(count))
+
+class TestMessageReplies(unittest.TestCase):
+    """Test suite for the link handler of src/bot.py, with Telegram calls mocked"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        env = {
+            "TELEGRAM_BOT_TOKEN": "123:abcdefghij", "CODA_API_KEY": "kkkkkkkkkkkk",
+            "CODA_DOC_ID": "doc", "CODA_TABLE_ID": "table", "ADMIN_USERS": "",
+            "DATA_DB_PATH": os.path.join(cls.tmpdir.name, "bot.sqlite3"),
+        }
+        with patch.dict(os.environ, env):
+            sys.modules.pop("src.bot", None)
+            cls.module = importlib.import_module("src.bot")
+        sys.modules.pop("src.bot", None)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        self.now = [0.0]
+        self.send = MagicMock(return_value="sent")
+        self.edit = MagicMock()
+        self.progress = ProgressMessage(self.send, self.edit, min_interval=0, start_delay=2,
+                                        clock=lambda: self.now[0])
+        patcher = patch.object(self.module, "monitor")
+        self.monitor = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fast_batch_gets_one_summary(self):
+        """Links recorded quickly are answered with a single summary and no progress message"""
+        replies = self.module.message_replies(fake_message(reel_links(12), message_id=10), progress=self.progress)
+
+        self.assertEqual(len(replies), 1)
+        self.assertTrue(replies[0].startswith("Processed 12 links:"))
+        self.assertIn("✅ Queued for the DDF database (12):", replies[0])
+        self.send.assert_not_called()
+        self.edit.assert_not_called()
+        self.monitor.record_valid_link.assert_called_once_with(12)
+
+    def test_redelivered_message_is_dropped(self):
+        message = fake_message(reel_links(2), message_id=13)
+        self.assertEqual(len(self.module.message_replies(message)), 1)
+        self.assertEqual(self.module.message_replies(message), [])
+
+    def test_message_that_was_not_recorded_is_processed_again(self):
+        """Links that could not be recorded leave the message open for a redelivery"""
+        message = fake_message("https://www.instagram.com/reel/RETRY/", message_id=14)
+        with patch.object(self.module, "process_instagram_links", return_value=None):
+            self.assertIn("Internal error", self.module.message_replies(message)[0])
+
+        self.assertEqual(self.module.message_replies(message), ["✅ Link queued! It will appear in the DDF database shortly."])
+
+    def test_message_without_links_counts_as_invalid(self):
+        replies = self.module.message_replies(fake_message("no links here", message_id=12))
+
+        self.assertIn("didn't recognize any Instagram links", replies[0])
+        self.monitor.record_invalid_link.assert_called_once_with()
+        self.monitor.record_valid_link.assert_not_called()
+
+    def test_slow_batch_shows_progress_then_the_summary(self):
+        """A slow batch sends one progress message and edits it into the summary"""
+        record = self.module.process_instagram_links
+
+        def slow_record(links, sender, message):
+            self.now[0] += 1.5
+            return record(links, sender, message)
+
+        with patch.object(self.module, "process_instagram_links", side_effect=slow_record):
+            replies = self.module.message_replies(fake_message(reel_links(15), message_id=11, chat_id=8),
+                                                  progress=self.progress)
+
+        self.assertEqual(replies, [])
+        self.send.assert_called_once_with(progress_text(10, 15))
+        summary = self.edit.call_args_list[-1][0][1]
+        self.assertTrue(summary.startswith("Processed 15 links:"))
+        self.assertEqual(self.edit.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import io
+import os
+import gzip
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.brightdata import (
+    BatchedScrapeTrigger, SNAPSHOT_READY, SNAPSHOT_FAILED, iter_snapshot_records, delivery_params
+)
+from src.scrape_cache import ScrapeCache
+
+def reel(shortcode):
+    return f"https://www.instagram.com/reel/{shortcode}/"
+
+def trigger_response(snapshot_id):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {"snapshot_id": snapshot_id}
+    return response
+
+def snapshot_response(body, status_code=200):
+    """A streamed snapshot download response"""
+    response = MagicMock(status_code=status_code)
+    response.__enter__.return_value = response
+    response.iter_lines.return_value = iter(body.splitlines())
+    response.raw = io.BytesIO(gzip.compress(body))
+    return response
+
+NDJSON = b'{"url": "https://www.instagram.com/reel/A/", "views": 1}\n\n{"url": "https://www.instagram.com/reel/B/", "views": 2}\n'
+
+class TestSnapshotRecords(unittest.TestCase):
+    """Test suite for streamed snapshot downloads"""
+
+    @patch('src.transport.get')
+    def test_ndjson_records_are_streamed(self, mock_get):
+        """Records are requested as NDJSON and yielded line by line"""
+        mock_get.return_value = snapshot_response(NDJSON)
+        records = iter_snapshot_records("s_1", "key", compress=False)
+        mock_get.assert_not_called()  # Nothing is fetched until iteration starts
+
+        self.assertEqual([r["views"] for r in records], [1, 2])
+        self.assertEqual(mock_get.call_args[1]["params"], {"format": "ndjson"})
+        self.assertTrue(mock_get.call_args[1]["stream"])
+
+    @patch('src.transport.get')
+    def test_gzip_snapshot_is_decompressed(self, mock_get):
+        """A compressed snapshot is decompressed as it streams"""
+        mock_get.return_value = snapshot_response(NDJSON)
+        self.assertEqual(len(list(iter_snapshot_records("s_1", "key", compress=True))), 2)
+        self.assertEqual(mock_get.call_args[1]["params"]["compress"], "true")
+
+    @patch('src.transport.get')
+    def test_snapshot_not_ready(self, mock_get):
+        """202 means the snapshot is still being built"""
+        mock_get.return_value = snapshot_response(b"", status_code=202)
+        with self.assertRaises(ValueError):
+            list(iter_snapshot_records("s_1", "key"))
+
+class TestBatchedScrapeTrigger(unittest.TestCase):
+    """Test suite for the batched Bright Data trigger client"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.trigger = BatchedScrapeTrigger(
+            "key", path=os.path.join(self.tmpdir.name, "scrape.sqlite3"),
+            max_batch_size=3, max_wait=60
+        )
+
+    def tearDown(self):
+        self.trigger.conn.close()
+        self.tmpdir.cleanup()
+
+    @patch('src.transport.post')
+    def test_full_batches_share_one_job(self, mock_post):
+        """Seven reels with a batch size of three make two jobs plus a waiting remainder"""
+        mock_post.side_effect = [trigger_response("s_1"), trigger_response("s_2")]
+        for shortcode in "ABCDEFG":
+            self.assertTrue(self.trigger.enqueue(reel(shortcode)))
+
+        self.assertEqual(self.trigger.flush(), ["s_1", "s_2"])
+        self.assertEqual(mock_post.call_count, 2)
+        payload = mock_post.call_args_list[0][1]["json"]
+        self.assertEqual(payload["inputs"], [{"url": reel(c)} for c in "ABC"])
+
+        # The last reel waits for more company or for max_wait
+        self.assertEqual(self.trigger.pending_count(), 1)
+        self.assertEqual(set(self.trigger.shortcodes_for("s_2")), {"D", "E", "F"})
+        self.assertEqual(self.trigger.open_snapshots(), ["s_1", "s_2"])
+
+    @patch('src.transport.post')
+    def test_partial_batch_waits_for_max_wait(self, mock_post):
+        """A partial batch is only sent after max_wait or when forced"""
+        mock_post.return_value = trigger_response("s_1")
+        self.trigger.enqueue(reel("A"))
+        self.trigger.enqueue("https://instagram.com/p/A/?igsh=x")  # Same reel
+        self.assertEqual(self.trigger.pending_count(), 1)
+
+        self.assertEqual(self.trigger.flush(), [])
+        self.assertTrue(self.trigger.is_due(now=self.trigger.conn.execute(
+            "SELECT queued_at FROM scrape_queue").fetchone()[0] + 61))
+        self.assertEqual(self.trigger.flush(force=True), ["s_1"])
+        self.assertEqual(self.trigger.pending_count(), 0)
+
+        self.trigger.mark_snapshot("s_1", SNAPSHOT_READY)
+        self.assertEqual(self.trigger.open_snapshots(), [])
+
+    @patch('src.transport.post')
+    def test_flush_only_named_reels(self, mock_post):
+        """A flush limited to some shortcodes leaves every other reel queued"""
+        mock_post.side_effect = [trigger_response("s_1"), trigger_response("s_2")]
+        for shortcode in "ABCDE":
+            self.trigger.enqueue(reel(shortcode))
+
+        self.assertEqual(self.trigger.flush(shortcodes=["B", "C", "D", "E", "Z"]), ["s_1", "s_2"])
+        self.assertEqual(set(self.trigger.shortcodes_for("s_1")), {"B", "C", "D"})
+        self.assertEqual(set(self.trigger.shortcodes_for("s_2")), {"E"})
+        self.assertEqual(self.trigger.waiting("ABCDE"), {"A"})
+
+    @patch('src.transport.post')
+    def test_failed_trigger_keeps_reels_queued(self, mock_post):
+        """Reels stay in the queue when the trigger call fails"""
+        mock_post.return_value = MagicMock(status_code=500)
+        mock_post.return_value.raise_for_status.side_effect = Exception("boom")
+        for shortcode in "ABC":
+            self.trigger.enqueue(reel(shortcode))
+
+        with self.assertRaises(Exception):
+            self.trigger.flush()
+        self.assertEqual(self.trigger.pending_count(), 3)
+        self.assertEqual(self.trigger.waiting(["A", "C", "Z"]), {"A", "C"})
+
+    def test_enqueue_missing_metrics(self):
+        """Only mirrored reels without views are queued"""
+        mirror = MagicMock()
+        mirror.rows.return_value = [
+            {"link": reel("A"), "values": {"Views": ""}},
+            {"link": reel("B"), "values": {"Views": 120}},
+            {"link": None, "values": {}},
+        ]
+        self.assertEqual(self.trigger.enqueue_missing_metrics(mirror), 1)
+
+    @patch('src.transport.post')
+    def test_missing_metrics_are_only_backfilled_once(self, mock_post):
+        """A reel triggered before is left to the refresh scheduler"""
+        mock_post.return_value = trigger_response("s_1")
+        mirror = MagicMock()
+        mirror.rows.return_value = [{"link": reel("A"), "values": {"Views": None}}]
+
+        self.assertEqual(self.trigger.enqueue_missing_metrics(mirror), 1)
+        self.trigger.flush(force=True)
+        self.assertEqual(self.trigger.enqueue_missing_metrics(mirror), 0)
+
+    def test_delivery_is_requested_as_ndjson(self):
+        """Webhook deliveries use the same line-by-line format as downloads"""
+        params = delivery_params("https://bot.example/api/brightdata", "secret")
+        self.assertEqual(params["format"], "ndjson")
+
+    @patch('src.transport.post')
+    def test_delivered_metrics_are_cached_from_the_mirror(self, mock_post):
+        """Reels whose rows changed after the trigger count as delivered"""
+        self.trigger.cache = ScrapeCache(os.path.join(self.tmpdir.name, "scrape.sqlite3"))
+        mock_post.side_effect = [trigger_response("s_1"), trigger_response("s_2")]
+        self.trigger.enqueue(reel("A"))
+        self.trigger.flush(force=True)
+        self.trigger.enqueue(reel("B"))
+        self.trigger.flush(force=True)
+        triggered_at = self.trigger.conn.execute("SELECT MAX(triggered_at) FROM snapshots").fetchone()[0]
+
+        mirror = MagicMock()
+        mirror.get.side_effect = lambda shortcode: {
+            "A": {"updated_at": triggered_at + 60, "values": {"Account": "ddf", "Views": 120}},
+            "B": {"updated_at": triggered_at - 60, "values": {"Views": ""}},
+        }[shortcode]
+
+        self.assertEqual(self.trigger.absorb_deliveries(mirror, now=triggered_at + 120), 1)
+        self.assertEqual(self.trigger.cache.get("A", now=triggered_at + 120)["views"], 120)
+        self.assertEqual(self.trigger.cache.scraped_at("A"), triggered_at + 60)
+        self.assertEqual(self.trigger.open_snapshots(), ["s_2"])
+
+        # B never changed: its snapshot is given up after the timeout
+        self.trigger.absorb_deliveries(mirror, now=triggered_at + 120, timeout=60)
+        self.assertEqual(self.trigger.open_snapshots(), [])
+        status = self.trigger.conn.execute("SELECT status FROM snapshots WHERE snapshot_id = 's_2'").fetchone()[0]
+        self.assertEqual(status, SNAPSHOT_FAILED)
+        self.trigger.cache.conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
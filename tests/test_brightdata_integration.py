@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 
 import os
-import requests
 import json
-import time
 from dotenv import load_dotenv
 from pprint import pprint
 
+from src import brightdata, transport
+from src.row_index import RowIndex
+from src.snapshot_poller import SnapshotPoller
+from src.metrics import MetricsUpdater, record_to_cells
+
 def test_brightdata_api(reel_url):
     """Test the Bright Data API with a single Instagram Reel URL"""
     
@@ -39,7 +42,7 @@ def test_brightdata_api(reel_url):
     print(f"Using payload: {json.dumps(payload, indent=2)}")
     
     try:
-        response = requests.post(endpoint, json=payload, headers=headers)
+        response = transport.post(endpoint, json=payload, headers=headers)
         
         print(f"Response status code: {response.status_code}")
         print(f"Response body: {response.text}")
@@ -57,47 +60,25 @@ def test_brightdata_api(reel_url):
         return None
 
 def get_scraping_results(snapshot_id):
-    """Get the results of a scraping job using the snapshot ID"""
+    """Stream the results of a scraping job using the snapshot ID"""
     
     # Load API key from environment variables
     api_key = os.getenv("BRIGHT_DATA_API_KEY")
     
     if not api_key:
         print("❌ Error: BRIGHT_DATA_API_KEY not found in environment variables")
-        return None
-        
-    # API endpoint to get results - CORRECTED from documentation
-    # Note: it's "snapshot" (singular), not "snapshots"
-    endpoint = f"https://api.brightdata.com/datasets/v3/snapshot/{snapshot_id}"
-    
-    # Add query parameters for format and compression
-    query_params = {
-        "format": "json",
-        "compress": "false"
-    }
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}"
-    }
+        return
     
     print(f"Fetching results for snapshot ID: {snapshot_id}")
     
+    # The snapshot is downloaded as NDJSON and yielded record by record
     try:
-        response = requests.get(endpoint, params=query_params, headers=headers)
-        print(f"Response status code: {response.status_code}")
-        print(f"Response body preview: {response.text[:200]}...")
-        
-        if response.status_code == 200:
-            print("✅ Successfully retrieved results")
-            result = response.json()
-            return result
-        else:
-            print(f"❌ Error retrieving results: {response.text}")
-            return None
-            
+        for count, record in enumerate(brightdata.iter_snapshot_records(snapshot_id, api_key), 1):
+            print(f"Record {count}: {record.get('url', record.get('input', {}).get('url'))}")
+            yield record
+        print("✅ Successfully retrieved results")
     except Exception as e:
         print(f"❌ Error making request: {str(e)}")
-        return None
 
 def update_coda_with_results(reel_url, results):
     """Update the Coda database with the results from Bright Data"""
@@ -111,39 +92,14 @@ def update_coda_with_results(reel_url, results):
         print("❌ Error: Missing Coda environment variables")
         return False
     
-    # First, find the row with the matching URL
-    search_url = f"https://coda.io/apis/v1/docs/{DOC_ID}/tables/{TABLE_ID}/rows"
-    headers = {
-        "Authorization": f"Bearer {CODA_API_KEY}"
+    coda_config = {
+        "api_key": CODA_API_KEY,
+        "doc_id": DOC_ID,
+        "table_id": TABLE_ID,
+        "column_name": "Link"
     }
     
     try:
-        # Get all rows to find the one with our URL
-        response = requests.get(search_url, headers=headers)
-        
-        if response.status_code != 200:
-            print(f"❌ Error searching for row: {response.text}")
-            return False
-            
-        rows = response.json().get("items", [])
-        target_row_id = None
-        
-        for row in rows:
-            cells = row.get("values", {})
-            # Iterate through cells to find the one with our URL
-            for col_id, value in cells.items():
-                if value == reel_url:
-                    target_row_id = row.get("id")
-                    break
-            
-            if target_row_id:
-                break
-                
-        if not target_row_id:
-            print(f"❌ Error: Could not find row with URL: {reel_url}")
-            return False
-            
-        # Now update the row with the scraped data
         # The structure of the results depends on which endpoint we used
         if not results:
             print("❌ Error: No results data to update")
@@ -152,51 +108,32 @@ def update_coda_with_results(reel_url, results):
         # Try to determine where the actual reel data is in the response
         # According to documentation, results should be in the "results" array
         if "results" in results:
-            if not results["results"]:
-                print("❌ Error: Empty results array")
-                return False
-            reel_data = results["results"][0]  # Get the first item from results
+            records = results["results"]
         elif "items" in results:
-            if not results["items"]:
-                print("❌ Error: Empty items array")
-                return False
-            reel_data = results["items"][0]  # Get the first item from results
+            records = results["items"]
         else:
             print("❌ Error: Unexpected results format, could not find reel data")
             print(f"Results keys: {results.keys()}")
             return False
         
-        # Map Bright Data fields to Coda columns
-        update_url = f"https://coda.io/apis/v1/docs/{DOC_ID}/tables/{TABLE_ID}/rows/{target_row_id}"
-        update_headers = {
-            "Authorization": f"Bearer {CODA_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        # Prepare update payload - mapping Bright Data fields to Coda columns
-        # Field names might vary depending on the API response format
-        update_payload = {
-            "row": {
-                "cells": [
-                    {"column": "Account", "value": reel_data.get("username", reel_data.get("user_posted", ""))},
-                    {"column": "Name", "value": reel_data.get("description", "")},
-                    {"column": "Likes", "value": reel_data.get("likes", 0)},
-                    {"column": "Comments", "value": reel_data.get("comments", reel_data.get("num_comments", 0))},
-                    {"column": "Views", "value": reel_data.get("views", 0)}
-                ]
-            }
-        }
+        if not records:
+            print("❌ Error: Empty results array")
+            return False
         
-        print(f"Updating Coda row with data: {json.dumps(update_payload, indent=2)}")
+        # Scraped for this link, whatever canonical URL Bright Data reports
+        records = [{**record, "input": {"url": reel_url}} for record in records]
+        print(f"Updating Coda with data: {json.dumps(record_to_cells(records[0]), indent=2)}")
         
-        update_response = requests.put(update_url, json=update_payload, headers=update_headers)
+        # One multi-row upsert keyed on the Link column, rows found through
+        # the shortcode -> row id index shared with the bot
+        result = MetricsUpdater(coda_config, RowIndex()).apply(records)
         
-        if update_response.status_code == 200:
-            print("✅ Successfully updated Coda row with scraped data")
-            return True
-        else:
-            print(f"❌ Error updating row: {update_response.text}")
+        if not result["updated"]:
+            print(f"❌ Error: Could not find row with URL: {reel_url}")
             return False
+        
+        print(f"✅ Successfully updated {result['updated']} Coda row(s) in {result['requests']} request(s)")
+        return True
             
     except Exception as e:
         print(f"❌ Error interacting with Coda API: {str(e)}")
@@ -235,7 +172,7 @@ def add_url_to_coda(reel_url):
     print(f"Adding URL to Coda: {reel_url}")
     
     try:
-        response = requests.post(url, json=body, headers=headers)
+        response = transport.post(url, json=body, headers=headers)
         
         if response.status_code == 202:
             print("✅ Successfully added URL to Coda")
@@ -279,16 +216,22 @@ def main():
     print(f"\n=== Step 3: Waiting for scraping to complete for snapshot {snapshot_id} ===")
     print("Note: In a production system, this would be handled by a webhook callback")
     
-    # Wait for a moment to allow the scraping to begin
-    wait_time = 10
-    print(f"Waiting {wait_time} seconds before checking results...")
-    time.sleep(wait_time)
+    # Poll the progress endpoint and download the snapshot as soon as it is ready
+    results = {}
+    poller = SnapshotPoller(
+        os.getenv("BRIGHT_DATA_API_KEY"),
+        on_ready=lambda sid, records: results.update({sid: {"items": list(records)}}),
+        on_failed=lambda sid, status: print(f"❌ Snapshot {sid} {status}")
+    )
+    poller.add(snapshot_id)
+    finished = poller.run_until_idle(timeout=600)
+    poller.stop()
     
     # Step 4: Get the results from Bright Data
     print("\n=== Step 4: Getting results from Bright Data ===")
-    scraping_results = get_scraping_results(snapshot_id)
+    scraping_results = results.get(snapshot_id)
     
-    if not scraping_results:
+    if not finished or not scraping_results:
         print("Failed to get scraping results. Exiting test.")
         return
     
@@ -1,14 +1,14 @@
 #!/usr/bin/env python3
 
 import os
-import requests
-import json
 import time
 from dotenv import load_dotenv
 from pprint import pprint
 
+from src import brightdata
+
 def retrieve_snapshot(snapshot_id):
-    """Retrieve a snapshot from Bright Data API using its ID"""
+    """Stream the records of a Bright Data snapshot once it is ready"""
     
     # Load API key
     load_dotenv()
@@ -18,59 +18,31 @@ def retrieve_snapshot(snapshot_id):
         print("❌ Error: BRIGHT_DATA_API_KEY not found in environment variables")
         return None
     
-    # Endpoint for retrieving snapshots
-    endpoint = f"https://api.brightdata.com/datasets/v3/snapshots/{snapshot_id}"
-    
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
     print(f"Retrieving snapshot with ID: {snapshot_id}")
     
-    # Try to retrieve the snapshot with retries
+    # Wait for the snapshot with retries
     max_retries = 10
     retry_delay = 3  # seconds
     
     for attempt in range(1, max_retries + 1):
         try:
             print(f"\nAttempt {attempt}/{max_retries} to retrieve snapshot")
-            response = requests.get(endpoint, headers=headers)
-            
-            print(f"Response status code: {response.status_code}")
+            status = brightdata.get_snapshot_progress(snapshot_id, api_key)
+            print(f"Snapshot status: {status}")
             
-            if response.status_code == 200:
-                data = response.json()
-                status = data.get("status")
-                print(f"Snapshot status: {status}")
-                
-                # If the snapshot is ready, return the data
-                if status == "success":
-                    print("✅ Successfully retrieved snapshot data")
-                    return data
-                
-                # If the snapshot is still processing, wait and retry
-                elif status in ["pending", "processing", "in_progress"]:
-                    print(f"Snapshot is still {status}, waiting before retry...")
-                    time.sleep(retry_delay)
-                    continue
-                
-                # If the snapshot failed, return the error
-                else:
-                    print(f"❌ Snapshot processing failed with status: {status}")
-                    return data
+            # If the snapshot is ready, stream its records (NDJSON, one per line)
+            if status == "ready":
+                print("✅ Snapshot is ready, streaming records")
+                return brightdata.iter_snapshot_records(snapshot_id, api_key)
             
-            else:
-                print(f"Response body: {response.text}")
-                
-                # If we're getting a 404 or other error, it might not be ready yet
-                if response.status_code == 404:
-                    print(f"Snapshot not found, might still be processing. Waiting before retry...")
-                    time.sleep(retry_delay)
-                    continue
-                
-                print(f"❌ Failed to retrieve snapshot: HTTP {response.status_code}")
+            # If the snapshot failed, stop
+            if status == "failed":
+                print(f"❌ Snapshot processing failed with status: {status}")
                 return None
+            
+            # The snapshot is still being built, wait and retry
+            print(f"Snapshot is still {status}, waiting before retry...")
+            time.sleep(retry_delay)
                 
         except Exception as e:
             print(f"❌ Error retrieving snapshot: {str(e)}")
@@ -90,22 +62,19 @@ def main():
     print(f"Attempting to retrieve snapshot ID: {SNAPSHOT_ID}")
     
     # Retrieve the snapshot
-    result = retrieve_snapshot(SNAPSHOT_ID)
+    records = retrieve_snapshot(SNAPSHOT_ID)
     
-    if result:
-        print("\n=== Snapshot Data ===")
-        pprint(result)
-        
-        # If there's output data, show a sample
-        output_data = result.get("output")
-        if output_data:
-            print("\n=== Sample Output Data ===")
-            if isinstance(output_data, list) and len(output_data) > 0:
-                pprint(output_data[0])
-            else:
-                pprint(output_data)
-    else:
+    if records is None:
         print("\n❌ Failed to retrieve snapshot data")
+        return
+    
+    # Records are printed as they arrive; only one is held in memory at a time
+    count = 0
+    for count, record in enumerate(records, 1):
+        if count == 1:
+            print("\n=== Sample Output Data ===")
+            pprint(record)
+    print(f"\n=== Snapshot Data: {count} records ===")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main() 
@@ -0,0 +1,92 @@
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src import coda
+
+CODA_CONFIG = {"api_key": "key", "doc_id": "doc", "table_id": "table", "column_name": "Link"}
+
+def page(items, next_page_token=None):
+    """Build a mocked Coda list response"""
+    response = MagicMock()
+    response.json.return_value = {"items": items, "nextPageToken": next_page_token}
+    return response
+
+class TestCodaRowIterator(unittest.TestCase):
+    """Test suite for the streaming Coda row reader"""
+
+    @patch('src.transport.get')
+    def test_pages_are_streamed_lazily(self, mock_get):
+        """The next page is only requested once the current one is consumed"""
+        mock_get.side_effect = [
+            page([{"id": "i-1", "values": {"Link": "a"}}], "token-2"),
+            page([{"id": "i-2", "values": {"Link": "b"}}]),
+        ]
+
+        rows = coda.iter_rows(CODA_CONFIG, sort_by="updatedAt", page_size=1)
+        self.assertEqual(next(rows)["id"], "i-1")
+        self.assertEqual(mock_get.call_count, 1)
+
+        first_params = mock_get.call_args_list[0][1]["params"]
+        self.assertEqual(first_params["sortBy"], "updatedAt")
+        self.assertEqual(first_params["valueFormat"], "simple")
+        self.assertEqual(first_params["useColumnNames"], "true")
+
+        self.assertEqual([row["id"] for row in rows], ["i-2"])
+        self.assertEqual(mock_get.call_args_list[1][1]["params"], {"pageToken": "token-2"})
+
+    @patch('src.transport.get')
+    def test_column_projection(self, mock_get):
+        """Only the requested columns are kept"""
+        mock_get.return_value = page([{"id": "i-1", "values": {"Link": "a", "Views": 5, "Notes": "long"}}])
+
+        rows = list(coda.iter_rows(CODA_CONFIG, columns=["Link", "Views"]))
+        self.assertEqual(rows[0]["values"], {"Link": "a", "Views": 5})
+
+class TestCodaUpsert(unittest.TestCase):
+    """Test suite for chunked multi-row upserts"""
+
+    @patch('src.transport.post')
+    def test_rows_are_chunked_under_payload_limit(self, mock_post):
+        """Every request body stays under the byte limit and carries keyColumns"""
+        mock_post.side_effect = [
+            MagicMock(json=MagicMock(return_value={"requestId": f"req-{i}"})) for i in range(10)
+        ]
+        rows = [
+            [{"column": "Link", "value": f"https://www.instagram.com/reel/R{i}/"},
+             {"column": "Name", "value": "x" * 200}]
+            for i in range(40)
+        ]
+
+        request_ids = coda.upsert_rows(rows, ["Link"], CODA_CONFIG, max_bytes=2000)
+
+        self.assertEqual(request_ids, [f"req-{i}" for i in range(mock_post.call_count)])
+        self.assertGreater(mock_post.call_count, 1)
+        sent = 0
+        for call in mock_post.call_args_list:
+            body = call[1]["json"]
+            self.assertEqual(body["keyColumns"], ["Link"])
+            self.assertLessEqual(len(json.dumps(body)), 2000)
+            sent += len(body["rows"])
+        self.assertEqual(sent, 40)
+
+    @patch('src.coda.time.sleep')
+    @patch('src.transport.get')
+    def test_wait_for_mutations(self, mock_get, mock_sleep):
+        """Requests are polled until Coda reports them completed"""
+        statuses = iter([
+            {"completed": True, "warning": "Row limit"},
+            {"completed": False},
+            {"completed": True},
+        ])
+        mock_get.side_effect = lambda url, **kwargs: MagicMock(json=MagicMock(return_value=next(statuses)))
+
+        result = coda.wait_for_mutations(["req-1", "req-2"], CODA_CONFIG, timeout=10, poll_interval=0)
+
+        self.assertEqual(result["completed"], ["req-1", "req-2"])
+        self.assertEqual(result["pending"], [])
+        self.assertEqual(result["warnings"], {"req-1": "Row limit"})
+        self.assertIn("/mutationStatus/req-2", mock_get.call_args[0][0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from src.dedup import UpdateDeduplicator, update_key, message_key
+
+class TestUpdateDeduplicator(unittest.TestCase):
+    """Test suite for the update idempotency cache"""
+
+    def test_redelivery_is_detected(self):
+        """A key is only new until it has been added"""
+        dedup = UpdateDeduplicator(store="memory")
+        key = update_key(1001)
+
+        self.assertFalse(dedup.seen(key))
+        dedup.add(key)
+        self.assertTrue(dedup.seen(key))
+        self.assertFalse(dedup.seen(message_key(42, 1001)))
+
+    def test_claim_is_granted_once(self):
+        """Only the first claim of a key succeeds, until it is released"""
+        dedup = UpdateDeduplicator(store="memory")
+        key = update_key(1002)
+
+        self.assertTrue(dedup.claim(key))
+        self.assertFalse(dedup.claim(key))
+        self.assertTrue(dedup.seen(key))
+
+        dedup.release(key)
+        self.assertFalse(dedup.seen(key))
+        self.assertTrue(dedup.claim(key))
+
+    def test_memory_is_bounded(self):
+        """The oldest keys are evicted once capacity is reached"""
+        dedup = UpdateDeduplicator(capacity=3, store="memory")
+        for update_id in range(5):
+            dedup.add(update_key(update_id))
+
+        self.assertFalse(dedup.seen(update_key(0)))
+        self.assertFalse(dedup.seen(update_key(1)))
+        self.assertTrue(dedup.seen(update_key(4)))
+
+    def test_sqlite_store_is_shared(self):
+        """Instances backed by the same SQLite file see each other's keys"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "dedup.sqlite3")
+            first = UpdateDeduplicator(store="sqlite", path=path)
+            second = UpdateDeduplicator(store="sqlite", path=path)
+
+            first.add(update_key(7))
+            self.assertTrue(second.seen(update_key(7)))
+            self.assertFalse(second.seen(update_key(8)))
+
+            first._conn.close()
+            second._conn.close()
+
+    def test_sqlite_claim_is_atomic_across_instances(self):
+        """Two processes claiming the same key cannot both win"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "dedup.sqlite3")
+            first = UpdateDeduplicator(store="sqlite", path=path)
+            second = UpdateDeduplicator(store="sqlite", path=path)
+
+            self.assertTrue(first.claim(update_key(9)))
+            self.assertFalse(second.claim(update_key(9)))
+
+            first.release(update_key(9))
+            self.assertTrue(second.claim(update_key(9)))
+
+            first._conn.close()
+            second._conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
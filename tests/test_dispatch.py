@@ -0,0 +1,158 @@
+import time
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.dispatch import LaneDispatcher, LaneTeleBot, chat_key
+
+def fake_message(chat_id):
+    message = MagicMock()
+    message.chat.id = chat_id
+    return message
+
+@patch('src.dispatch.monitor', MagicMock())
+class TestLaneDispatcher(unittest.TestCase):
+    """Test suite for the per-chat lane dispatcher"""
+
+    def test_one_chat_runs_in_order(self):
+        """Tasks with the same key run one after another in submission order"""
+        dispatcher = LaneDispatcher(lanes=4)
+        seen = []
+
+        def task(n):
+            time.sleep(0.001 * (5 - n))
+            seen.append(n)
+
+        for n in range(5):
+            dispatcher.submit(42, task, n)
+        dispatcher.join()
+        dispatcher.stop()
+        self.assertEqual(seen, [0, 1, 2, 3, 4])
+
+    def test_chats_run_in_parallel(self):
+        """A blocked chat does not hold up another chat"""
+        dispatcher = LaneDispatcher(lanes=2)
+        release = threading.Event()
+        done = threading.Event()
+        self.assertNotEqual(dispatcher.lane_for(0), dispatcher.lane_for(1))
+
+        dispatcher.submit(0, release.wait, 5)
+        dispatcher.submit(1, done.set)
+        self.assertTrue(done.wait(2))
+        release.set()
+        dispatcher.join()
+        dispatcher.stop()
+
+    def test_lane_queue_is_bounded(self):
+        """A full lane reports its depth and blocks further submissions"""
+        dispatcher = LaneDispatcher(lanes=1, queue_size=2)
+        release = threading.Event()
+        started = threading.Event()
+
+        def blocker():
+            started.set()
+            release.wait(5)
+
+        dispatcher.submit(7, blocker)
+        started.wait(2)
+        dispatcher.submit(7, lambda: None)
+        dispatcher.submit(7, lambda: None)
+        self.assertEqual(dispatcher.depths(), [2])
+
+        blocked = threading.Thread(target=dispatcher.submit, args=(7, lambda: None))
+        blocked.start()
+        blocked.join(0.2)
+        self.assertTrue(blocked.is_alive())
+
+        release.set()
+        blocked.join(2)
+        dispatcher.join()
+        dispatcher.stop()
+
+    def test_priority_lane_is_not_starved(self):
+        """Priority tasks run while every regular lane is blocked"""
+        dispatcher = LaneDispatcher(lanes=2)
+        release = threading.Event()
+        done = threading.Event()
+        started = threading.Semaphore(0)
+
+        def blocker():
+            started.release()
+            release.wait(5)
+
+        for chat in range(4):
+            dispatcher.submit(chat, blocker)
+        # Both lane workers are busy, each with one more task queued
+        started.acquire(timeout=2)
+        started.acquire(timeout=2)
+        dispatcher.submit_priority(done.set)
+
+        self.assertTrue(done.wait(2))
+        self.assertEqual(dispatcher.queue_depths(), {"priority": 0, "lanes": [1, 1]})
+        release.set()
+        dispatcher.join()
+        dispatcher.stop()
+
+    def test_join_waits_up_to_its_timeout(self):
+        """join() waits for queued tasks up to its timeout"""
+        dispatcher = LaneDispatcher(lanes=1)
+        release = threading.Event()
+        seen = []
+
+        dispatcher.submit(7, release.wait, 5)
+        dispatcher.submit(7, seen.append, 1)
+        self.assertFalse(dispatcher.join(timeout=0.1))
+
+        release.set()
+        self.assertTrue(dispatcher.join(timeout=2))
+        dispatcher.stop()
+        self.assertEqual(seen, [1])
+
+    def test_failing_task_keeps_lane_alive(self):
+        """An exception is recorded and the lane goes on with the next task"""
+        dispatcher = LaneDispatcher(lanes=1)
+        done = threading.Event()
+
+        def fail():
+            raise RuntimeError("boom")
+
+        dispatcher.submit(1, fail)
+        dispatcher.submit(1, done.set)
+        self.assertTrue(done.wait(2))
+        dispatcher.stop()
+
+    def test_chat_key(self):
+        """Messages and callback queries resolve to their chat id"""
+        callback = MagicMock(spec=["message"])
+        callback.message = fake_message(5)
+        self.assertEqual(chat_key(fake_message(3)), 3)
+        self.assertEqual(chat_key(callback), 5)
+        self.assertIsNone(chat_key([fake_message(3)]))
+
+    def test_telebot_routes_handlers_by_chat(self):
+        """LaneTeleBot queues handler calls on the lane of the message's chat"""
+        bot = LaneTeleBot("123:abc", lanes=4)
+        bot.dispatcher = MagicMock()
+        handler = MagicMock()
+        message = fake_message(9)
+
+        bot._exec_task(handler, message, update_type="message")
+
+        bot.dispatcher.submit.assert_called_once_with(9, handler, message, update_type="message")
+
+    def test_priority_updates_skip_the_lanes(self):
+        """Updates selected by is_priority go to the priority lane"""
+        bot = LaneTeleBot("123:abc", lanes=4, is_priority=lambda update: update.text.startswith("/"))
+        bot.dispatcher = MagicMock()
+        handler = MagicMock()
+        command, link = fake_message(9), fake_message(9)
+        command.text, link.text = "/stats", "https://www.instagram.com/reel/A/"
+
+        bot._exec_task(handler, command)
+        bot._exec_task(handler, link)
+
+        bot.dispatcher.submit_priority.assert_called_once_with(handler, command)
+        bot.dispatcher.submit.assert_called_once_with(9, handler, link)
+
+if __name__ == '__main__':
+    unittest.main()
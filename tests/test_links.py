@@ -0,0 +1,99 @@
+import unittest
+
+from src.links import (
+    canonicalize_instagram_link, parse_instagram_link, scan_instagram_links, extract_message_links
+)
+
+class TestCanonicalLinks(unittest.TestCase):
+    """Test suite for Instagram link canonicalization"""
+
+    def test_variants_share_a_shortcode(self):
+        """Different spellings of the same reel reduce to one shortcode"""
+        variants = [
+            "https://www.instagram.com/reel/ABC123/",
+            "https://instagram.com/reel/ABC123",
+            "https://www.instagram.com/p/ABC123/?hl=en",
+            "https://www.instagram.com/reels/ABC123/",
+            "instagram.com/reel/ABC123",
+            "https://www.instagram.com/some.user/reel/ABC123/?igsh=xyz",
+        ]
+        for link in variants:
+            self.assertEqual(canonicalize_instagram_link(link), "ABC123", link)
+
+    def test_link_types(self):
+        """The link type is reported alongside the shortcode"""
+        self.assertEqual(parse_instagram_link("https://www.instagram.com/tv/X_1-2/"), ("X_1-2", "tv"))
+        self.assertEqual(parse_instagram_link("https://www.instagram.com/p/X/"), ("X", "post"))
+        self.assertEqual(parse_instagram_link("https://www.instagram.com/share/reel/_kZE3ysBY"),
+                         ("share:_kZE3ysBY", "share"))
+
+    def test_non_media_links(self):
+        """Profiles, stories and other hosts have no shortcode"""
+        for link in ["https://www.instagram.com/stories/username/12345/",
+                     "https://www.instagram.com/username/",
+                     "https://www.facebook.com/reel/12345",
+                     "https://example.com/reel/ABC/",
+                     "https://evil-instagram.com/reel/ABC",
+                     "https://www.instagram.com/reels/audio/123456789/"]:
+            self.assertIsNone(canonicalize_instagram_link(link), link)
+
+class TestLinkExtraction(unittest.TestCase):
+    """Test suite for the entity-aware link extractor and the fallback scanner"""
+
+    def test_scanner_finds_links_in_text(self):
+        """Links are found with their shortcode and type, repeats are dropped"""
+        text = ("new reels https://www.instagram.com/reel/ABC123/?igsh=x and "
+                "instagram.com/p/DEF456 plus https://instagram.com/reel/ABC123 again "
+                "but not https://www.instagram.com/stories/user/1/")
+        links = scan_instagram_links(text)
+
+        self.assertEqual([(link.shortcode, link.link_type) for link in links],
+                         [("ABC123", "reel"), ("DEF456", "post")])
+        self.assertEqual(links[0].url, "https://www.instagram.com/reel/ABC123/?igsh=x")
+
+    def test_text_link_entities(self):
+        """Hidden text_link URLs are picked up from the entities"""
+        entities = [{"type": "text_link", "offset": 0, "length": 4,
+                     "url": "https://www.instagram.com/tv/TV1/"}]
+        links = extract_message_links("this", entities)
+        self.assertEqual([(link.shortcode, link.link_type) for link in links], [("TV1", "tv")])
+
+    def test_url_entity_offsets_are_utf16(self):
+        """Entity offsets count UTF-16 code units, so emoji before the link are handled"""
+        url = "https://www.instagram.com/reel/XYZ/"
+        text = f"🔥🔥 {url}"
+        entities = [{"type": "url", "offset": 5, "length": len(url)}]
+        links = extract_message_links(text, entities)
+        self.assertEqual([link.url for link in links], [url])
+
+    def test_lookalike_hosts_and_audio_pages(self):
+        """Other hosts ending in instagram.com and audio pages are not links"""
+        text = ("notinstagram.com/reel/ABC/ https://evil-instagram.com/reel/DEF "
+                "https://www.instagram.com/reels/audio/123456789/ "
+                "http://m.instagram.com/reel/GHI/")
+        links = scan_instagram_links(text)
+        self.assertEqual([(link.url, link.shortcode) for link in links],
+                         [("http://m.instagram.com/reel/GHI/", "GHI")])
+
+    def test_host_is_case_insensitive(self):
+        """A capitalised host is found, and shortcodes keep their case"""
+        text = "İ Look: HTTPS://WWW.Instagram.com/reel/AbC/ and Instagram.com/share/reel/_kZE3ysBY"
+        links = scan_instagram_links(text)
+        self.assertEqual([(link.url, link.shortcode) for link in links], [
+            ("HTTPS://WWW.Instagram.com/reel/AbC/", "AbC"),
+            ("Instagram.com/share/reel/_kZE3ysBY", "share:_kZE3ysBY"),
+        ])
+        self.assertEqual([link.shortcode for link in links],
+                         [canonicalize_instagram_link(link.url) for link in links])
+
+    def test_adversarial_input_is_bounded(self):
+        """Pathological inputs only match within the pattern's bounds"""
+        self.assertEqual(scan_instagram_links("https://instagram.com/" * 5000), [])
+        self.assertEqual(scan_instagram_links("https://instagram.com/" + "a." * 50000), [])
+
+        links = scan_instagram_links("https://instagram.com/reel/ABC/?" + "x" * 100000)
+        self.assertEqual([link.shortcode for link in links], ["ABC"])
+        self.assertLessEqual(len(links[0].url), len("https://instagram.com/reel/ABC/?") + 512)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import requests
+from unittest.mock import patch, MagicMock
+
+from src.metrics import MetricsUpdater, record_link, record_to_cells
+
+CODA_CONFIG = {"api_key": "key", "doc_id": "doc", "table_id": "table", "column_name": "Link"}
+
+class TestMetricsUpdater(unittest.TestCase):
+    """Test suite for the scraped metrics Coda update stage"""
+
+    def test_record_to_cells(self):
+        """Bright Data fields map to the Reels table columns"""
+        cells = record_to_cells({"user_posted": "ddf", "description": "Hi", "likes": 5, "num_comments": 2, "views": 90})
+        self.assertEqual({c["column"]: c["value"] for c in cells},
+                         {"Account": "ddf", "Name": "Hi", "Likes": 5, "Comments": 2, "Views": 90})
+
+    def test_record_link_prefers_input(self):
+        """The input URL is the one we triggered, so it matches our index"""
+        record = {"url": "https://www.instagram.com/reel/ABC/", "input": {"url": "https://www.instagram.com/share/reel/xyz"}}
+        self.assertEqual(record_link(record), "https://www.instagram.com/share/reel/xyz")
+
+    @patch('src.coda.wait_for_mutations')
+    @patch('src.coda.upsert_rows')
+    def test_apply_upserts_indexed_rows(self, mock_upsert, mock_wait):
+        """Known reels are upserted on their stored link; errors and unknown reels are skipped"""
+        mock_upsert.return_value = ["req-1"]
+        mock_wait.return_value = {"completed": ["req-1"], "pending": [], "warnings": {}}
+        row_index = MagicMock()
+        row_index.find_entry.side_effect = lambda link, cfg: (
+            {"row_id": "i-1", "link": "https://www.instagram.com/reel/ABC/?igsh=x"} if "ABC" in link else None
+        )
+        updater = MetricsUpdater(CODA_CONFIG, row_index)
+
+        result = updater.apply([
+            {"url": "https://www.instagram.com/reel/ABC/", "views": 10},
+            {"url": "https://www.instagram.com/reel/NOPE/", "views": 3},
+            {"input": {"url": "https://www.instagram.com/reel/ERR/"}, "error": "dead_page"},
+        ])
+
+        self.assertEqual(result, {"updated": 1, "skipped": 2, "requests": 1, "pending": 0})
+        rows, key_columns = mock_upsert.call_args[0][:2]
+        self.assertEqual(key_columns, ["Link"])
+        self.assertEqual(rows[0][0], {"column": "Link", "value": "https://www.instagram.com/reel/ABC/?igsh=x"})
+
+    @patch('src.coda.wait_for_mutations')
+    @patch('src.coda.upsert_rows')
+    def test_apply_consumes_a_stream_in_batches(self, mock_upsert, mock_wait):
+        """A generator is consumed batch by batch, never as a whole"""
+        consumed = []
+
+        def stream():
+            for i in range(5):
+                consumed.append(i)
+                yield {"url": f"https://www.instagram.com/reel/R{i}/", "views": i}
+
+        def upsert(rows, key_columns, cfg):
+            # Only the records of the current batch have been read
+            self.assertEqual(len(consumed), mock_upsert.call_count * 2 - 2 + len(rows))
+            return [f"req-{mock_upsert.call_count}"]
+
+        row_index = MagicMock()
+        row_index.find_entry.return_value = {"row_id": "i-1", "link": None}
+        mock_upsert.side_effect = upsert
+
+        result = MetricsUpdater(CODA_CONFIG, row_index, batch_size=2, mutation_wait=0).apply(stream())
+        self.assertEqual(result, {"updated": 5, "skipped": 0, "requests": 3, "pending": 3})
+        mock_wait.assert_not_called()
+
+    @patch('src.coda.wait_for_mutations')
+    @patch('src.coda.upsert_rows')
+    def test_records_are_cached_after_the_upsert(self, mock_upsert, mock_wait):
+        """A failed upsert leaves the cache untouched, so the reel is scraped again"""
+        row_index = MagicMock()
+        row_index.find_entry.return_value = {"row_id": "i-1", "link": None}
+        cache = MagicMock()
+        updater = MetricsUpdater(CODA_CONFIG, row_index, cache=cache, mutation_wait=0)
+        record = {"url": "https://www.instagram.com/reel/ABC/", "views": 10}
+
+        mock_upsert.side_effect = requests.exceptions.ConnectionError("down")
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            updater.apply([record])
+        cache.put.assert_not_called()
+
+        mock_upsert.side_effect = None
+        mock_upsert.return_value = ["req-1"]
+        updater.apply([record])
+        cache.put.assert_called_once_with(record)
+
+    @patch('src.coda.wait_for_mutations')
+    @patch('src.coda.upsert_rows')
+    def test_apply_without_row_index_keys_on_the_triggered_link(self, mock_upsert, mock_wait):
+        """Without a row index nothing is synced and the input URL is the key"""
+        mock_upsert.return_value = ["req-1"]
+        updater = MetricsUpdater(CODA_CONFIG, None, mutation_wait=0)
+
+        result = updater.apply([{"input": {"url": "https://www.instagram.com/reel/ABC/?igsh=x"}, "views": 10}])
+
+        self.assertEqual(result["updated"], 1)
+        rows = mock_upsert.call_args[0][0]
+        self.assertEqual(rows[0][0], {"column": "Link", "value": "https://www.instagram.com/reel/ABC/?igsh=x"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.mirror import ReelsMirror
+
+CODA_CONFIG = {"api_key": "key", "doc_id": "doc", "table_id": "table", "column_name": "Link"}
+
+def coda_row(row_id, shortcode, updated_at, views=0):
+    """Build a row as returned by the Coda rows API"""
+    return {
+        "id": row_id,
+        "createdAt": "2025-03-01T00:00:00.000Z",
+        "updatedAt": updated_at,
+        "values": {"Link": f"https://www.instagram.com/reel/{shortcode}/", "Views": views},
+    }
+
+class TestReelsMirror(unittest.TestCase):
+    """Test suite for the local Reels table mirror"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.mirror = ReelsMirror(os.path.join(self.tmpdir.name, "mirror.sqlite3"))
+
+    def tearDown(self):
+        self.mirror.row_index.conn.close()
+        self.tmpdir.cleanup()
+
+    @patch('src.coda.get_table')
+    @patch('src.coda.list_rows_page')
+    def test_full_then_delta_sync(self, mock_list_rows_page, mock_get_table):
+        """After the first load only the rows Coda reports for the sync token are applied"""
+        mock_list_rows_page.side_effect = [
+            {"items": [coda_row("i-1", "A", "2025-03-01T10:00:00.000Z"),
+                       coda_row("i-2", "B", "2025-03-02T10:00:00.000Z")],
+             "nextSyncToken": "sync-1"},
+            # Rows updated within the same millisecond are all returned
+            {"items": [coda_row("i-1", "A", "2025-03-02T10:00:00.000Z", views=99),
+                       coda_row("i-3", "C", "2025-03-02T10:00:00.000Z")],
+             "nextSyncToken": "sync-2"},
+        ]
+        mock_get_table.return_value = {"rowCount": 3}
+
+        self.assertEqual(self.mirror.sync(CODA_CONFIG), {"full": True, "upserted": 2, "deleted": 0})
+        self.assertEqual(self.mirror.sync(CODA_CONFIG), {"full": False, "upserted": 2, "deleted": 0})
+
+        self.assertEqual(mock_list_rows_page.call_args[0][1]["syncToken"], "sync-1")
+        self.assertEqual(self.mirror.get("https://instagram.com/p/A")["values"]["Views"], 99)
+        self.assertEqual(self.mirror.get_row("i-3")["shortcode"], "C")
+        self.assertEqual(len(self.mirror), 3)
+        # The row index is filled by the same sync
+        self.assertEqual(self.mirror.row_index.lookup("C"), "i-3")
+
+    @patch('src.coda.get_table')
+    @patch('src.coda.iter_rows')
+    @patch('src.coda.list_rows_page')
+    def test_deleted_rows_are_removed(self, mock_list_rows_page, mock_iter_rows, mock_get_table):
+        """A lower remote row count triggers an id-only reconciliation"""
+        mock_list_rows_page.side_effect = [
+            {"items": [coda_row("i-1", "A", "2025-03-01T10:00:00.000Z"),
+                       coda_row("i-2", "B", "2025-03-02T10:00:00.000Z")],
+             "nextSyncToken": "sync-1"},
+            {"items": [], "nextSyncToken": "sync-2"},
+        ]
+        self.mirror.sync(CODA_CONFIG)
+
+        mock_get_table.return_value = {"rowCount": 1}
+        mock_iter_rows.return_value = iter([{"id": "i-1", "values": {}}])
+
+        self.assertEqual(self.mirror.sync(CODA_CONFIG)["deleted"], 1)
+        self.assertEqual(mock_iter_rows.call_args[1]["columns"], [])
+        self.assertEqual(len(self.mirror), 1)
+        self.assertIsNone(self.mirror.get_row("i-2"))
+        self.assertIsNone(self.mirror.row_index.lookup("B"))
+
+    @patch('src.coda.get_table')
+    @patch('src.coda.iter_rows')
+    @patch('src.coda.list_rows_page')
+    def test_ids_are_compared_when_counts_agree(self, mock_list_rows_page, mock_iter_rows, mock_get_table):
+        """A deletion hidden by an unsynced insert is found by the periodic id walk"""
+        mock_list_rows_page.side_effect = [
+            {"items": [coda_row("i-1", "A", "2025-03-01T10:00:00.000Z"),
+                       coda_row("i-2", "B", "2025-03-02T10:00:00.000Z")],
+             "nextSyncToken": "sync-1"},
+            {"items": [], "nextSyncToken": "sync-2"},
+            {"items": [], "nextSyncToken": "sync-3"},
+        ]
+        self.mirror.sync(CODA_CONFIG)
+
+        # B was deleted and C added after the sync read its page: the counts match
+        mock_get_table.return_value = {"rowCount": 2}
+        mock_iter_rows.return_value = iter([{"id": "i-1", "values": {}}, {"id": "i-3", "values": {}}])
+        self.assertEqual(self.mirror.sync(CODA_CONFIG)["deleted"], 0)
+        mock_iter_rows.assert_not_called()
+
+        self.mirror.row_index._set_meta("last_reconcile", "0")
+        self.assertEqual(self.mirror.sync(CODA_CONFIG)["deleted"], 1)
+        self.assertIsNone(self.mirror.get_row("i-2"))
+
+    @patch('src.coda.list_rows_page')
+    def test_full_sync_drops_missing_rows(self, mock_list_rows_page):
+        """Rows a full sync does not return are removed"""
+        mock_list_rows_page.side_effect = [
+            {"items": [coda_row("i-1", "A", "2025-03-01T10:00:00.000Z"),
+                       coda_row("i-2", "B", "2025-03-02T10:00:00.000Z")],
+             "nextSyncToken": "sync-1"},
+            {"items": [coda_row("i-1", "A", "2025-03-01T10:00:00.000Z")], "nextSyncToken": "sync-2"},
+        ]
+        self.mirror.sync(CODA_CONFIG)
+        self.mirror.row_index.conn.execute("DELETE FROM row_index_meta WHERE key = 'sync_token'")
+
+        self.mirror.sync(CODA_CONFIG)
+        self.assertEqual(len(self.mirror), 1)
+        self.assertIsNone(self.mirror.row_index.lookup("B"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from src.batching import CodaBatchWriter
+from src.outbox import LinkOutbox, OutboxDrainer, STATUS_DONE, STATUS_FAILED, STATUS_PENDING
+from src.shortcode_index import ShortcodeIndex
+
+CODA_CONFIG = {"api_key": "key", "doc_id": "doc", "table_id": "table", "column_name": "Link"}
+
+def rate_limited_error(retry_after):
+    """Build the HTTPError Coda's 429 response would raise"""
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return requests.exceptions.HTTPError("429 Too Many Requests", response=response)
+
+def client_error(status_code):
+    """Build the HTTPError a rejected Coda request would raise"""
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.exceptions.HTTPError(f"{status_code} Client Error", response=response)
+
+@patch('src.outbox.monitor', MagicMock())
+class TestOutbox(unittest.TestCase):
+    """Test suite for the durable Coda outbox"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.outbox = LinkOutbox(os.path.join(self.tmpdir.name, "outbox.sqlite3"))
+        self.writer = CodaBatchWriter(CODA_CONFIG, window_ms=5000)
+        self.shortcode_index = ShortcodeIndex(os.path.join(self.tmpdir.name, "outbox.sqlite3"))
+        self.drainer = OutboxDrainer(self.outbox, self.writer, shortcode_index=self.shortcode_index)
+
+    def tearDown(self):
+        self.writer.close()
+        self.outbox.conn.close()
+        self.shortcode_index.conn.close()
+        self.tmpdir.cleanup()
+
+    def test_wal_mode(self):
+        """The outbox database runs in WAL mode"""
+        mode = self.outbox.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    @patch('src.coda.insert_rows')
+    def test_drain_writes_pending_entries_in_one_batch(self, mock_insert_rows):
+        """Pending entries are pushed with a single multi-row insert"""
+        mock_insert_rows.return_value = {"addedRowIds": ["i-1", "i-2"]}
+        ids = [self.outbox.add("https://www.instagram.com/reel/A/", chat_id=1),
+               self.outbox.add("https://www.instagram.com/reel/B/", chat_id=1)]
+
+        self.assertEqual(self.drainer.drain_once(), (2, 2))
+        mock_insert_rows.assert_called_once()
+        self.assertEqual(self.outbox.statuses(ids), {ids[0]: STATUS_DONE, ids[1]: STATUS_DONE})
+        self.assertEqual(self.outbox.pending_count(), 0)
+
+    @patch('src.coda.insert_rows')
+    def test_failed_entries_stay_pending_and_honour_retry_after(self, mock_insert_rows):
+        """A 429 keeps the entry and schedules it after Retry-After"""
+        mock_insert_rows.side_effect = rate_limited_error(30)
+        entry_id = self.outbox.add("https://www.instagram.com/reel/A/")
+
+        self.assertEqual(self.drainer.drain_once(), (1, 0))
+        self.assertEqual(self.outbox.statuses([entry_id]), {entry_id: STATUS_PENDING})
+
+        # Not due again until Retry-After has passed
+        self.assertEqual(self.outbox.claim(), [])
+        row = self.outbox.conn.execute("SELECT attempts, last_error FROM outbox").fetchone()
+        self.assertEqual(row["attempts"], 1)
+        self.assertIn("429", row["last_error"])
+
+    @patch('src.coda.insert_rows')
+    def test_rejected_entries_are_failed(self, mock_insert_rows):
+        """A non-retryable 4xx moves the entry to failed instead of retrying it"""
+        mock_insert_rows.side_effect = client_error(400)
+        entry_id = self.outbox.add("https://www.instagram.com/reel/A/")
+
+        self.assertEqual(self.drainer.drain_once(), (1, 0))
+        self.assertEqual(self.outbox.statuses([entry_id]), {entry_id: STATUS_FAILED})
+        self.assertEqual(self.outbox.pending_count(), 0)
+        self.assertEqual(self.outbox.claim(), [])
+
+    @patch('src.coda.insert_rows')
+    def test_failed_entries_leave_the_shortcode_index(self, mock_insert_rows):
+        """A link Coda refused can be sent again instead of being reported as saved"""
+        mock_insert_rows.side_effect = client_error(400)
+        self.shortcode_index.add("A", "https://www.instagram.com/reel/A/")
+        self.outbox.add("https://www.instagram.com/reel/A/")
+
+        self.drainer.drain_once()
+        self.assertNotIn("A", self.shortcode_index)
+
+    @patch('src.coda.insert_rows')
+    def test_auth_and_not_found_errors_are_retried(self, mock_insert_rows):
+        """A rotated key or a briefly missing table keeps entries pending"""
+        for status_code in (401, 403, 404):
+            mock_insert_rows.side_effect = client_error(status_code)
+            entry_id = self.outbox.add(f"https://www.instagram.com/reel/{status_code}/")
+
+            self.assertEqual(self.drainer.drain_once(), (1, 0))
+            self.assertEqual(self.outbox.statuses([entry_id]), {entry_id: STATUS_PENDING})
+
+    @patch('src.coda.insert_rows')
+    def test_rejected_batch_is_retried_row_by_row(self, mock_insert_rows):
+        """One bad row fails only its own entry; the rest of the batch is saved"""
+        def insert_rows(links, coda_config, timeout=None):
+            if "https://www.instagram.com/reel/BAD/" in links:
+                raise client_error(400)
+            return {"addedRowIds": [f"i-{link}" for link in links]}
+
+        mock_insert_rows.side_effect = insert_rows
+        ids = [self.outbox.add("https://www.instagram.com/reel/A/"),
+               self.outbox.add("https://www.instagram.com/reel/BAD/"),
+               self.outbox.add("https://www.instagram.com/reel/B/")]
+
+        self.assertEqual(self.drainer.drain_once(), (3, 2))
+        self.assertEqual(self.outbox.statuses(ids), {
+            ids[0]: STATUS_DONE, ids[1]: STATUS_FAILED, ids[2]: STATUS_DONE
+        })
+        # One batch insert, then one insert per row
+        self.assertEqual(mock_insert_rows.call_count, 4)
+
+    @patch('src.coda.insert_rows')
+    def test_drain_bounds_the_coda_request(self, mock_insert_rows):
+        """A drain with a time limit caps the timeout of its Coda request"""
+        mock_insert_rows.return_value = {"addedRowIds": ["i-1"]}
+        self.outbox.add("https://www.instagram.com/reel/A/")
+
+        self.assertEqual(self.drainer.drain(max_seconds=2), 1)
+        self.assertLessEqual(mock_insert_rows.call_args.kwargs["timeout"], 2)
+
+    @patch('src.coda.insert_rows')
+    def test_given_up_entries_are_failed_and_forgotten(self, mock_insert_rows):
+        """Entries given up are not retried and their links can be sent again"""
+        self.shortcode_index.add("A", "https://www.instagram.com/reel/A/")
+        entry_id = self.outbox.add("https://www.instagram.com/reel/A/")
+
+        self.drainer.give_up([{"id": entry_id, "link": "https://www.instagram.com/reel/A/"}], "timed out")
+        self.assertEqual(self.outbox.statuses([entry_id]), {entry_id: STATUS_FAILED})
+        self.assertNotIn("A", self.shortcode_index)
+        self.assertEqual(self.drainer.drain_once(), (0, 0))
+        mock_insert_rows.assert_not_called()
+
+    @patch('src.coda.insert_rows')
+    def test_unexpected_errors_are_retried(self, mock_insert_rows):
+        """An error that is not a RequestException still schedules a retry"""
+        mock_insert_rows.side_effect = ValueError("bad response body")
+        entry_id = self.outbox.add("https://www.instagram.com/reel/A/")
+
+        self.assertEqual(self.drainer.drain_once(), (1, 0))
+        self.assertEqual(self.outbox.statuses([entry_id]), {entry_id: STATUS_PENDING})
+        row = self.outbox.conn.execute("SELECT attempts, last_error FROM outbox").fetchone()
+        self.assertEqual((row["attempts"], row["last_error"]), (1, "bad response body"))
+
+    def test_claimed_entries_are_leased(self):
+        """An entry claimed by one drainer is not handed out twice"""
+        self.outbox.add("https://www.instagram.com/reel/A/")
+        self.assertEqual(len(self.outbox.claim()), 1)
+        self.assertEqual(self.outbox.claim(), [])
+
+if __name__ == '__main__':
+    unittest.main()
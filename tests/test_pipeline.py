@@ -0,0 +1,183 @@
+import os
+import queue
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.brightdata import BatchedScrapeTrigger
+from src.pipeline import Stage, Pipeline, build_metrics_pipeline
+
+class TestStage(unittest.TestCase):
+    """Test suite for a single pipeline stage"""
+
+    def test_batches_and_counters(self):
+        """Items are handled in batches and counted"""
+        batches = []
+        stage = Stage("double", lambda items: batches.append(list(items)) or [i * 2 for i in items],
+                      batch_size=3, batch_wait=0.05, queue_size=10)
+        sink = Stage("sink", lambda items: None, queue_size=10)
+        stage.downstream = sink
+        for i in range(7):
+            stage.put(i)
+
+        stage.start()
+        stage.queue.join()
+        stage.stop()
+
+        self.assertEqual(sum(len(b) for b in batches), 7)
+        self.assertTrue(all(len(b) <= 3 for b in batches))
+        self.assertEqual(sorted(sink.queue.queue), [0, 2, 4, 6, 8, 10, 12])
+        stats = stage.stats.snapshot()
+        self.assertEqual(stats["processed"], 7)
+        self.assertEqual(stats["errors"], 0)
+
+    def test_failed_batch_is_counted(self):
+        """A raising handler counts the batch as errors and keeps running"""
+        def handler(items):
+            if 1 in items:
+                raise ValueError("boom")
+            return items
+
+        stage = Stage("flaky", handler)
+        for i in range(3):
+            stage.put(i)
+        stage.start()
+        stage.queue.join()
+        stage.stop()
+
+        stats = stage.stats.snapshot()
+        self.assertEqual((stats["processed"], stats["errors"]), (2, 1))
+
+    def test_full_queue_applies_backpressure(self):
+        """put blocks (and can time out) while a stage is full"""
+        stage = Stage("slow", lambda items: None, queue_size=2)
+        stage.put(1)
+        stage.put(2)
+        with self.assertRaises(queue.Full):
+            stage.put(3, timeout=0.05)
+
+class TestPipeline(unittest.TestCase):
+    """Test suite for chained stages"""
+
+    def test_slow_stage_stalls_upstream(self):
+        """A blocked downstream stage stops the upstream one from draining"""
+        release = threading.Event()
+        seen = []
+
+        def slow(items):
+            release.wait()
+            seen.extend(items)
+
+        first = Stage("first", lambda items: items, queue_size=10)
+        second = Stage("second", slow, queue_size=1)
+        pipeline = Pipeline([first, second])
+        pipeline.start()
+        for i in range(6):
+            pipeline.submit(i)
+
+        # second holds one batch and one queued item; the rest wait upstream
+        threading.Event().wait(0.3)
+        self.assertGreater(first.depth() + first.queue.unfinished_tasks, 0)
+        self.assertLessEqual(second.depth(), 1)
+
+        release.set()
+        pipeline.stop(drain=True, timeout=1)
+        self.assertEqual(sorted(seen), list(range(6)))
+        self.assertEqual(pipeline.stats()["second"]["processed"], 6)
+
+    @patch('src.coda.insert_rows')
+    def test_metrics_pipeline_with_fakes(self, mock_insert):
+        """A link flows through insert, scrape, poll and metrics update"""
+        mock_insert.side_effect = lambda links, cfg: {"addedRowIds": [f"i-{l[-2]}" for l in links]}
+        row_index = MagicMock()
+        trigger = MagicMock(max_batch_size=10)
+        trigger.flush.return_value = ["s_1"]
+        updater = MagicMock()
+        poller = MagicMock()
+
+        pipeline = build_metrics_pipeline({"api_key": "k"}, row_index, trigger, updater, poller, batch_wait=0.05)
+        pipeline.start()
+        pipeline.submit("https://www.instagram.com/reel/A/")
+        pipeline.join()
+
+        row_index.record.assert_called_once_with("https://www.instagram.com/reel/A/", "i-A")
+        trigger.enqueue.assert_called_once_with("https://www.instagram.com/reel/A/")
+        trigger.flush.assert_called_once_with()
+        poller.add.assert_called_once_with("s_1")
+
+        # The poller hands the ready snapshot to the update stage
+        poller.on_ready("s_1", iter([{"url": "https://www.instagram.com/reel/A/", "views": 5}]))
+        pipeline.stop(drain=True, timeout=1)
+        updater.apply.assert_called_once_with([{"url": "https://www.instagram.com/reel/A/", "views": 5}])
+
+    def test_stage_workers_are_configurable(self):
+        """Each stage of the metrics pipeline gets its own thread count"""
+        pipeline = build_metrics_pipeline({"api_key": "k"}, MagicMock(), MagicMock(max_batch_size=10),
+                                          MagicMock(), MagicMock(), insert_workers=2, scrape_workers=3,
+                                          update_workers=4)
+        workers = {stage.name: stage.workers for stage in pipeline.stages}
+        self.assertEqual(workers, {"coda_insert": 2, "scrape_trigger": 3, "snapshot_poll": 1, "metrics_update": 4})
+
+class TestSnapshotStatus(unittest.TestCase):
+    """Test suite for marking finished snapshots"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        self.trigger = BatchedScrapeTrigger("key", path=self.path, max_batch_size=10)
+        self.trigger._record_snapshot("s_1", [{"shortcode": "A", "url": "https://www.instagram.com/reel/A/"}])
+        self.poller = MagicMock()
+        self.pipeline = build_metrics_pipeline({"api_key": "k"}, MagicMock(), self.trigger, MagicMock(),
+                                               self.poller, batch_wait=0.05)
+
+    def tearDown(self):
+        self.trigger.conn.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_consumed_snapshot_is_closed(self):
+        """A snapshot whose records were queued leaves open_snapshots()"""
+        self.assertEqual(self.trigger.open_snapshots(), ["s_1"])
+        self.poller.on_ready("s_1", iter([{"url": "https://www.instagram.com/reel/A/", "views": 5}]))
+        self.assertEqual(self.trigger.open_snapshots(), [])
+
+    def test_broken_download_keeps_snapshot_open(self):
+        """A download failing midway leaves the snapshot for the poller to retry"""
+        def records():
+            yield {"url": "https://www.instagram.com/reel/A/", "views": 5}
+            raise ValueError("stream cut")
+
+        with self.assertRaises(ValueError):
+            self.poller.on_ready("s_1", records())
+        self.assertEqual(self.trigger.open_snapshots(), ["s_1"])
+
+    def test_failed_snapshot_is_scraped_again(self):
+        """A failed snapshot is closed and its reels go back to the scrape stage"""
+        self.poller.on_failed("s_1", "failed")
+        self.assertEqual(self.trigger.open_snapshots(), [])
+        scrape_stage = self.pipeline.stage("scrape_trigger")
+        self.assertEqual(list(scrape_stage.queue.queue), ["https://www.instagram.com/reel/A/"])
+
+    def test_reel_that_keeps_failing_is_given_up(self):
+        """After max_attempts failed snapshots in a row a reel is not scraped again"""
+        pipeline = build_metrics_pipeline({"api_key": "k"}, MagicMock(), self.trigger, MagicMock(),
+                                          self.poller, batch_wait=0.05, max_attempts=2)
+        scrape_stage = pipeline.stage("scrape_trigger")
+        reel = [{"shortcode": "A", "url": "https://www.instagram.com/reel/A/"}]
+
+        self.poller.on_failed("s_1", "failed")
+        self.assertEqual(scrape_stage.depth(), 1)
+        self.trigger._record_snapshot("s_2", reel)
+        self.poller.on_failed("s_2", "failed")
+        self.assertEqual(scrape_stage.depth(), 1)
+        self.assertEqual(self.trigger.failed_attempts("A"), 2)
+
+        # A successful scrape resets the count
+        self.trigger._record_snapshot("s_3", reel)
+        self.trigger.mark_snapshot("s_3", "ready")
+        self.assertEqual(self.trigger.failed_attempts("A"), 0)
+
+if __name__ == '__main__':
+    unittest.main()
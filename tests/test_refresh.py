@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.brightdata import BatchedScrapeTrigger
+from src.refresh import RefreshScheduler, refresh_interval, parse_timestamp, DAY
+
+HOUR = 3600
+NOW = 1_750_000_000.0
+
+def reel(shortcode):
+    return f"https://www.instagram.com/reel/{shortcode}/"
+
+class TestRefreshScheduler(unittest.TestCase):
+    """Test suite for the metrics refresh scheduler"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "refresh.sqlite3")
+        self.trigger = MagicMock()
+        self.trigger.enqueue.return_value = True
+        self.trigger.flush.return_value = ["s_1"]
+        self.scheduler = self.make_scheduler()
+
+    def make_scheduler(self, daily_budget=2):
+        scheduler = RefreshScheduler(self.trigger, self.path, daily_budget=daily_budget,
+                                     base_interval=6 * HOUR, max_interval=30 * DAY)
+        self.addCleanup(scheduler.conn.close)
+        return scheduler
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_interval_decays_with_age(self):
+        """Young reels refresh often, old ones rarely"""
+        self.assertEqual(refresh_interval(0, 6 * HOUR, 30 * DAY), 6 * HOUR)
+        self.assertEqual(refresh_interval(DAY, 6 * HOUR, 30 * DAY), 12 * HOUR)
+        self.assertEqual(refresh_interval(365 * DAY, 6 * HOUR, 30 * DAY), 30 * DAY)
+
+    def test_parse_timestamp(self):
+        """Coda ISO timestamps and epoch numbers are accepted"""
+        self.assertEqual(parse_timestamp("1970-01-02T00:00:00.000Z"), DAY)
+        self.assertEqual(parse_timestamp(5), 5.0)
+        self.assertIsNone(parse_timestamp("not a date"))
+
+    def test_tick_respects_budget_and_prefers_young_reels(self):
+        """Never-scraped reels are due now; the youngest win when the budget is short"""
+        self.scheduler.add(reel("OLD"), posted_at=NOW - 100 * DAY)
+        self.scheduler.add(reel("NEW"), posted_at=NOW - HOUR)
+        self.scheduler.add(reel("MID"), posted_at=NOW - 5 * DAY, last_scraped=NOW - DAY)
+        # MID is not due yet: scraped a day ago, interval at age 4 days is 30 hours
+        self.assertEqual(self.scheduler.due(NOW), 2)
+
+        result = self.scheduler.tick(NOW)
+        self.assertEqual(result, {"due": 2, "queued": 2, "snapshots": ["s_1"]})
+        self.trigger.flush.assert_called_once_with(shortcodes=["OLD", "NEW"])
+        self.assertEqual(self.scheduler.budget_left(NOW), 0)
+
+        # Budget spent for today: nothing more is sent even when due
+        self.scheduler.add(reel("LATE"), posted_at=NOW)
+        self.assertEqual(self.scheduler.tick(NOW + 1)["queued"], 0)
+        self.assertEqual(self.scheduler.due(NOW + 1), 1)
+
+    def test_tick_only_sends_the_reels_it_charged(self):
+        """Reels queued by the pipeline are left for their own batch"""
+        trigger = BatchedScrapeTrigger("bd-key", "dataset", path=self.path, max_batch_size=10)
+        self.addCleanup(trigger.conn.close)
+        self.scheduler.trigger = trigger
+        trigger.enqueue("https://www.instagram.com/reel/PIPE/")
+        self.scheduler.add(reel("A"), posted_at=NOW - HOUR)
+
+        with patch('src.brightdata.trigger_snapshot', return_value="s_1") as mock_trigger:
+            self.assertEqual(self.scheduler.tick(NOW)["snapshots"], ["s_1"])
+        mock_trigger.assert_called_once()
+        self.assertEqual(mock_trigger.call_args[0][0], [reel("A")])
+        self.assertEqual(trigger.waiting(["PIPE", "A"]), {"PIPE"})
+
+    def test_failed_trigger_keeps_unsent_reels_due(self):
+        """Reels a failing flush did not send stay due; sent ones are charged"""
+        self.scheduler.add(reel("A"), posted_at=NOW - HOUR)
+        self.scheduler.add(reel("B"), posted_at=NOW - 2 * HOUR)
+        self.trigger.flush.side_effect = ConnectionError("Bright Data down")
+        self.trigger.waiting.return_value = {"B"}
+
+        with self.assertRaises(ConnectionError):
+            self.scheduler.tick(NOW)
+        self.assertEqual(sorted(self.trigger.waiting.call_args[0][0]), ["A", "B"])
+        self.assertEqual(self.scheduler.due(NOW), 1)
+        self.assertEqual(self.scheduler.budget_left(NOW), 1)
+
+        # The next tick flushes B even though it is already in the trigger's queue
+        self.trigger.flush.side_effect = None
+        self.trigger.enqueue.return_value = False
+        self.assertEqual(self.scheduler.tick(NOW + 1), {"due": 1, "queued": 1, "snapshots": ["s_1"]})
+        self.assertEqual(self.scheduler.due(NOW + 1), 0)
+
+    def test_schedule_survives_restart(self):
+        """Next-due times and budget usage are persisted"""
+        self.scheduler.add(reel("NEW"), posted_at=NOW - HOUR)
+        self.scheduler.tick(NOW)
+
+        restarted = self.make_scheduler()
+        self.assertEqual(len(restarted), 1)
+        self.assertEqual(restarted.due(NOW + HOUR), 0)
+        self.assertEqual(restarted.due(NOW + 7 * HOUR), 1)
+        self.assertEqual(restarted.budget_left(NOW), 1)
+        self.assertFalse(restarted.add(reel("NEW"), posted_at=NOW))
+
+    def test_project_dry_run(self):
+        """The projection counts refreshes over the horizon without triggering"""
+        scheduler = self.make_scheduler(daily_budget=1000)
+        scheduler.add(reel("NEW"), posted_at=NOW)
+
+        projection = scheduler.project(days=1, now=NOW, cost_per_record=0.01)
+        # Due at 0h, then every 6h stretching by age: 0, 6, 13.5 and 22.9 hours
+        self.assertEqual(projection["wanted"], 4)
+        self.assertEqual(projection["due_now"], 1)
+        self.assertAlmostEqual(projection["cost"], 0.04)
+        self.trigger.enqueue.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
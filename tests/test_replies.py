@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import MagicMock
+
+from src.intake import LINK_ACCEPTED, LINK_DUPLICATE, LINK_FAILED
+from src.replies import ProgressMessage, summarize_results, truncate, progress_text
+
+class TestSummarizeResults(unittest.TestCase):
+    """Test suite for the aggregated reply text"""
+
+    def test_single_link_keeps_short_reply(self):
+        results = [("https://www.instagram.com/reel/A/", LINK_ACCEPTED, 1)]
+        self.assertEqual(summarize_results(results), "✅ Link queued! It will appear in the DDF database shortly.")
+        self.assertTrue(summarize_results(results, admitted=False).startswith("⏳ Queued!"))
+
+    def test_links_grouped_by_outcome(self):
+        """One reply lists the queued, duplicate and failed links"""
+        results = [
+            ("https://www.instagram.com/reel/A/", LINK_ACCEPTED, 1),
+            ("https://www.instagram.com/reel/B/", LINK_DUPLICATE, "B"),
+            ("https://www.instagram.com/reel/C/", LINK_ACCEPTED, 2),
+            ("https://www.instagram.com/reel/D/", LINK_FAILED, "Internal error"),
+        ]
+        self.assertEqual(summarize_results(results), (
+            "Processed 4 links:\n"
+            "\n✅ Queued for the DDF database (2):\n"
+            "https://www.instagram.com/reel/A/\n"
+            "https://www.instagram.com/reel/C/\n"
+            "\nℹ️ Already in the DDF database (1):\n"
+            "https://www.instagram.com/reel/B/\n"
+            "\n❌ Failed, please try again later (1):\n"
+            "https://www.instagram.com/reel/D/ (Internal error)"
+        ))
+
+    def test_long_summary_fits_one_message(self):
+        text = truncate("\n".join(f"https://www.instagram.com/reel/{n:05d}/" for n in range(500)))
+        self.assertLessEqual(len(text), 4096)
+        self.assertTrue(text.endswith("more lines"))
+
+    def test_text_without_line_breaks_is_cut_at_the_limit(self):
+        text = truncate("x" * 5000, limit=100)
+        self.assertLessEqual(len(text), 100)
+        self.assertTrue(text.startswith("x" * 60))
+        self.assertTrue(text.endswith("… and 1 more lines"))
+
+class TestProgressMessage(unittest.TestCase):
+    """Test suite for the progress message edited in place"""
+
+    def setUp(self):
+        self.now = [0.0]
+        self.send = MagicMock(return_value="sent")
+        self.edit = MagicMock()
+        self.progress = ProgressMessage(self.send, self.edit, min_interval=3, clock=lambda: self.now[0])
+
+    def test_edits_are_throttled(self):
+        """Updates within the interval are dropped; the final text always goes out"""
+        self.progress.start(progress_text(0, 20))
+        for done, at in ((5, 1.0), (10, 3.5), (15, 4.0)):
+            self.now[0] = at
+            self.progress.update(progress_text(done, 20))
+        self.progress.finish("summary")
+
+        self.send.assert_called_once_with(progress_text(0, 20))
+        self.assertEqual(self.edit.call_args_list, [
+            unittest.mock.call("sent", progress_text(10, 20)),
+            unittest.mock.call("sent", "summary"),
+        ])
+
+    def test_fast_work_sends_nothing(self):
+        """Updates before start_delay send no message; one after it sends the first one"""
+        progress = ProgressMessage(self.send, self.edit, start_delay=2, clock=lambda: self.now[0])
+        self.now[0] = 1.0
+        self.assertFalse(progress.update(progress_text(5, 20)))
+        self.send.assert_not_called()
+
+        self.now[0] = 2.5
+        self.assertTrue(progress.update(progress_text(10, 20)))
+        self.send.assert_called_once_with(progress_text(10, 20))
+        self.edit.assert_not_called()
+
+    def test_failed_start_leaves_it_unstarted(self):
+        """If the progress message cannot be sent, the caller falls back to a plain reply"""
+        self.send.side_effect = RuntimeError("flood")
+        self.progress.start(progress_text(0, 20))
+        self.progress.finish("summary")
+        self.assertFalse(self.progress.started)
+        self.edit.assert_not_called()
+
+    def test_failed_final_edit_falls_back_to_a_reply(self):
+        """When the summary edit fails, the summary is sent as a new reply"""
+        edit_final = MagicMock(side_effect=RuntimeError("message to edit not found"))
+        progress = ProgressMessage(self.send, self.edit, edit_final=edit_final, clock=lambda: self.now[0])
+        progress.start(progress_text(0, 20))
+        progress.finish("summary")
+
+        edit_final.assert_called_once_with("sent", "summary")
+        self.assertEqual(self.send.call_args_list, [
+            unittest.mock.call(progress_text(0, 20)),
+            unittest.mock.call("summary"),
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
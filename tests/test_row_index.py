@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from src.row_index import RowIndex
+
+CODA_CONFIG = {"api_key": "key", "doc_id": "doc", "table_id": "table", "column_name": "Link"}
+
+class TestRowIndex(unittest.TestCase):
+    """Test suite for the shortcode -> Coda row id index"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = RowIndex(os.path.join(self.tmpdir.name, "rows.sqlite3"))
+
+    def tearDown(self):
+        self.index.conn.close()
+        self.tmpdir.cleanup()
+
+    def test_lookup_by_any_link_variant(self):
+        """Rows recorded from an insert are found by shortcode or any link spelling"""
+        self.index.record("https://www.instagram.com/reel/ABC123/", "i-1")
+
+        self.assertEqual(self.index.lookup("https://instagram.com/p/ABC123?hl=en"), "i-1")
+        self.assertEqual(self.index.lookup("ABC123"), "i-1")
+        self.assertIsNone(self.index.lookup("https://www.instagram.com/reel/OTHER/"))
+
+    @patch('src.coda.list_rows_page')
+    def test_sync_follows_pages_then_uses_sync_token(self, mock_list_rows_page):
+        """The first sync pages through the table; the next one sends the sync token"""
+        mock_list_rows_page.side_effect = [
+            {"items": [{"id": "i-1", "values": {"Link": "https://www.instagram.com/reel/A/"}}],
+             "nextPageToken": "page-2"},
+            {"items": [{"id": "i-2", "values": {"Link": "https://www.instagram.com/reel/B/"}}],
+             "nextSyncToken": "sync-1"},
+            {"items": [{"id": "i-3", "values": {"Link": "https://www.instagram.com/reel/C/"}}],
+             "nextSyncToken": "sync-2"},
+        ]
+
+        self.assertEqual(self.index.sync(CODA_CONFIG), 2)
+        self.assertEqual(mock_list_rows_page.call_args_list[1][0][1], {"pageToken": "page-2"})
+
+        self.assertEqual(self.index.find("https://www.instagram.com/reel/C/", CODA_CONFIG), "i-3")
+        self.assertEqual(mock_list_rows_page.call_args_list[2][0][1]["syncToken"], "sync-1")
+        self.assertEqual(len(self.index), 3)
+
+    def test_token_without_row_values_starts_a_full_sync(self):
+        """A sync token stored before row values were kept is dropped on open"""
+        self.index._set_meta("sync_token", "old")
+        reopened = RowIndex(os.path.join(self.tmpdir.name, "rows.sqlite3"))
+        self.assertFalse(reopened.is_synced())
+        reopened.conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+from src.scrape_cache import ScrapeCache, normalize_record
+from src.brightdata import BatchedScrapeTrigger
+
+def record(shortcode, views, **extra):
+    """Build a Bright Data reel record"""
+    return {
+        "url": f"https://www.instagram.com/reel/{shortcode}/",
+        "user_posted": "ddf",
+        "description": "Caption",
+        "video_duration": 12.5,
+        "views": views,
+        "likes": views // 10,
+        "num_comments": 3,
+        **extra
+    }
+
+class TestScrapeCache(unittest.TestCase):
+    """Test suite for the scraped metadata cache"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite3")
+        self.cache = ScrapeCache(self.path, counter_ttl=3600)
+
+    def tearDown(self):
+        self.cache.conn.close()
+        self.tmpdir.cleanup()
+
+    def test_normalize_record(self):
+        """Bright Data keys are split into immutable fields and counters"""
+        immutable, counters = normalize_record(record("A", 100))
+        self.assertEqual(immutable["owner"], "ddf")
+        self.assertEqual(immutable["duration"], 12.5)
+        self.assertEqual(counters, {"views": 100, "likes": 10, "comments": 3})
+
+    def test_counters_expire_but_immutable_fields_do_not(self):
+        """After the TTL only the counters are dropped"""
+        self.assertTrue(self.cache.put(record("A", 100), now=1000))
+
+        self.assertTrue(self.cache.is_fresh("https://instagram.com/p/A", now=1000 + 3599))
+        self.assertEqual(self.cache.get("A", now=1000 + 10)["views"], 100)
+
+        stale = self.cache.get("A", now=1000 + 3600)
+        self.assertEqual(stale["caption"], "Caption")
+        self.assertNotIn("views", stale)
+        self.assertTrue(self.cache.needs_scrape("A", now=1000 + 3600))
+        self.assertTrue(self.cache.needs_scrape("UNKNOWN"))
+
+    def test_rescrape_refreshes_counters(self):
+        """A new record replaces counters and keeps earlier immutable fields"""
+        self.cache.put(record("A", 100), now=1000)
+        self.cache.put({"url": "https://www.instagram.com/reel/A/", "views": 500}, now=9000)
+
+        entry = self.cache.get("A", now=9001)
+        self.assertEqual(entry["views"], 500)
+        self.assertEqual(entry["owner"], "ddf")
+
+    def test_error_records_are_not_cached(self):
+        """Records Bright Data failed to scrape are ignored"""
+        self.assertFalse(self.cache.put(record("A", 0, error="dead_page")))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_scraper_skips_fresh_reels(self):
+        """The trigger client only queues misses and stale entries"""
+        self.cache.put(record("A", 100))
+        trigger = BatchedScrapeTrigger("key", path=self.path, cache=self.cache)
+        self.addCleanup(trigger.conn.close)
+
+        self.assertFalse(trigger.enqueue("https://www.instagram.com/reel/A/"))
+        self.assertTrue(trigger.enqueue("https://www.instagram.com/reel/B/"))
+        self.assertEqual(trigger.pending_count(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import time
+import unittest
+from concurrent.futures import Future
+from unittest.mock import patch, MagicMock
+
+import requests
+from telebot.apihelper import ApiTelegramException
+
+from src.sender import TokenBucket, TelegramSender, retry_after_of
+
+def flood_error(retry_after):
+    """The exception telebot raises for a 429 answer"""
+    result_json = {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                   "parameters": {"retry_after": retry_after}}
+    return ApiTelegramException("sendMessage", MagicMock(), result_json)
+
+class TestTokenBucket(unittest.TestCase):
+    """Test suite for the token bucket"""
+
+    def test_burst_then_rate(self):
+        """A full bucket allows a burst, then refills at its rate"""
+        now = [0.0]
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+        for _ in range(2):
+            self.assertEqual(bucket.wait_time(), 0)
+            bucket.take()
+        self.assertAlmostEqual(bucket.wait_time(), 0.5)
+        now[0] = 0.5
+        self.assertEqual(bucket.wait_time(), 0)
+
+class TestRetryAfter(unittest.TestCase):
+    """Test suite for reading retry_after from errors"""
+
+    def test_telebot_exception(self):
+        self.assertEqual(retry_after_of(flood_error(7)), 7.0)
+
+    def test_http_error(self):
+        response = requests.Response()
+        response.status_code = 429
+        response._content = b'{"ok": false, "parameters": {"retry_after": 3}}'
+        self.assertEqual(retry_after_of(requests.exceptions.HTTPError(response=response)), 3.0)
+
+    def test_other_errors(self):
+        self.assertIsNone(retry_after_of(ValueError("nope")))
+
+@patch('src.sender.monitor', MagicMock())
+class TestTelegramSender(unittest.TestCase):
+    """Test suite for the paced Telegram sender"""
+
+    def test_chat_order_and_pacing(self):
+        """Calls of one chat keep their order and respect the chat rate"""
+        sender = TelegramSender(global_rate=100, global_burst=100, chat_rate=20, chat_burst=1)
+        sent = []
+        start = time.monotonic()
+        futures = [sender.submit(1, lambda n=n: sent.append((n, time.monotonic()))) for n in range(4)]
+        for future in futures:
+            future.result(2)
+        sender.close(2)
+
+        self.assertEqual([n for n, _ in sent], [0, 1, 2, 3])
+        # One immediate call, then three more at 20 per second
+        self.assertGreaterEqual(sent[-1][1] - start, 0.14)
+        self.assertEqual(sender.stats["sent"], 4)
+        self.assertEqual(sender.stats["delayed"], 3)
+
+    def test_slow_chat_does_not_hold_up_others(self):
+        """A chat waiting for its bucket does not delay another chat"""
+        sender = TelegramSender(global_rate=100, global_burst=100, chat_rate=1, chat_burst=1)
+        sender.submit(1, lambda: None).result(2)
+        sender.submit(1, lambda: None)
+        start = time.monotonic()
+        sender.submit(2, lambda: None).result(2)
+        self.assertLess(time.monotonic() - start, 0.5)
+        sender.close(0)
+
+    def test_retry_after_is_honoured(self):
+        """A 429 call is retried after retry_after and before later calls of its chat"""
+        sender = TelegramSender(global_rate=100, global_burst=100, chat_rate=100, chat_burst=10)
+        calls = []
+        failures = [flood_error(0.2)]
+
+        def first():
+            calls.append(("first", time.monotonic()))
+            if failures:
+                raise failures.pop()
+            return "ok"
+
+        start = time.monotonic()
+        first_future = sender.submit(5, first)
+        second_future = sender.submit(5, lambda: calls.append(("second", time.monotonic())))
+
+        self.assertEqual(first_future.result(2), "ok")
+        second_future.result(2)
+        sender.close(2)
+
+        self.assertEqual([name for name, _ in calls], ["first", "first", "second"])
+        self.assertGreaterEqual(calls[1][1] - start, 0.2)
+        self.assertEqual(sender.stats["throttled"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        """Repeated 429s end with the error once the retries are used up"""
+        sender = TelegramSender(max_retries=1)
+        future = sender.submit(5, MagicMock(side_effect=flood_error(0)))
+        with self.assertRaises(ApiTelegramException):
+            future.result(2)
+        sender.close(2)
+        self.assertEqual(sender.stats["failed"], 1)
+
+    def test_failed_call_does_not_block_its_chat(self):
+        """Errors other than 429 fail the call and the chat goes on"""
+        sender = TelegramSender()
+        failed = sender.submit(1, MagicMock(side_effect=RuntimeError("boom")))
+        ok = sender.submit(1, lambda: "ok")
+        with self.assertRaises(RuntimeError):
+            failed.result(2)
+        self.assertEqual(ok.result(2), "ok")
+        sender.close(2)
+
+    def test_calls_of_different_chats_overlap(self):
+        """Slow calls run side by side instead of one round trip after another"""
+        sender = TelegramSender(global_rate=100, global_burst=100, workers=4)
+        start = time.monotonic()
+        futures = [sender.submit(chat_id, time.sleep, 0.2) for chat_id in range(4)]
+        for future in futures:
+            future.result(2)
+        sender.close(2)
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_future_returning_calls_hold_no_thread(self):
+        """A call returning a Future completes with it and frees its thread right away"""
+        sender = TelegramSender(global_rate=100, global_burst=100, workers=1)
+        pending = [Future(), Future()]
+        futures = [sender.submit(chat_id, lambda f=f: f) for chat_id, f in enumerate(pending)]
+
+        # Both calls started on the single worker while neither has finished
+        deadline = time.monotonic() + 2
+        while sender._in_flight < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sender._in_flight, 2)
+
+        pending[1].set_result("second")
+        pending[0].set_exception(RuntimeError("boom"))
+        self.assertEqual(futures[1].result(2), "second")
+        with self.assertRaises(RuntimeError):
+            futures[0].result(2)
+        sender.close(2)
+
+    def test_priority_calls_skip_queued_bulk_calls(self):
+        """Once the global bucket runs dry, a priority reply goes before other chats' bulk replies"""
+        sender = TelegramSender(global_rate=10, global_burst=1, chat_rate=100, chat_burst=10)
+        order = []
+        bulk = [sender.submit(chat_id, order.append, chat_id) for chat_id in range(5)]
+        urgent = sender.submit("admin", order.append, "admin", priority=True)
+        urgent.result(2)
+        for future in bulk:
+            future.result(2)
+        sender.close(2)
+        self.assertLess(order.index("admin"), 3)
+
+    def test_idle_chat_buckets_are_evicted(self):
+        """Buckets of chats with nothing queued are dropped once they refilled"""
+        sender = TelegramSender(chat_rate=100, chat_burst=1, sweep_interval=0)
+        for chat_id in range(3):
+            sender.submit(chat_id, lambda: None).result(2)
+        time.sleep(0.05)
+        sender.submit(99, lambda: None).result(2)
+        sender.close(2)
+        self.assertNotIn(0, sender._chat_buckets)
+        self.assertNotIn(1, sender._chat_buckets)
+
+if __name__ == '__main__':
+    unittest.main()
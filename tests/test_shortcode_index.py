@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.intake import LinkIntake, LINK_ACCEPTED, LINK_DUPLICATE
+from src.outbox import LinkOutbox
+from src.shortcode_index import BloomFilter, ShortcodeIndex
+
+CODA_CONFIG = {"api_key": "key", "doc_id": "doc", "table_id": "table", "column_name": "Link"}
+
+class TestBloomFilter(unittest.TestCase):
+    """Test suite for the Bloom filter"""
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"code{i}")
+        self.assertTrue(all(f"code{i}" in bloom for i in range(1000)))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"code{i}")
+        false_positives = sum(1 for i in range(10000) if f"other{i}" in bloom)
+        self.assertLess(false_positives, 300)
+
+@patch('src.intake.monitor', MagicMock())
+class TestShortcodeIndex(unittest.TestCase):
+    """Test suite for the saved-shortcode index and link intake"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "index.sqlite3")
+        self.index = ShortcodeIndex(self.path)
+
+    def tearDown(self):
+        self.index.conn.close()
+        self.tmpdir.cleanup()
+
+    def test_index_survives_restart(self):
+        """Shortcodes are persisted and reloaded into the filter"""
+        self.assertTrue(self.index.add("ABC123", "https://www.instagram.com/reel/ABC123/"))
+        self.assertFalse(self.index.add("ABC123"))
+
+        reopened = ShortcodeIndex(self.path)
+        self.assertIn("ABC123", reopened)
+        self.assertNotIn("XYZ", reopened)
+        reopened.conn.close()
+
+    @patch('src.coda.iter_rows')
+    def test_seed_from_coda(self, mock_iter_rows):
+        """Existing Coda rows are loaded once"""
+        mock_iter_rows.return_value = iter([
+            {"id": "i-1", "values": {"Link": "https://www.instagram.com/reel/ABC123/"}},
+            {"id": "i-2", "values": {"Link": "https://www.instagram.com/p/DEF456/?hl=en"}},
+            {"id": "i-3", "values": {"Link": ""}},
+        ])
+
+        self.index.ensure_seeded(CODA_CONFIG)
+        self.index.ensure_seeded(CODA_CONFIG)
+
+        mock_iter_rows.assert_called_once()
+        self.assertIn("ABC123", self.index)
+        self.assertIn("DEF456", self.index)
+        self.assertEqual(len(self.index), 2)
+
+    @patch('src.coda.iter_rows')
+    def test_resync_drops_reels_deleted_in_coda(self, mock_iter_rows):
+        """A stale index is re-synced; old shortcodes missing from Coda are removed"""
+        mock_iter_rows.return_value = iter([
+            {"id": "i-1", "values": {"Link": "https://www.instagram.com/reel/ABC123/"}},
+            {"id": "i-2", "values": {"Link": "https://www.instagram.com/reel/DEL999/"}},
+        ])
+        self.index.ensure_seeded(CODA_CONFIG)
+        self.index.conn.execute("UPDATE shortcodes SET added_at = 0")
+        self.index.add("NEW1")  # Accepted just now, not in Coda yet
+
+        mock_iter_rows.return_value = iter([
+            {"id": "i-1", "values": {"Link": "https://www.instagram.com/reel/ABC123/"}},
+        ])
+        self.index.ensure_seeded(CODA_CONFIG)
+        self.assertEqual(mock_iter_rows.call_count, 1)
+
+        self.index.ensure_seeded(CODA_CONFIG, max_age=0)
+        self.assertEqual(mock_iter_rows.call_count, 2)
+        self.assertIn("ABC123", self.index)
+        self.assertIn("NEW1", self.index)
+        self.assertNotIn("DEL999", self.index)
+        self.assertTrue(self.index.add("DEL999"))
+
+    def test_intake_skips_known_reels(self):
+        """Repeated reels are reported as duplicates and never reach the outbox"""
+        outbox = LinkOutbox(self.path)
+        intake = LinkIntake(outbox, self.index)
+
+        results = intake.accept([
+            "https://www.instagram.com/reel/ABC123/",
+            "https://instagram.com/p/ABC123?hl=en",
+        ], chat_id=1, message_id=2)
+
+        self.assertEqual([outcome for _, outcome, _ in results], [LINK_ACCEPTED, LINK_DUPLICATE])
+        self.assertEqual(outbox.pending_count(), 1)
+        outbox.conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
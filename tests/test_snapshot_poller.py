@@ -0,0 +1,121 @@
+import unittest
+from unittest.mock import patch
+
+from src.snapshot_poller import SnapshotPoller
+
+class FakeClock:
+    """Manually advanced clock"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class TestSnapshotPoller(unittest.TestCase):
+    """Test suite for the adaptive snapshot poller"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.ready = {}
+        self.failed = []
+        self.poller = SnapshotPoller(
+            "key",
+            on_ready=lambda sid, records: self.ready.update({sid: list(records)}),
+            on_failed=lambda sid, status: self.failed.append(sid),
+            workers=2, min_interval=5, max_interval=60, initial_estimate=100, clock=self.clock
+        )
+
+    def tearDown(self):
+        self.poller.stop()
+
+    @patch('src.brightdata.iter_snapshot_records')
+    @patch('src.brightdata.get_snapshot_progress')
+    def test_first_check_waits_for_estimate(self, mock_progress, mock_download):
+        """Nothing is polled before 80% of the expected completion time"""
+        mock_progress.return_value = "ready"
+        mock_download.return_value = iter([{"url": "u"}])
+        self.poller.add("s_1")
+
+        self.assertEqual(self.poller.poll_once(), 0)
+        mock_progress.assert_not_called()
+
+        self.clock.now += 80
+        self.assertEqual(self.poller.poll_once(), 1)
+        self.assertEqual(self.ready, {"s_1": [{"url": "u"}]})
+        self.assertEqual(self.poller.pending_count(), 0)
+        # 0.3 * 80 + 0.7 * 100
+        self.assertAlmostEqual(self.poller.estimate, 94)
+
+    @patch('src.brightdata.iter_snapshot_records')
+    @patch('src.brightdata.get_snapshot_progress')
+    def test_overdue_snapshot_backs_off(self, mock_progress, mock_download):
+        """Once past the estimate the interval grows up to max_interval"""
+        mock_progress.return_value = "running"
+        self.poller.add("s_1")
+
+        delays = []
+        for _ in range(8):
+            self.clock.now = self.poller.next_due()
+            self.poller.poll_once()
+            delays.append(self.poller.next_due() - self.clock.now)
+
+        # First recheck waits out the remaining estimate, then grows geometrically
+        self.assertAlmostEqual(delays[0], 20)
+        self.assertAlmostEqual(delays[1], 7.5)
+        self.assertAlmostEqual(delays[2], 11.25)
+        self.assertEqual(delays[-1], 60)
+        mock_download.assert_not_called()
+
+    @patch('src.brightdata.iter_snapshot_records')
+    @patch('src.brightdata.get_snapshot_progress')
+    def test_many_snapshots_checked_in_one_pass(self, mock_progress, mock_download):
+        """Due snapshots are checked together and failures are reported"""
+        mock_progress.side_effect = lambda sid, key: {"s_1": "ready", "s_2": "failed", "s_3": "running"}[sid]
+        mock_download.return_value = iter([])
+        for sid in ("s_1", "s_2", "s_3"):
+            self.poller.add(sid)
+
+        self.clock.now += 80
+        self.assertEqual(self.poller.poll_once(), 2)
+        self.assertEqual(list(self.ready), ["s_1"])
+        self.assertEqual(self.failed, ["s_2"])
+        self.assertEqual(self.poller.pending_count(), 1)
+
+    @patch('src.brightdata.iter_snapshot_records')
+    @patch('src.brightdata.get_snapshot_progress')
+    def test_handler_error_fails_the_snapshot(self, mock_progress, mock_download):
+        """An unexpected error from on_ready fails the snapshot instead of leaving it stuck"""
+        mock_progress.return_value = "ready"
+        mock_download.return_value = iter([{"url": "u"}])
+
+        def broken(sid, records):
+            raise RuntimeError("database is locked")
+
+        self.poller.on_ready = broken
+        self.poller.add("s_1")
+        self.clock.now += 100
+        self.assertEqual(self.poller.poll_once(), 1)
+        self.assertEqual(self.poller.pending_count(), 0)
+        self.assertEqual(self.failed, ["s_1"])
+
+    @patch('src.brightdata.iter_snapshot_records')
+    @patch('src.brightdata.get_snapshot_progress')
+    def test_malformed_snapshot_fails_after_max_parse_errors(self, mock_progress, mock_download):
+        """A snapshot that never parses is retried a few times, then failed"""
+        mock_progress.return_value = "ready"
+        mock_download.side_effect = ValueError("Expecting value: line 1 column 1")
+        self.poller.max_parse_errors = 3
+        self.poller.add("s_1")
+
+        finished = []
+        for _ in range(3):
+            self.clock.now = self.poller.next_due()
+            finished.append(self.poller.poll_once())
+
+        self.assertEqual(finished, [0, 0, 1])
+        self.assertEqual(self.poller.pending_count(), 0)
+        self.assertEqual(self.failed, ["s_1"])
+
+if __name__ == '__main__':
+    unittest.main()
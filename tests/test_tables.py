@@ -5,49 +5,40 @@ import requests
 import json
 from dotenv import load_dotenv
 
+from src import coda
+
 def test_connection(doc_id):
     """Test connection to a Coda document"""
     CODA_API_KEY = os.getenv("CODA_API_KEY", "3e92f721-91d1-485e-aab9-b7d50e4fa4da")
     
     print(f"Testing connection to Coda document {doc_id}...")
     
-    # Test connection by getting the list of tables in the document
-    url = f"https://coda.io/apis/v1/docs/{doc_id}/tables"
-    headers = {
-        "Authorization": f"Bearer {CODA_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
     try:
-        response = requests.get(url, headers=headers)
-        
-        # Check if request was successful
-        if response.status_code == 200:
-            tables = response.json()
-            print(f"✅ Successfully connected to Coda document!")
-            print(f"Document contains {len(tables.get('items', []))} tables:")
+        # Stream tables and columns page by page instead of reading one page
+        table_count = 0
+        for table in coda.iter_tables(doc_id, CODA_API_KEY):
+            table_count += 1
+            print(f"  - Table: '{table.get('name')}' (ID: {table.get('id')})")
             
-            for table in tables.get('items', []):
-                print(f"  - Table: '{table.get('name')}' (ID: {table.get('id')})")
-                
-                # For each table, get the columns
-                columns_url = f"https://coda.io/apis/v1/docs/{doc_id}/tables/{table.get('id')}/columns"
-                columns_response = requests.get(columns_url, headers=headers)
-                
-                if columns_response.status_code == 200:
-                    columns = columns_response.json()
-                    print(f"    Columns: {len(columns.get('items', []))}")
-                    for column in columns.get('items', []):
-                        print(f"      * {column.get('name')} (ID: {column.get('id')})")
-                else:
-                    print(f"    ❌ Failed to get columns. Status code: {columns_response.status_code}")
+            # For each table, get the columns
+            try:
+                columns = list(coda.iter_columns(doc_id, table.get('id'), CODA_API_KEY))
+            except requests.exceptions.HTTPError as e:
+                print(f"    ❌ Failed to get columns. Status code: {e.response.status_code}")
+                continue
             
-            return True
-        else:
-            print(f"❌ Failed to connect to Coda API. Status code: {response.status_code}")
-            print(f"Response: {response.text}")
-            return False
+            print(f"    Columns: {len(columns)}")
+            for column in columns:
+                print(f"      * {column.get('name')} (ID: {column.get('id')})")
+        
+        print(f"✅ Successfully connected to Coda document!")
+        print(f"Document contains {table_count} tables")
+        return True
             
+    except requests.exceptions.HTTPError as e:
+        print(f"❌ Failed to connect to Coda API. Status code: {e.response.status_code}")
+        print(f"Response: {e.response.text}")
+        return False
     except Exception as e:
         print(f"❌ Error connecting to Coda API: {str(e)}")
         return False
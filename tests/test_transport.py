@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src import transport
+
+class TestTransport(unittest.TestCase):
+    """Test suite for the shared HTTP transport"""
+
+    def tearDown(self):
+        transport.reset_session()
+
+    def test_session_is_shared(self):
+        """The same pooled session is returned on every call"""
+        first = transport.get_session()
+        second = transport.get_session()
+        self.assertIs(first, second)
+
+        adapter = first.get_adapter("https://coda.io/apis/v1/docs")
+        self.assertEqual(adapter._pool_maxsize, transport.POOL_MAXSIZE)
+
+    def test_default_timeout_applied(self):
+        """Requests without an explicit timeout get the configured default"""
+        session = transport.get_session()
+        with patch.object(session, "request", return_value=MagicMock()) as mock_request:
+            transport.post("https://coda.io/apis/v1/docs", json={})
+
+        kwargs = mock_request.call_args[1]
+        self.assertEqual(kwargs["timeout"], transport.default_timeout())
+
+    def test_explicit_timeout_kept(self):
+        """A caller-provided timeout is not overridden"""
+        session = transport.get_session()
+        with patch.object(session, "request", return_value=MagicMock()) as mock_request:
+            transport.get("https://api.telegram.org/", timeout=1)
+
+        self.assertEqual(mock_request.call_args[1]["timeout"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
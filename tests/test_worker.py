@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from src.worker import Worker, parse_args
+
+CODA_CONFIG = {"api_key": "key", "doc_id": "doc", "table_id": "table", "column_name": "Link"}
+
+class TestWorker(unittest.TestCase):
+    """Test suite for the background worker entry point"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmpdir.name, "worker.sqlite3")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_flags(self):
+        """Concurrency and batch sizes are tunable from the command line"""
+        args = parse_args(["--db", self.db, "--coda-batch-size", "7", "--poll-workers", "2", "--no-refresh"])
+        self.assertEqual(args.coda_batch_size, 7)
+        self.assertEqual(args.poll_workers, 2)
+        self.assertTrue(args.no_refresh)
+
+    def test_stage_worker_flags(self):
+        """Per-stage thread counts reach the pipeline"""
+        args = parse_args(["--db", self.db, "--no-refresh", "--insert-workers", "2",
+                           "--scrape-workers", "3", "--update-workers", "4"])
+        worker = Worker(args, CODA_CONFIG, bright_data_api_key="bd-key")
+        workers = {stage.name: stage.workers for stage in worker.pipeline.stages}
+        self.assertEqual(workers["coda_insert"], 2)
+        self.assertEqual(workers["scrape_trigger"], 3)
+        self.assertEqual(workers["metrics_update"], 4)
+        worker.poller.stop()
+
+    def test_drain_only_without_bright_data_key(self):
+        """Without a Bright Data key only the outbox drainer runs"""
+        worker = Worker(parse_args(["--db", self.db]), CODA_CONFIG, bright_data_api_key="")
+        self.assertIsNone(worker.pipeline)
+        self.assertIsNone(worker.drainer.on_done)
+
+    @patch('src.outbox.monitor')
+    @patch('src.coda.insert_rows')
+    def test_saved_links_enter_the_scrape_stage_and_shutdown_drains(self, mock_insert, mock_monitor):
+        """Links written by the drainer are queued for scraping; stop() lets them finish"""
+        mock_insert.return_value = {"addedRowIds": ["i-1"]}
+        args = parse_args(["--db", self.db, "--no-refresh", "--coda-window-ms", "10"])
+        worker = Worker(args, CODA_CONFIG, bright_data_api_key="bd-key")
+        worker.outbox.add("https://www.instagram.com/reel/A/")
+
+        scrape_stage = worker.pipeline.stage("scrape_trigger")
+        scraped = []
+        scrape_stage.handler = lambda links: scraped.extend(links)
+
+        worker.start()
+        worker.drainer.drain()
+        worker.stop(timeout=2)
+
+        self.assertEqual(scraped, ["https://www.instagram.com/reel/A/"])
+        self.assertEqual(worker.outbox.pending_count(), 0)
+        self.assertEqual(worker.stats()["pipeline"]["scrape_trigger"]["processed"], 1)
+
+    def test_refresh_snapshots_are_polled(self):
+        """Snapshots triggered by a refresh tick are handed to the poller"""
+        worker = Worker(parse_args(["--db", self.db]), CODA_CONFIG, bright_data_api_key="bd-key")
+        worker.mirror = MagicMock()
+        worker.refresh = MagicMock()
+        worker.refresh.tick.return_value = {"due": 2, "queued": 2, "snapshots": ["s_1", "s_2"]}
+
+        worker.refresh_once()
+
+        worker.mirror.sync.assert_called_once_with(CODA_CONFIG)
+        worker.mirror.rows.assert_called_once()
+        self.assertEqual(worker.poller.pending_count(), 2)
+        worker.poller.stop()
+
+    @patch('src.brightdata.trigger_snapshot')
+    def test_partial_scrape_batches_go_out_after_max_wait(self, mock_trigger):
+        """The worker's periodic flush sends a partial batch once it waited long enough"""
+        mock_trigger.return_value = "s_1"
+        args = parse_args(["--db", self.db, "--no-refresh", "--scrape-max-wait", "60"])
+        worker = Worker(args, CODA_CONFIG, bright_data_api_key="bd-key")
+        worker.trigger.enqueue("https://www.instagram.com/reel/A/")
+
+        self.assertEqual(worker.flush_scrapes(), [])
+        worker.trigger.max_wait = 0
+        self.assertEqual(worker.flush_scrapes(), ["s_1"])
+        self.assertEqual(worker.poller.pending_count(), 1)
+        worker.poller.stop()
+
+    @patch('src.brightdata.BRIGHT_DATA_WEBHOOK_URL', "https://bot.example/api/brightdata")
+    def test_delivered_snapshots_are_not_polled(self):
+        """With webhook delivery the pipeline stops after the scrape trigger"""
+        worker = Worker(parse_args(["--db", self.db, "--no-refresh"]), CODA_CONFIG, bright_data_api_key="bd-key")
+        self.assertIsNone(worker.poller)
+        self.assertEqual(list(worker.pipeline.stats()), ["coda_insert", "scrape_trigger"])
+        self.assertNotIn("snapshots_in_flight", worker.stats())
+
+if __name__ == '__main__':
+    unittest.main()